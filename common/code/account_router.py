@@ -0,0 +1,136 @@
+# account_router.py
+'''
+Routes alerts to Bluesky accounts.
+
+An accounts file maps each alert's host or site_key to an account:
+
+    accounts:
+      district_north:
+        handle: north-alerts.bsky.social
+        password_env: NORTH_BLUESKY_PASSWORD     # or `password: ...`
+        pds_url: https://bsky.social
+      statewide:
+        handle: statewide-alerts.bsky.social
+        password_env: STATEWIDE_BLUESKY_PASSWORD
+    routes:                                      # first match wins; patterns are fnmatch globs
+      - host: north-*
+        account: district_north
+      - site_key: "1020*"
+        account: district_north
+    default: statewide                           # alerts no route matches (optional)
+
+Each account gets its own BlueskyPoster, so its own login session, connection pool and rate
+limit budget. Posters are created when an account first posts. After idle_seconds without a
+post, a poster's connection pool is closed, but the poster is kept: its login session and rate
+limiter state (the PDS's remaining budget, any backoff) still apply when the account posts again.
+'''
+
+__all__ = ["AccountRouter"]
+
+import asyncio
+import os
+import time
+from fnmatch import fnmatchcase
+from typing import Dict, List, Optional
+
+import yaml
+
+DEFAULT_PDS_URL = "https://bsky.social"
+
+# Alert attributes a route can match on.
+ROUTE_KEYS = ('host', 'site_key')
+
+class AccountRouter:
+    """
+    Picks the account for each alert and keeps one BlueskyPoster per account.
+
+    Attributes:
+        accounts (dict): {name: {'handle', 'password', 'pds_url'}}.
+        routes (list): [{'host' or 'site_key': pattern, 'account': name}], checked in order.
+        default (str or None): Account for alerts no route matches.
+        idle_seconds (float): Posters unused this long have their connections closed by evict_idle().
+        connection_limit (int): Connection pool size of each poster.
+    """
+    def __init__(self, accounts: Dict, routes: Optional[List] = None, default=None, idle_seconds=900, connection_limit=4):
+        self.accounts = accounts
+        self.routes = routes or []
+        self.default = default
+        self.idle_seconds = idle_seconds
+        self.connection_limit = connection_limit
+        self.posters = {}
+
+        for route in self.routes:
+            if route.get('account') not in accounts:
+                raise ValueError(f"Route {route} names an unknown account")
+            if not any(key in route for key in ROUTE_KEYS):
+                raise ValueError(f"Route {route} needs one of: {', '.join(ROUTE_KEYS)}")
+        if default is not None and default not in accounts:
+            raise ValueError(f"Default account '{default}' is not defined")
+
+    @classmethod
+    def from_file(cls, path, **kwargs):
+        """
+        Loads an accounts file (see the module docstring).
+
+        Raises:
+            ValueError: An account lacks a handle or password, or a route names an unknown account.
+        """
+        with open(path, 'r') as f:
+            data = yaml.safe_load(f) or {}
+
+        accounts = {}
+        for name, account in (data.get('accounts') or {}).items():
+            password = account.get('password')
+            if password is None and account.get('password_env'):
+                password = os.getenv(account['password_env'])
+            if not account.get('handle') or not password:
+                raise ValueError(f"Account '{name}' needs a handle and a password (or password_env)")
+            accounts[name] = {
+                'handle': account['handle'],
+                'password': password,
+                'pds_url': account.get('pds_url') or DEFAULT_PDS_URL,
+            }
+        return cls(accounts, data.get('routes'), data.get('default'), **kwargs)
+
+    def account_for(self, alert_json) -> Optional[str]:
+        """Returns the name of the account an alert posts through, or None when nothing matches."""
+        if alert_json is not None:
+            for route in self.routes:
+                if all(fnmatchcase(str(alert_json.get(key) or ''), str(route[key]))
+                       for key in ROUTE_KEYS if key in route):
+                    return route['account']
+        return self.default
+
+    def poster(self, name):
+        """Returns the account's poster, creating it on first use."""
+        poster = self.posters.get(name)
+        if poster is None:
+            from bluesky_poster import BlueskyPoster
+            account = self.accounts[name]
+            poster = BlueskyPoster(account['pds_url'], account['handle'], account['password'],
+                                   connection_limit=self.connection_limit)
+            self.posters[name] = poster
+        return poster
+
+    def poster_for(self, alert_json):
+        """Returns the poster for an alert, or None when no route or default matches it."""
+        name = self.account_for(alert_json)
+        return None if name is None else self.poster(name)
+
+    async def evict_idle(self, now=None) -> List[str]:
+        """
+        Closes the connection pools of posters that haven't posted for idle_seconds. Returns their account names.
+
+        The posters stay in `posters`, so their rate limiters keep pacing the account.
+        """
+        now = time.monotonic() if now is None else now
+        idle = [name for name, poster in self.posters.items()
+                if poster.http is not None and now - poster.last_used >= self.idle_seconds]
+        for name in idle:
+            await self.posters[name].close()
+        return idle
+
+    async def close(self):
+        """Closes every poster's connection pool."""
+        await asyncio.gather(*[poster.close() for poster in self.posters.values()], return_exceptions=True)
+        self.posters.clear()
@@ -0,0 +1,274 @@
+# alert_archive.py
+'''
+Rolls sent and archived alert files into daily compressed bundles.
+
+Each day is two files in the bundle folder:
+
+    2025-05-30.jsonl.gz    One compressed member (gzip) or frame (zstd) per alert, holding a
+                           JSON line {"name", "alert"}; the concatenation is an ordinary
+                           .jsonl.gz (or .jsonl.zst) that zcat/zstdcat can read.
+    2025-05-30.index       JSON lines {"name", "offset", "length"} locating each alert's member.
+
+Fetching an alert reads its day's index, seeks to the member and decompresses just that member.
+
+Compaction is safe while the daemon runs: only files older than min_age are taken (the daemon
+and create_message finish writing long before), a source file is deleted only after its record
+and index entry are on disk, and a lock file keeps two compaction runs apart. Re-running after
+a crash skips (and deletes) files the index already holds.
+'''
+
+__all__ = ["AlertArchive", "bundle_day"]
+
+import fcntl
+import gzip
+import json
+import os
+import re
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+import yaml
+
+from alert_model import load_alert_yaml
+
+# alert_20250530T041854Z.yaml and the load generator's alert_20250530T041854Z_<run>_<seq>.yaml.
+ALERT_TIMESTAMP = re.compile(r'(\d{8})T\d{6}Z')
+
+CODECS = {
+    'gzip': '.jsonl.gz',
+    'zstd': '.jsonl.zst',
+}
+
+def bundle_day(filename, mtime=None) -> Optional[str]:
+    """
+    Returns the day (YYYY-MM-DD, UTC) whose bundle holds an alert file.
+
+    The timestamp in the file name wins; otherwise the modification time is used (None if not given).
+    """
+    match = ALERT_TIMESTAMP.search(filename)
+    if match:
+        day = match.group(1)
+        return f"{day[:4]}-{day[4:6]}-{day[6:]}"
+    if mtime is None:
+        return None
+    return datetime.fromtimestamp(mtime, timezone.utc).strftime('%Y-%m-%d')
+
+def _compress(codec, data):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdCompressor().compress(data)
+    return gzip.compress(data, mtime=0)
+
+def _decompress(codec, data):
+    if codec == 'zstd':
+        import zstandard
+        return zstandard.ZstdDecompressor().decompress(data)
+    return gzip.decompress(data)
+
+class AlertArchive:
+    """
+    A folder of daily alert bundles.
+
+    Attributes:
+        folder (str): Where the bundles and indexes live.
+        codec (str): 'gzip' (default) or 'zstd' (needs the zstandard package) for new records.
+            Reads use whichever bundle exists for the day.
+    """
+    def __init__(self, folder, codec='gzip'):
+        if codec not in CODECS:
+            raise ValueError(f"Unknown codec '{codec}'; use one of {', '.join(CODECS)}")
+        self.folder = folder
+        self.codec = codec
+        self._indexes = {}
+
+    def _bundle_path(self, day, codec):
+        return os.path.join(self.folder, day + CODECS[codec])
+
+    def _index_path(self, day):
+        return os.path.join(self.folder, day + '.index')
+
+    def _day_codec(self, day):
+        """Returns the codec of an existing bundle for the day (or the default for a new one)."""
+        for codec in CODECS:
+            if os.path.exists(self._bundle_path(day, codec)):
+                return codec
+        return self.codec
+
+    def index(self, day) -> Dict:
+        """Returns {name: (offset, length)} for a day's bundle (empty if there is none)."""
+        entries = self._indexes.get(day)
+        if entries is not None:
+            return entries
+        entries = {}
+        try:
+            with open(self._index_path(day), 'r') as f:
+                for line in f:
+                    try:
+                        entry = json.loads(line)
+                    except ValueError:
+                        continue  # A torn last line from a crash; its record was never confirmed.
+                    entries[entry['name']] = (entry['offset'], entry['length'])
+        except FileNotFoundError:
+            pass
+        self._indexes[day] = entries
+        return entries
+
+    def days(self):
+        """Returns the days that have bundles, oldest first."""
+        if not os.path.isdir(self.folder):
+            return []
+        return sorted(name[:-len('.index')] for name in os.listdir(self.folder) if name.endswith('.index'))
+
+    def get(self, name, day=None) -> Optional[Dict]:
+        """
+        Returns an archived alert by file name, or None.
+
+        The day comes from the timestamp in the name when there is one; otherwise every day's
+        index is searched.
+        """
+        day = day or bundle_day(name)
+        for candidate in ([day] if day else self.days()):
+            location = self.index(candidate).get(name)
+            if location is None:
+                continue
+            offset, length = location
+            codec = self._day_codec(candidate)
+            with open(self._bundle_path(candidate, codec), 'rb') as f:
+                f.seek(offset)
+                record = json.loads(_decompress(codec, f.read(length)))
+            return record['alert']
+        return None
+
+    def iter_records(self, day=None) -> Iterator[Dict]:
+        """Yields the {"name", "alert"} records of one day, or of every day."""
+        for candidate in ([day] if day else self.days()):
+            codec = self._day_codec(candidate)
+            with open(self._bundle_path(candidate, codec), 'rb') as f:
+                for name, (offset, length) in sorted(self.index(candidate).items(), key=lambda item: item[1][0]):
+                    f.seek(offset)
+                    yield json.loads(_decompress(codec, f.read(length)))
+
+    def compact(self, source_folder, min_age=300, pattern='alert_', now=None):
+        """
+        Moves the alert files of source_folder into bundles.
+
+        Args:
+            source_folder: A folder of YAML alert files (e.g. inbox/sent).
+            min_age: Only files not modified for this many seconds are taken.
+            pattern: Only files whose names start with this are taken.
+            now: Current time, for min_age (default time.time()).
+
+        Returns:
+            The number of files moved into bundles.
+        """
+        now = time.time() if now is None else now
+        os.makedirs(self.folder, exist_ok=True)
+
+        with open(os.path.join(self.folder, '.lock'), 'w') as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            self._indexes.clear()
+
+            by_day = {}
+            with os.scandir(source_folder) as entries:
+                for entry in entries:
+                    if not entry.name.startswith(pattern) or not entry.is_file():
+                        continue
+                    mtime = entry.stat().st_mtime
+                    if now - mtime < min_age:
+                        continue
+                    by_day.setdefault(bundle_day(entry.name, mtime), []).append(entry.path)
+
+            moved = 0
+            for day, paths in sorted(by_day.items()):
+                moved += self._compact_day(day, sorted(paths))
+            return moved
+
+    def _compact_day(self, day, paths):
+        index = self.index(day)
+        codec = self._day_codec(day)
+        done = []
+        entries = []
+
+        with open(self._bundle_path(day, codec), 'ab') as bundle:
+            offset = bundle.tell()
+            for path in paths:
+                name = os.path.basename(path)
+                if name in index:
+                    done.append(path)  # Bundled by a run that stopped before deleting it.
+                    continue
+                try:
+                    with open(path, 'r') as f:
+                        alert_json = load_alert_yaml(f)
+                except (OSError, yaml.YAMLError) as e:
+                    print(f"Skipping '{path}': {e}")
+                    continue
+                record = json.dumps({'name': name, 'alert': alert_json}, default=str, ensure_ascii=False) + '\n'
+                member = _compress(codec, record.encode('UTF-8'))
+                bundle.write(member)
+                entries.append({'name': name, 'offset': offset, 'length': len(member)})
+                offset += len(member)
+                done.append(path)
+            bundle.flush()
+            os.fsync(bundle.fileno())
+
+        if entries:
+            with open(self._index_path(day), 'a') as f:
+                for entry in entries:
+                    f.write(json.dumps(entry) + '\n')
+                    index[entry['name']] = (entry['offset'], entry['length'])
+                f.flush()
+                os.fsync(f.fileno())
+
+        for path in done:
+            os.remove(path)
+        return len(done)
+
+def main():
+    """
+    Compacts alert folders into daily bundles, or fetches an alert from them.
+
+        python3 alert_archive.py compact inbox/sent
+        python3 alert_archive.py get alert_20250530T041854Z.yaml --bundles inbox/sent/bundles
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Roll alert files into daily compressed, indexed bundles.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    compact_parser = subparsers.add_parser('compact', help='Move old alert files into bundles')
+    compact_parser.add_argument('folders', nargs='+', help='Folders of alert files (e.g. inbox/sent)')
+    compact_parser.add_argument('--bundles', help='Bundle folder (default: <folder>/bundles for each folder)')
+    compact_parser.add_argument('--min-age', type=float, default=300, help='Only take files older than N seconds (default 300)')
+    compact_parser.add_argument('--codec', choices=sorted(CODECS), default='gzip', help='Compression for new bundles (default gzip)')
+
+    get_parser = subparsers.add_parser('get', help='Print an archived alert as YAML')
+    get_parser.add_argument('name', help='Alert file name')
+    get_parser.add_argument('--bundles', required=True, help='Bundle folder')
+
+    list_parser = subparsers.add_parser('list', help='List bundled alerts')
+    list_parser.add_argument('--bundles', required=True, help='Bundle folder')
+    list_parser.add_argument('--day', help='Only this day (YYYY-MM-DD)')
+
+    args = parser.parse_args()
+
+    if args.command == 'compact':
+        for folder in args.folders:
+            archive = AlertArchive(args.bundles or os.path.join(folder, 'bundles'), codec=args.codec)
+            moved = archive.compact(folder, min_age=args.min_age)
+            print(f"{folder}: {moved} alerts moved into {archive.folder}")
+    elif args.command == 'get':
+        alert_json = AlertArchive(args.bundles).get(args.name)
+        if alert_json is None:
+            print(f"Not found: {args.name}", file=sys.stderr)
+            sys.exit(1)
+        print(yaml.safe_dump(alert_json, sort_keys=False, allow_unicode=True), end='')
+    elif args.command == 'list':
+        archive = AlertArchive(args.bundles)
+        for day in ([args.day] if args.day else archive.days()):
+            for name in archive.index(day):
+                print(f"{day} {name}")
+
+if __name__ == "__main__":
+    main()
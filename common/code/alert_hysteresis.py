@@ -0,0 +1,286 @@
+# alert_hysteresis.py
+'''
+Per-site alert state with hysteresis, between rain reports and alert creation.
+
+A gauge hovering at a threshold would fire, clear and fire again on every report. Instead each
+site has a level (0 = clear, then the configured levels, least severe first), and each level has:
+
+    window       Rain window compared (m15 ... d30, see rain_report.RAIN_WINDOWS).
+    enter        Value at or above which the level is entered.
+    exit         Value below which the level is left (lower than enter: the hysteresis band).
+    enter_after  Seconds the value must stay at or above `enter` before the level is entered (default 0).
+    hold         Least seconds spent in the level before it can be left (default 0).
+
+A report moves a site up to the highest level whose enter threshold it has met for enter_after
+seconds, or, once the current level's hold has passed and its value is below exit, down to the
+highest lower level it still meets the exit threshold of. Only entering a higher level creates an
+alert (and, with notify_clear, returning to clear); stepping down between levels is recorded but
+silent. An update compares against a fixed number of levels, so it is O(1) per report.
+
+State is a small tuple per site, kept in memory and journaled (one JSON line per change, not per
+report) to a file that is replayed on start and compacted when it grows to twice the number of
+sites, like SentCache.
+
+    python3 rain_accumulator.py samples.jsonl --every 300 | python3 alert_hysteresis.py --state inbox/.hysteresis.jsonl
+
+rain_store.py ingest --alerts runs the same state machine over the reports it stores.
+'''
+
+__all__ = ["AlertLevel", "DEFAULT_LEVELS", "Transition", "SiteStateMachine", "load_levels"]
+
+import json
+import os
+from collections import namedtuple
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, List, Optional
+
+from alert_scheduler import SEVERITY_LEVELS
+from rain_report import RAIN_WINDOWS
+
+@dataclass(slots=True)
+class AlertLevel:
+    name: str
+    window: str
+    enter: float
+    exit: float
+    enter_after: float = 0
+    hold: float = 0
+
+# Example levels for accumulations in inches; real deployments load theirs with load_levels().
+DEFAULT_LEVELS = (
+    AlertLevel('advisory', 'h1', enter=0.5, exit=0.3, hold=1800),
+    AlertLevel('warning', 'h1', enter=1.0, exit=0.7, enter_after=300, hold=3600),
+    AlertLevel('emergency', 'm15', enter=1.0, exit=0.6, hold=3600),
+)
+
+# level: index into the levels (0 = clear); since: when it was entered; pending: the highest level
+# whose enter threshold is met but whose enter_after hasn't passed yet; pending_since: ((level,
+# first met), ...) for every higher level whose threshold is met, most severe first, so each
+# level's dwell is timed from when its own threshold was first met.
+SiteState = namedtuple('SiteState', 'level since pending pending_since')
+
+CLEAR = SiteState(0, 0.0, 0, ())
+
+Transition = namedtuple('Transition', 'site_key from_level to_level value t notify')
+
+def load_levels(path) -> List[AlertLevel]:
+    """
+    Loads levels from a YAML file: {"levels": [{name, window, enter, exit, enter_after, hold}, ...]},
+    least severe first. SiteStateMachine checks the windows and thresholds.
+    """
+    import yaml
+
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f) or {}
+    return [AlertLevel(**level) for level in data.get('levels', [])]
+
+class SiteStateMachine:
+    """
+    Tracks the alert level of every site.
+
+    Attributes:
+        levels (list): AlertLevel, least severe first.
+        state_path (str): Journal file (None keeps state in memory only).
+        notify_clear (bool): Whether returning to clear creates an alert.
+    """
+    def __init__(self, levels=DEFAULT_LEVELS, state_path=None, notify_clear=False):
+        for level in levels:
+            if level.window not in RAIN_WINDOWS:
+                raise ValueError(f"Level '{level.name}' has an unknown window '{level.window}'")
+            if level.exit > level.enter:
+                raise ValueError(f"Level '{level.name}' exits above its enter threshold")
+        self.levels = list(levels)
+        self.state_path = state_path
+        self.notify_clear = notify_clear
+        self.states: Dict[str, SiteState] = {}
+        self._lines = 0
+        self._file = None
+        if state_path is not None:
+            self._load()
+            os.makedirs(os.path.dirname(os.path.abspath(state_path)), exist_ok=True)
+            self._file = open(state_path, 'a')
+
+    def _load(self):
+        if not os.path.exists(self.state_path):
+            return
+        with open(self.state_path, 'r') as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    entry = json.loads(line)
+                    level, since, pending, pending_since = entry['s']
+                    if isinstance(pending_since, (int, float)):
+                        # Journals from before per-level dwell times: one start for the pending level.
+                        pending_since = [[pending, pending_since]] if pending else []
+                    state = SiteState(level, since, pending, tuple((int(index), float(start)) for index, start in pending_since))
+                except (ValueError, KeyError, TypeError):
+                    continue  # A torn last line from a crash.
+                if state.level > len(self.levels) or any(index > len(self.levels) for index, _ in state.pending_since):
+                    state = CLEAR  # Saved under a longer level list.
+                self.states[entry['k']] = state
+
+    def _save(self, site_key, state):
+        if state == CLEAR:
+            self.states.pop(site_key, None)
+        else:
+            self.states[site_key] = state
+        if self._file is None:
+            return
+        self._file.write(json.dumps({'k': site_key, 's': list(state)}) + '\n')
+        self._file.flush()
+        self._lines += 1
+        if self._lines > 2 * max(len(self.states), 512):
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the journal with one line per site that isn't clear."""
+        self._file.close()
+        temp_path = self.state_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            for site_key, state in self.states.items():
+                f.write(json.dumps({'k': site_key, 's': list(state)}) + '\n')
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.state_path)
+        self._lines = len(self.states)
+        self._file = open(self.state_path, 'a')
+
+    def level_name(self, level):
+        return 'clear' if level == 0 else self.levels[level - 1].name
+
+    def update(self, site_key, rain: Dict, t: float) -> Optional[Transition]:
+        """
+        Feeds one report's rain mapping for a site.
+
+        Args:
+            site_key: The site.
+            rain: {window: value} (missing windows count as 0).
+            t: Report time, epoch seconds.
+
+        Returns:
+            The Transition when the site changed level, else None.
+        """
+        state = self.states.get(site_key, CLEAR)
+        levels = self.levels
+
+        # Higher levels whose enter threshold the report meets, most severe first.
+        met = [index for index in range(len(levels), state.level, -1)
+               if _value(rain, levels[index - 1].window) >= levels[index - 1].enter]
+        if met:
+            # Each met level keeps the time its threshold was first met; levels no longer met start over.
+            started = dict(state.pending_since)
+            pending_since = tuple((index, started.get(index, t)) for index in met)
+            for index, since in pending_since:
+                if t - since >= levels[index - 1].enter_after:
+                    return self._move(site_key, state, index, rain, t)
+            if pending_since != state.pending_since:
+                self._save(site_key, state._replace(pending=met[0], pending_since=pending_since))
+            return None
+
+        if state.pending_since:
+            state = state._replace(pending=0, pending_since=())
+            self._save(site_key, state)
+
+        if state.level == 0:
+            return None
+        current = levels[state.level - 1]
+        if _value(rain, current.window) >= current.exit or t - state.since < current.hold:
+            return None
+        # Step down to the highest lower level whose band the value is still in.
+        lower = 0
+        for index in range(state.level - 1, 0, -1):
+            if _value(rain, levels[index - 1].window) >= levels[index - 1].exit:
+                lower = index
+                break
+        return self._move(site_key, state, lower, rain, t)
+
+    def _move(self, site_key, state, level, rain, t):
+        self._save(site_key, SiteState(level, t, 0, ()))
+        window = self.levels[max(level, state.level) - 1].window
+        notify = level > state.level or (level == 0 and self.notify_clear)
+        return Transition(site_key, state.level, level, _value(rain, window), t, notify)
+
+    def alert_for(self, transition: Transition, report: Dict) -> Dict:
+        """Returns the alert mapping for a transition that notifies, in the new_message.yaml shape."""
+        name = self.level_name(transition.to_level)
+        window = self.levels[max(transition.to_level, transition.from_level) - 1].window
+        if transition.to_level == 0:
+            message = f"All clear at {transition.site_key}: {window} rain is back to {transition.value:g}."
+            severity = 'routine'
+        else:
+            message = f"Rain {name} at {transition.site_key}: {transition.value:g} in {window}."
+            severity = name if name in SEVERITY_LEVELS else None
+        alert = {
+            'message': message,
+            'created_at': datetime.fromtimestamp(transition.t, timezone.utc).isoformat(),
+            'site_key': transition.site_key,
+            'trigger_type': 'hysteresis',
+            'tags': ['raindata', name],
+            'rain': report.get('rain'),
+        }
+        if severity is not None:
+            alert['severity'] = severity
+        for key in ('site_id', 'sensor_id'):
+            if report.get(key) is not None:
+                alert['host_' + key] = report[key]
+        return alert
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+
+def _value(rain, window) -> float:
+    try:
+        return float(rain.get(window) or 0)
+    except (TypeError, ValueError):
+        return 0.0
+
+def _epoch_seconds(value) -> float:
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    when = datetime.fromisoformat(str(value).strip().replace('Z', '+00:00'))
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+def main():
+    """
+    Reads rain reports (JSON lines, as rain_accumulator.py prints them) and prints the alerts the
+    state machine raises as JSON lines, for a --stream file or the push socket.
+    """
+    import argparse
+    import sys
+
+    parser = argparse.ArgumentParser(description="Turn rain reports into alerts, with per-site hysteresis.")
+    parser.add_argument("files", nargs="*", help="JSON-lines report files (default: stdin)")
+    parser.add_argument("--levels", metavar="PATH", help="YAML file of alert levels (default: the built-in example levels)")
+    parser.add_argument("--state", metavar="PATH", help="State journal, so levels survive restarts")
+    parser.add_argument("--notify-clear", action="store_true", help="Also raise an alert when a site returns to clear")
+    parser.add_argument("--verbose", action="store_true", help="Log every level change to stderr")
+    args = parser.parse_args()
+
+    machine = SiteStateMachine(load_levels(args.levels) if args.levels else DEFAULT_LEVELS,
+                               state_path=args.state, notify_clear=args.notify_clear)
+    streams = [open(path, "r") for path in args.files] if args.files else [sys.stdin]
+    try:
+        for stream in streams:
+            for line in stream:
+                if not line.strip():
+                    continue
+                report = json.loads(line)
+                rain = report.get('rain') or {}
+                transition = machine.update(report['site_key'], rain, _epoch_seconds(report['created_at']))
+                if transition is None:
+                    continue
+                if args.verbose:
+                    print(f"{transition.site_key}: {machine.level_name(transition.from_level)} -> "
+                          f"{machine.level_name(transition.to_level)}", file=sys.stderr)
+                if transition.notify:
+                    print(json.dumps(machine.alert_for(transition, report)), flush=True)
+    finally:
+        machine.close()
+
+if __name__ == "__main__":
+    main()
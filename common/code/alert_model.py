@@ -0,0 +1,236 @@
+# alert_model.py
+'''
+The alert model: a slotted dataclass and the one validator that builds it.
+
+Alerts arrive as YAML/JSON mappings (see scripts/create_message/new_message.yaml) or as
+database rows. validate_alert() checks and normalizes every field once, at the edge, so the
+stages after it read plain attributes:
+
+* created_at becomes an aware UTC datetime. Naive times are taken as UTC, and the placeholders
+  create_message leaves ('', 'now', 'YYYY-MM-DD HH:mm:ss', 0) become the `now` passed in.
+* site_lat/site_long become decimal degrees. "39.39.55", "39:39:55", "39 39 55" and
+  "39°39'55\"N" are read as degrees/minutes/seconds. So is an unquoted 39:39:55 in a file
+  read with load_alert_yaml(); plain yaml.safe_load() would make it the base-60 integer 142795.
+* tags become a tuple of strings without '#' or duplicates; target_channels (or the older
+  target_channel) a tuple of lower-case channel names. Both accept a list or a comma/space
+  separated string.
+
+Attributes the model doesn't name (e.g. a report's `rain` mapping) are kept in `extra`.
+'''
+
+__all__ = ["AlertRecord", "AlertValidationError", "validate_alert", "parse_coordinate", "load_alert_yaml"]
+
+import re
+from dataclasses import dataclass
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+class AlertValidationError(ValueError):
+    """An alert mapping that can't be turned into an AlertRecord."""
+
+@dataclass(slots=True)
+class AlertRecord:
+    message: str
+    created_at: datetime
+    created_by: str = ''
+    host: str = ''
+    site_uuid: Optional[int] = None
+    host_site_id: Optional[int] = None
+    host_sensor_id: Optional[int] = None
+    trigger_type: str = ''
+    target_channels: Tuple[str, ...] = ()
+    site_lat: Optional[float] = None
+    site_long: Optional[float] = None
+    tags: Tuple[str, ...] = ()
+    severity: Optional[str] = None
+    site_key: Optional[str] = None
+    rain: Optional[Dict] = None
+    extra: Optional[Dict] = None
+
+    def get(self, key, default=None):
+        """Mapping-style access to a field or an extra attribute, for code written against raw dicts."""
+        if key in _FIELD_NAMES:
+            value = getattr(self, key)
+            return default if value is None else value
+        return (self.extra or {}).get(key, default)
+
+    def to_dict(self) -> Dict:
+        """Returns the alert as a JSON-ready mapping (ISO 8601 time, lists, unset fields left out)."""
+        data = dict(self.extra or {})
+        for name in _FIELD_NAMES:
+            value = getattr(self, name)
+            if value is None or name == 'extra':
+                continue
+            if isinstance(value, datetime):
+                value = value.isoformat()
+            elif isinstance(value, tuple):
+                value = list(value)
+            data[name] = value
+        return data
+
+_FIELD_NAMES = tuple(AlertRecord.__dataclass_fields__)
+
+# Values of created_at that mean "when the alert was written".
+_TIME_PLACEHOLDERS = {'', 'now', 'yyyy-mm-dd hh:mm:ss', '0'}
+
+_DECIMAL = re.compile(r'^\s*[-+]?\d+(\.\d+)?\s*$')
+_DMS = re.compile(r'''^\s*([-+])?\s*(\d+)(?:[°:\s.]+(\d+))?(?:['′:\s.]+(\d+(?:\.\d+)?))?["″]?\s*([NSEWnsew])?\s*$''')
+_LIST_SPLIT = re.compile(r'[,\s]+')
+# A YAML 1.1 base-60 scalar (39:39:55), which yaml would otherwise load as an int or float.
+_SEXAGESIMAL = re.compile(r'[-+]?\d+:\d+(:\d+)?(\.\d*)?')
+
+_yaml_loader = None
+
+def load_alert_yaml(stream):
+    """
+    Loads an alert from YAML like yaml.safe_load(), except that base-60 scalars stay strings.
+
+    An unquoted 39:39:55 is then the text '39:39:55', which parse_coordinate reads as
+    degrees/minutes/seconds, instead of the integer 142795, which can't be told apart from a
+    plain number. yaml is imported on first use, so paths that only read JSON never load it.
+    """
+    global _yaml_loader
+    import yaml
+
+    if _yaml_loader is None:
+        class AlertLoader(yaml.SafeLoader):
+            pass
+
+        def keep_sexagesimal(construct):
+            def constructor(loader, node):
+                value = loader.construct_scalar(node)
+                return value if _SEXAGESIMAL.fullmatch(value) else construct(loader, node)
+            return constructor
+
+        AlertLoader.add_constructor('tag:yaml.org,2002:int', keep_sexagesimal(yaml.SafeLoader.construct_yaml_int))
+        AlertLoader.add_constructor('tag:yaml.org,2002:float', keep_sexagesimal(yaml.SafeLoader.construct_yaml_float))
+        _yaml_loader = AlertLoader
+    return yaml.load(stream, Loader=_yaml_loader)
+
+def parse_coordinate(value, limit) -> Optional[float]:
+    """
+    Returns a coordinate in decimal degrees, or None when it is missing.
+
+    Args:
+        value: A number in decimal degrees, a decimal string, or degrees/minutes/seconds
+            ("39.39.55", "-105:12:18", "39°39'55\"N"). Read YAML with load_alert_yaml() so an
+            unquoted 39:39:55 arrives as that string.
+        limit: 90 for latitude, 180 for longitude.
+
+    Raises:
+        AlertValidationError: The value can't be read or is out of range.
+    """
+    if value is None or value == '':
+        return None
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        degrees = float(value)
+    elif isinstance(value, str) and _DECIMAL.match(value):
+        degrees = float(value)
+    elif isinstance(value, str):
+        match = _DMS.match(value)
+        if match is None:
+            raise AlertValidationError(f"Unreadable coordinate: {value!r}")
+        sign, d, m, s, hemisphere = match.groups()
+        minutes, seconds = float(m or 0), float(s or 0)
+        if minutes >= 60 or seconds >= 60:
+            raise AlertValidationError(f"Unreadable coordinate: {value!r}")
+        degrees = float(d) + minutes / 60 + seconds / 3600
+        if sign == '-' or (hemisphere and hemisphere.upper() in 'SW'):
+            degrees = -degrees
+    else:
+        raise AlertValidationError(f"Unreadable coordinate: {value!r}")
+
+    if abs(degrees) > limit:
+        raise AlertValidationError(f"Coordinate out of range: {value!r}")
+    return round(degrees, 6)
+
+def _parse_time(value, now) -> datetime:
+    if value is None or (isinstance(value, (str, int)) and str(value).strip().lower() in _TIME_PLACEHOLDERS):
+        value = now if now is not None else datetime.now(timezone.utc)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return datetime.fromtimestamp(value, timezone.utc)
+    if isinstance(value, str):
+        try:
+            value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+        except ValueError:
+            raise AlertValidationError(f"Unreadable created_at: {value!r}") from None
+    if not isinstance(value, datetime):
+        raise AlertValidationError(f"Unreadable created_at: {value!r}")
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+def _parse_int(name, value) -> Optional[int]:
+    if value is None or value == '':
+        return None
+    if isinstance(value, bool):
+        raise AlertValidationError(f"{name} must be an integer, not {value!r}")
+    try:
+        return int(value)
+    except (TypeError, ValueError):
+        raise AlertValidationError(f"{name} must be an integer, not {value!r}") from None
+
+def _parse_list(value, lower=False) -> Tuple[str, ...]:
+    if value is None:
+        return ()
+    items = _LIST_SPLIT.split(value) if isinstance(value, str) else [str(item) for item in value]
+    seen = {}
+    for item in items:
+        item = item.strip().lstrip('#')
+        if lower:
+            item = item.lower()
+        if item:
+            seen.setdefault(item, None)
+    return tuple(seen)
+
+def _parse_text(value) -> str:
+    return '' if value is None else str(value)
+
+def validate_alert(alert_json, now=None) -> AlertRecord:
+    """
+    Checks and normalizes an alert mapping (or passes an AlertRecord through).
+
+    Args:
+        alert_json: The alert attributes.
+        now: Time used for placeholder created_at values (default: the current time). FileAlert
+            passes the file's modification time, so the same file always gets the same time.
+
+    Raises:
+        AlertValidationError: A required field is missing or a field can't be read.
+    """
+    if isinstance(alert_json, AlertRecord):
+        return alert_json
+    if not isinstance(alert_json, dict):
+        raise AlertValidationError(f"An alert must be a mapping of attributes, not {type(alert_json).__name__}")
+
+    message = alert_json.get('message')
+    if not isinstance(message, str) or not message.strip():
+        raise AlertValidationError("An alert needs a non-empty 'message'")
+
+    if isinstance(now, (int, float)):
+        now = datetime.fromtimestamp(now, timezone.utc)
+    channels = alert_json.get('target_channels', alert_json.get('target_channel'))
+    severity = alert_json.get('severity')
+    rain = alert_json.get('rain')
+
+    extra = {key: value for key, value in alert_json.items()
+             if key not in _FIELD_NAMES and key != 'target_channel'}
+
+    return AlertRecord(
+        message=message,
+        created_at=_parse_time(alert_json.get('created_at'), now),
+        created_by=_parse_text(alert_json.get('created_by')),
+        host=_parse_text(alert_json.get('host')),
+        site_uuid=_parse_int('site_uuid', alert_json.get('site_uuid')),
+        host_site_id=_parse_int('host_site_id', alert_json.get('host_site_id')),
+        host_sensor_id=_parse_int('host_sensor_id', alert_json.get('host_sensor_id')),
+        trigger_type=_parse_text(alert_json.get('trigger_type')),
+        target_channels=_parse_list(channels, lower=True),
+        site_lat=parse_coordinate(alert_json.get('site_lat'), 90),
+        site_long=parse_coordinate(alert_json.get('site_long'), 180),
+        tags=_parse_list(alert_json.get('tags')),
+        severity=severity if isinstance(severity, (str, int)) and not isinstance(severity, bool) else None,
+        site_key=alert_json.get('site_key') or None,
+        rain=rain if isinstance(rain, dict) else None,
+        extra=extra or None,
+    )
@@ -0,0 +1,272 @@
+# alert_pipeline.py
+'''
+A staged, bounded pipeline between alert detection and delivery:
+
+    discover -> [parse queue] -> parse workers -> [render queue] -> render workers
+             -> [send queue] -> send workers
+
+Each queue has a size limit. When sending falls behind, the send queue fills, then the render
+and parse queues, and discovery blocks on its next put. Memory stays flat while the PDS is slow,
+and files wait in the inbox instead of in memory.
+
+The send queue is ordered like AlertScheduler: by arrival time + priority * aging_seconds, so
+urgent alerts overtake routine ones that are waiting to be sent.
+
+A source provides discover(), parse(key), build_message(alert_json), mark_sent(key) and
+mark_failed(key); FileAlert is one. The notifier is a Notification, ideally with the async
+methods of BlueskyNotification (prepare_embed_async, send_notification_async,
+send_notifications_async).
+'''
+
+__all__ = ["AlertPipeline"]
+
+import asyncio
+import itertools
+import time
+
+from alert_scheduler import alert_priority
+
+class AlertPipeline:
+    """
+    Runs discover, parse, render and send as separate asyncio stages joined by bounded queues.
+
+    Attributes:
+        parse_workers, render_workers, send_workers (int): Concurrent workers per stage. Parsing
+            runs in threads (file I/O and YAML), rendering and sending on the event loop.
+        parse_queue_size, render_queue_size, send_queue_size (int): Queue limits per stage.
+        batch_size (int): Alerts a send worker posts per request when the notifier supports batches.
+        aging_seconds (float): How long a wait makes up for one severity level in the send queue.
+        poll_interval (float): Seconds between inbox scans.
+        stats_interval (float): Seconds between queue depth log lines (0 disables them).
+        audit (LatencyAudit): Records each alert's discover/parse/render/send times and post URI (optional).
+    """
+    def __init__(self, source, notifier, parse_workers=4, render_workers=2, send_workers=1,
+                 parse_queue_size=64, render_queue_size=64, send_queue_size=64,
+                 batch_size=1, aging_seconds=60, poll_interval=1, stats_interval=10,
+                 tag_rules=None, profiler=None, audit=None):
+        self.source = source
+        self.notifier = notifier
+        self.parse_workers = parse_workers
+        self.render_workers = render_workers
+        self.send_workers = send_workers
+        self.parse_queue_size = parse_queue_size
+        self.render_queue_size = render_queue_size
+        self.send_queue_size = send_queue_size
+        self.batch_size = batch_size
+        self.aging_seconds = aging_seconds
+        self.poll_interval = poll_interval
+        self.stats_interval = stats_interval
+        self.tag_rules = tag_rules
+        self.profiler = profiler
+        self.audit = audit
+
+        # Keys somewhere in the pipeline, so discovery doesn't queue a file twice.
+        self.in_flight = set()
+        # Lifecycle times (UNIX seconds) of the alerts in flight, for the latency audit.
+        self.stamps = {}
+        self.counts = {'discovered': 0, 'parsed': 0, 'sent': 0, 'failed': 0}
+        self._seq = itertools.count()
+        self._stopping = None
+        self._wake = None
+        self.parse_queue = None
+        self.render_queue = None
+        self.send_queue = None
+
+    def depths(self):
+        """Returns the current depth and limit of each stage queue, plus the number of alerts in flight."""
+        depths = {}
+        for name, queue in (('parse', self.parse_queue), ('render', self.render_queue), ('send', self.send_queue)):
+            if queue is not None:
+                depths[name] = (queue.qsize(), queue.maxsize)
+        depths['in_flight'] = len(self.in_flight)
+        return depths
+
+    def format_depths(self):
+        """Returns the queue depths and counters as one line for the daemon's log."""
+        depths = self.depths()
+        stages = ", ".join(f"{name} {depth}/{limit}" for name, value in depths.items()
+                           if name != 'in_flight' for depth, limit in [value])
+        counts = " ".join(f"{name}={count}" for name, count in self.counts.items())
+        return f"Pipeline: {stages}, in flight {depths['in_flight']} ({counts})"
+
+    def stop(self):
+        """Stops discovery; run() returns once the alerts already in the pipeline are sent."""
+        if self._stopping is not None:
+            self._stopping.set()
+            self._wake.set()
+
+    def wake(self):
+        """Runs discovery now instead of at the next poll (e.g. after alerts were pushed to the source)."""
+        if self._wake is not None:
+            self._wake.set()
+
+    async def run(self):
+        """Runs the pipeline until stop() is called (or the task is cancelled)."""
+        self._stopping = asyncio.Event()
+        self._wake = asyncio.Event()
+        self.parse_queue = asyncio.Queue(self.parse_queue_size)
+        self.render_queue = asyncio.Queue(self.render_queue_size)
+        self.send_queue = asyncio.PriorityQueue(self.send_queue_size)
+        if self.profiler is not None:
+            self.profiler.attach_loop()
+
+        workers = (
+            [asyncio.create_task(self._parse_worker(), name=f"parse-{i}") for i in range(self.parse_workers)]
+            + [asyncio.create_task(self._render_worker(), name=f"render-{i}") for i in range(self.render_workers)]
+            + [asyncio.create_task(self._send_worker(), name=f"send-{i}") for i in range(self.send_workers)]
+        )
+        reporter = asyncio.create_task(self._report(), name="pipeline-stats") if self.stats_interval else None
+        try:
+            await self._discover()
+            # Drain what was discovered before the stop.
+            await self.parse_queue.join()
+            await self.render_queue.join()
+            await self.send_queue.join()
+        finally:
+            for task in workers + ([reporter] if reporter else []):
+                task.cancel()
+            await asyncio.gather(*workers, *([reporter] if reporter else []), return_exceptions=True)
+
+    async def _discover(self):
+        while not self._stopping.is_set():
+            try:
+                keys = await asyncio.to_thread(self.source.discover)
+            except Exception as e:
+                print(f"Error discovering alerts: {e}")
+                keys = []
+            for key in keys:
+                if key in self.in_flight:
+                    continue
+                self.in_flight.add(key)
+                self.stamps[key] = {'discovered_at': time.time()}
+                self.counts['discovered'] += 1
+                # Blocks while the parse queue is full: this is where backpressure reaches discovery.
+                await self.parse_queue.put(key)
+                if self._stopping.is_set():
+                    return
+            has_more = getattr(self.source, 'has_more', None)
+            if keys and has_more is not None and has_more():
+                continue  # A paged source with a backlog: fetch the next page without waiting.
+            try:
+                await asyncio.wait_for(self._wake.wait(), self.poll_interval)
+            except asyncio.TimeoutError:
+                pass
+            self._wake.clear()
+
+    async def _parse_worker(self):
+        while True:
+            key = await self.parse_queue.get()
+            try:
+                parsed = await asyncio.to_thread(self.source.parse, key)
+                if parsed is None:
+                    # An empty file, possibly still being written; discovery will see it again.
+                    self._forget(key)
+                    continue
+                alert_json, queued_at = parsed
+                message = self.source.build_message(alert_json)
+                self._stamp(key, 'parsed_at')
+                self.counts['parsed'] += 1
+                await self.render_queue.put((key, alert_json, message, queued_at))
+            except FileNotFoundError:
+                self._forget(key)
+            except Exception as e:
+                print(f"Error parsing alert '{key}': {e}")
+                self._finish(key, False)
+            finally:
+                self.parse_queue.task_done()
+
+    async def _render_worker(self):
+        prepare = getattr(self.notifier, 'prepare_embed_async', None)
+        while True:
+            key, alert_json, message, queued_at = await self.render_queue.get()
+            try:
+                embed = await prepare(alert_json) if prepare is not None else None
+                priority = alert_priority(alert_json, self.tag_rules)
+                deadline = queued_at + priority * self.aging_seconds
+                self._stamp(key, 'rendered_at')
+                await self.send_queue.put((deadline, next(self._seq), key, alert_json, message, embed))
+            except Exception as e:
+                print(f"Error preparing alert '{key}': {e}")
+                self._finish(key, False)
+            finally:
+                self.render_queue.task_done()
+
+    async def _send_worker(self):
+        batching = self.batch_size > 1 and hasattr(self.notifier, 'send_notifications_async')
+        while True:
+            batch = [await self.send_queue.get()]
+            while batching and len(batch) < self.batch_size and not self.send_queue.empty():
+                batch.append(self.send_queue.get_nowait())
+            try:
+                if batching and len(batch) > 1:
+                    await self._send_batch(batch)
+                else:
+                    await self._send_one(batch[0])
+            finally:
+                for _ in batch:
+                    self.send_queue.task_done()
+
+    async def _send_one(self, item):
+        _, _, key, alert_json, message, embed = item
+        try:
+            send = getattr(self.notifier, 'send_notification_async', None)
+            if send is not None:
+                result = await send(message, alert_json, embed=embed, render=False)
+            else:
+                result = await asyncio.to_thread(self.notifier.send_notification, message, alert_json)
+            self._finish(key, True, alert_json, result.get("uri") if isinstance(result, dict) else None)
+        except Exception as e:
+            print(f"Error sending notification for '{key}': {e}")
+            self._finish(key, False, alert_json)
+
+    async def _send_batch(self, batch):
+        try:
+            results = await self.notifier.send_notifications_async(
+                [(message, alert_json, embed) for _, _, _, alert_json, message, embed in batch])
+        except Exception as e:
+            print(f"Error sending batch of {len(batch)} notifications: {e}")
+            results = [{"ok": False, "error": f"{e}"}] * len(batch)
+        for (_, _, key, alert_json, _, _), result in zip(batch, results):
+            if not result["ok"]:
+                print(f"Error sending notification for '{key}': {result['error']}")
+            self._finish(key, result["ok"], alert_json, result.get("uri"))
+
+    def _stamp(self, key, stage):
+        stamps = self.stamps.get(key)
+        if stamps is not None:
+            stamps[stage] = time.time()
+
+    def _forget(self, key):
+        """Lets discovery see a key again without recording an outcome."""
+        self.in_flight.discard(key)
+        self.stamps.pop(key, None)
+
+    def _finish(self, key, ok, alert_json=None, uri=None):
+        """Marks an alert sent or failed at its source and lets discovery see its key again."""
+        stamps = self.stamps.pop(key, {})
+        stamps['sent_at'] = time.time()
+        try:
+            if ok:
+                self.source.mark_sent(key)
+            else:
+                self.source.mark_failed(key)
+        finally:
+            self.in_flight.discard(key)
+            if self.audit is not None:
+                try:
+                    self.audit.record(key, alert_json, stamps, ok, uri)
+                except OSError as e:
+                    print(f"Error writing latency audit for '{key}': {e}")
+            self.counts['sent' if ok else 'failed'] += 1
+            if self.profiler is not None:
+                self.profiler.record_alert()
+                self.profiler.maybe_dump()
+
+    async def _report(self):
+        last = None
+        while True:
+            await asyncio.sleep(self.stats_interval)
+            line = self.format_depths()
+            if line != last:
+                print(line)
+                last = line
@@ -0,0 +1,126 @@
+# alert_scheduler.py
+'''
+Severity-priority scheduling for queued alerts.
+
+Alerts get a priority from their `severity` attribute, or from tag rules when there is none.
+A heap keyed on "virtual deadline" (enqueue time + priority * aging_seconds) hands out
+the next alert: high-severity alerts jump ahead, and every level of priority is worth
+`aging_seconds` of waiting, so routine alerts still drain during a long storm.
+'''
+
+__all__ = ["SEVERITY_LEVELS", "DEFAULT_SEVERITY", "DEFAULT_TAG_RULES", "alert_priority", "AlertScheduler"]
+
+import heapq
+import itertools
+import time
+from typing import Dict, Optional
+
+from alert_model import AlertRecord
+
+# Lower number = more urgent.
+SEVERITY_LEVELS = {
+    'emergency': 0,
+    'warning': 1,
+    'watch': 2,
+    'advisory': 3,
+    'routine': 4,
+}
+SEVERITY_NAMES = {level: name for name, level in SEVERITY_LEVELS.items()}
+DEFAULT_SEVERITY = 'advisory'
+
+# Tag (case-insensitive) -> severity, used when an alert has no `severity` attribute.
+DEFAULT_TAG_RULES = {
+    'flashfloodemergency': 'emergency',
+    'flashflood': 'warning',
+    'flashfloodwarning': 'warning',
+    'flood': 'warning',
+    'floodwatch': 'watch',
+    'hail': 'watch',
+    'raindata': 'routine',
+    '30day': 'routine',
+}
+
+def alert_priority(alert_json, tag_rules: Optional[Dict] = None) -> int:
+    """
+    Returns the priority level of an alert (an AlertRecord or a mapping; 0 is most urgent).
+
+    An explicit `severity` (a name from SEVERITY_LEVELS, or a number) wins. Otherwise the most
+    severe matching tag rule applies, and alerts without either get DEFAULT_SEVERITY.
+    """
+    if not isinstance(alert_json, (dict, AlertRecord)):
+        return SEVERITY_LEVELS[DEFAULT_SEVERITY]
+
+    severity = alert_json.get('severity')
+    if isinstance(severity, int) and not isinstance(severity, bool):
+        return min(max(severity, 0), max(SEVERITY_NAMES))
+    if isinstance(severity, str) and severity.strip().lower() in SEVERITY_LEVELS:
+        return SEVERITY_LEVELS[severity.strip().lower()]
+
+    rules = DEFAULT_TAG_RULES if tag_rules is None else tag_rules
+    tags = alert_json.get('tags') or []
+    if isinstance(tags, str):
+        tags = tags.split(',')
+    levels = [SEVERITY_LEVELS[rules[str(tag).strip().lstrip('#').lower()]]
+              for tag in tags if str(tag).strip().lstrip('#').lower() in rules]
+    return min(levels) if levels else SEVERITY_LEVELS[DEFAULT_SEVERITY]
+
+class AlertScheduler:
+    """
+    A heap-based priority queue for alerts, with aging.
+
+    Attributes:
+        aging_seconds (float): How long a wait makes up for one level of priority.
+    """
+    def __init__(self, aging_seconds=60):
+        self.aging_seconds = aging_seconds
+        self._heap = []
+        self._seq = itertools.count()
+        self._depth = {level: 0 for level in SEVERITY_NAMES}
+        self._popped = {level: 0 for level in SEVERITY_NAMES}
+        self._wait_total = {level: 0.0 for level in SEVERITY_NAMES}
+        self._wait_max = {level: 0.0 for level in SEVERITY_NAMES}
+
+    def __len__(self):
+        return len(self._heap)
+
+    def push(self, item, priority, now=None):
+        """Queues an item at a priority level (see alert_priority)."""
+        now = time.monotonic() if now is None else now
+        deadline = now + priority * self.aging_seconds
+        heapq.heappush(self._heap, (deadline, next(self._seq), priority, now, item))
+        self._depth[priority] = self._depth.get(priority, 0) + 1
+
+    def pop(self, now=None):
+        """Removes and returns the next item; raises IndexError when empty."""
+        _, _, priority, enqueued_at, item = heapq.heappop(self._heap)
+        now = time.monotonic() if now is None else now
+        wait = max(0.0, now - enqueued_at)
+        self._depth[priority] -= 1
+        self._popped[priority] = self._popped.get(priority, 0) + 1
+        self._wait_total[priority] = self._wait_total.get(priority, 0.0) + wait
+        self._wait_max[priority] = max(self._wait_max.get(priority, 0.0), wait)
+        return item
+
+    def depths(self):
+        """Returns the current queue depth per severity name."""
+        return {SEVERITY_NAMES.get(level, str(level)): depth for level, depth in self._depth.items()}
+
+    def stats(self):
+        """Returns depth, popped count, and mean and max wait (seconds) per severity name."""
+        stats = {}
+        for level in sorted(self._depth):
+            popped = self._popped.get(level, 0)
+            stats[SEVERITY_NAMES.get(level, str(level))] = {
+                'depth': self._depth[level],
+                'popped': popped,
+                'mean_wait': self._wait_total.get(level, 0.0) / popped if popped else 0.0,
+                'max_wait': self._wait_max.get(level, 0.0),
+            }
+        return stats
+
+    def format_stats(self):
+        """Returns the stats as one line for the daemon's log."""
+        return "Queue: " + ", ".join(
+            f"{name} depth={s['depth']} sent={s['popped']} wait={s['mean_wait']:.1f}s/max {s['max_wait']:.1f}s"
+            for name, s in self.stats().items() if s['depth'] or s['popped']
+        )
@@ -0,0 +1,291 @@
+# alert_writer.py
+'''
+Atomic, group-committed alert files, for anything that drops alerts into the inbox
+(create_message.py, base-station scripts, the push socket through FileAlert.enqueue).
+
+A reader polling the inbox must never see a half-written file, and an alert acknowledged to its
+producer must survive a crash. Each alert is written to a hidden temporary name
+(.alert_....yaml.tmp, which the inbox scan ignores) and published by renaming it to its
+alert_*.yaml name, so it appears whole or not at all.
+
+Making that durable takes a flush of the file's data before the rename, and of the folder after
+it. Doing both per file caps a writer at a few dozen files a second on most disks. Instead,
+staged files queue up for a committer thread, which publishes everything queued so far as one
+group: one flush of the file system for all of their data, the renames, then one fsync of the
+folder. Writers that wait are released when their group is committed; while one group is being
+flushed, the next one gathers. Hundreds of writes a second then cost a few flushes a second.
+
+Names are alert_<UTC timestamp>_<tag>_<pid>-<random>-<sequence>.yaml: the timestamp keeps the
+inbox's oldest-first order, and the writer token and sequence keep two writers, or two alerts in
+the same second, from ever picking the same name.
+
+An archive folder gets a hard link to each published file instead of a copy (a copy is made
+only when the archive is on another file system).
+
+    writer = AlertWriter('inbox', archive_folder='scripts/create_message/archive')
+    name = writer.write(alert)               # returns once the file is durable
+    writer.write(alert, wait=False)          # returns at once; flush() or close() waits
+    writer.close()
+'''
+
+__all__ = ["AlertWriter", "AlertWriteError"]
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import secrets
+import shutil
+import sys
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, Sequence
+
+import yaml
+
+# Stale temporary files (from a crashed writer) older than this are removed when a writer starts.
+STALE_TEMP_SECONDS = 3600
+
+_libc = None
+
+def _syncfs(fd) -> bool:
+    """Flushes the whole file system holding fd with one syncfs(2) call; False where unavailable."""
+    global _libc
+    if _libc is None:
+        try:
+            _libc = ctypes.CDLL(ctypes.util.find_library('c'), use_errno=True)
+            _libc.syncfs
+        except (OSError, AttributeError, TypeError):
+            _libc = False
+    return bool(_libc) and _libc.syncfs(fd) == 0
+
+class AlertWriteError(OSError):
+    """
+    Some alert files of a write could not be published (the others were).
+
+    Attributes:
+        names (list): Every file name of the write, in order.
+        failed (dict): {file name: error} of the files that were not published.
+    """
+    def __init__(self, names, failed):
+        self.names = names
+        self.failed = failed
+        first = next(iter(failed.values()))
+        super().__init__(f"{len(failed)} of {len(names)} alert files not written: {first}")
+
+def _fsync_folder(path):
+    folder = os.open(path, os.O_RDONLY)
+    try:
+        os.fsync(folder)
+    finally:
+        os.close(folder)
+
+class AlertWriter:
+    """
+    Publishes alert mappings as YAML files in a folder, atomically and in group commits.
+
+    Attributes:
+        folder (str): The inbox the alert files appear in.
+        archive_folder (str): Folder that also gets each file (as a hard link), or None.
+        tag (str): Goes in every file name, to tell producers apart (e.g. 'push', a run ID).
+        prefix (str): File name prefix the inbox scan looks for.
+        max_batch (int): Most files published per group.
+    """
+    def __init__(self, folder, archive_folder=None, tag=None, prefix='alert_', max_batch=512):
+        self.folder = str(folder)
+        self.archive_folder = str(archive_folder) if archive_folder is not None else None
+        self.tag = tag
+        self.prefix = prefix
+        self.max_batch = max_batch
+
+        self._token = f"{os.getpid()}-{secrets.token_hex(2)}"
+        self._seq = 0
+        self._cond = threading.Condition()
+        self._pending = []      # (ticket, temp_path, filename) staged and not yet published
+        self._staged = 0        # Tickets handed out
+        self._committed = 0     # Tickets published (or failed), in order
+        self._errors: Dict[int, tuple] = {}    # ticket -> (file name, error) of files not published
+        self._thread = None
+        self._closed = False
+        self.commits = 0        # Groups committed, for the log and tests.
+
+        os.makedirs(self.folder, exist_ok=True)
+        if self.archive_folder is not None:
+            os.makedirs(self.archive_folder, exist_ok=True)
+        self._remove_stale_temps()
+
+    def _remove_stale_temps(self):
+        cutoff = time.time() - STALE_TEMP_SECONDS
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if entry.name.startswith('.' + self.prefix) and entry.name.endswith('.tmp'):
+                    try:
+                        if entry.stat().st_mtime < cutoff:
+                            os.unlink(entry.path)
+                    except FileNotFoundError:
+                        pass
+
+    def _next_name(self):
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+        tag = f"_{self.tag}" if self.tag else ""
+        self._seq += 1
+        return f"{self.prefix}{stamp}{tag}_{self._token}-{self._seq:06d}.yaml"
+
+    def write(self, alert, wait=True) -> str:
+        """
+        Writes one alert mapping; returns its file name.
+
+        With wait, returns once the file is published and durable, and raises AlertWriteError if it wasn't.
+        """
+        return self.write_many([alert], wait=wait)[0]
+
+    def write_many(self, alerts: Sequence, wait=True) -> List[str]:
+        """
+        Writes alert mappings, published together (or in the same few groups); returns their file names.
+
+        With wait, raises AlertWriteError if any of them were not published; the exception says which.
+        """
+        staged = []
+        for alert in alerts:
+            with self._cond:
+                filename = self._next_name()
+            temp_path = os.path.join(self.folder, '.' + filename + '.tmp')
+            with open(temp_path, 'w') as f:
+                yaml.safe_dump(alert, f, sort_keys=False, allow_unicode=True)
+            staged.append((temp_path, filename))
+
+        with self._cond:
+            if self._closed:
+                for temp_path, _ in staged:
+                    os.unlink(temp_path)
+                raise RuntimeError("AlertWriter is closed")
+            first = self._staged + 1
+            for temp_path, filename in staged:
+                self._staged += 1
+                self._pending.append((self._staged, temp_path, filename))
+            last = self._staged
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._run, name='alert-writer', daemon=True)
+                self._thread.start()
+            self._cond.notify_all()
+            if wait:
+                self._wait_for(last)
+                failed = dict(self._errors.pop(ticket) for ticket in range(first, last + 1) if ticket in self._errors)
+                if failed:
+                    raise AlertWriteError([filename for _, filename in staged], failed)
+        return [filename for _, filename in staged]
+
+    def _wait_for(self, ticket):
+        while self._committed < ticket:
+            self._cond.wait()
+
+    def flush(self):
+        """
+        Waits until everything written so far is published.
+
+        Raises:
+            AlertWriteError: Files written without waiting that were not published (names holds just those).
+        """
+        with self._cond:
+            self._wait_for(self._staged)
+            failed, self._errors = dict(self._errors.values()), {}
+        if failed:
+            raise AlertWriteError(list(failed), failed)
+
+    def _run(self):
+        while True:
+            with self._cond:
+                while not self._pending and not self._closed:
+                    self._cond.wait()
+                if not self._pending:
+                    return
+                batch, self._pending = self._pending[:self.max_batch], self._pending[self.max_batch:]
+            errors = self._commit(batch)
+            with self._cond:
+                for ticket, _, filename in batch:
+                    if ticket in errors:
+                        self._errors[ticket] = (filename, errors[ticket])
+                self._committed = batch[-1][0]
+                self.commits += 1
+                self._cond.notify_all()
+
+    def _commit(self, batch) -> Dict[int, Exception]:
+        """
+        Publishes one group: flush the data, link and rename every file, fsync the folders.
+
+        Returns:
+            {ticket: error} for the files that were not published; their temporary files are
+            removed. A file that was renamed into place counts as published.
+        """
+        errors = {}
+        try:
+            folder = os.open(self.folder, os.O_RDONLY)
+            try:
+                synced = _syncfs(folder)
+            finally:
+                os.close(folder)
+        except OSError:
+            synced = False
+        if not synced:
+            for ticket, temp_path, _ in batch:
+                try:
+                    with open(temp_path, 'rb+') as f:
+                        os.fsync(f.fileno())
+                except OSError as e:
+                    errors[ticket] = e
+
+        for ticket, temp_path, filename in batch:
+            if ticket in errors:
+                continue
+            if self.archive_folder is not None:
+                self._archive(temp_path, filename)
+            try:
+                os.rename(temp_path, os.path.join(self.folder, filename))
+            except OSError as e:
+                errors[ticket] = e
+                if self.archive_folder is not None:
+                    try:
+                        os.unlink(os.path.join(self.archive_folder, filename))
+                    except OSError:
+                        pass
+
+        for ticket, temp_path, _ in batch:
+            if ticket in errors:
+                try:
+                    os.unlink(temp_path)
+                except OSError:
+                    pass
+
+        folders = [self.folder] + ([self.archive_folder] if self.archive_folder is not None else [])
+        for path in folders:
+            try:
+                _fsync_folder(path)
+            except OSError as e:
+                # The files are already visible, so they are not reported as failed.
+                print(f"AlertWriter: could not fsync '{path}': {e}", file=sys.stderr)
+        return errors
+
+    def _archive(self, temp_path, filename):
+        """Links the file into the archive; a failed archive copy is logged, not a failed write."""
+        archived_path = os.path.join(self.archive_folder, filename)
+        try:
+            try:
+                os.link(temp_path, archived_path)
+            except OSError as e:
+                if e.errno != errno.EXDEV:
+                    raise
+                shutil.copy2(temp_path, archived_path)
+                with open(archived_path, 'rb+') as f:
+                    os.fsync(f.fileno())
+        except OSError as e:
+            print(f"AlertWriter: could not archive '{filename}': {e}", file=sys.stderr)
+
+    def close(self):
+        """Publishes what is still queued and stops the committer thread (call flush() first to see errors)."""
+        with self._cond:
+            self._closed = True
+            self._cond.notify_all()
+            thread = self._thread
+        if thread is not None:
+            thread.join()
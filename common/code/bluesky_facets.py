@@ -1,13 +1,37 @@
 # bluesky_facets.py
 '''
 A better name may be `atproto_facets.py`.
+
+Facets mark the byte ranges of mentions, links and tags in a post's text. parse_facets() finds
+them with regexes over the whole text. Text assembled from known parts (see compose()) carries
+its spans already: only its free-text parts are scanned, and its tags are placed directly.
 '''
 
-__all__ = ["parse_mentions", "parse_urls", "parse_tags", "parse_facets"]
+__all__ = ["parse_mentions", "parse_urls", "parse_tags", "parse_facets", "build_facets", "FacetedText", "compose"]
 
 import re
-import requests
-from typing import List, Dict
+from typing import List, Dict, Optional, Sequence, Tuple
+
+MENTION_REGEX = re.compile(rb"[$|\W](@([a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)")
+URL_REGEX = re.compile(rb"[$|\W](https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*[-a-zA-Z0-9@%_\+~#//=])?)")
+TAG_REGEX = re.compile(rb"[$|\W](#([a-zA-Z0-9_]+))")
+
+# A tag that is all TAG_REGEX characters is found whole, so its span needs no scan.
+TAG_WORD = re.compile(r"[a-zA-Z0-9_]+")
+NON_WORD = re.compile(rb"\W")
+
+def _mention_spans(text_bytes: bytes, start=0, end=None) -> List[Dict]:
+    # Scanning from one byte before start gives the pattern's leading character the same context as the whole text.
+    return [{"start": m.start(1), "end": m.end(1), "handle": m.group(1)[1:].decode("UTF-8")}
+            for m in MENTION_REGEX.finditer(text_bytes, max(0, start - 1), len(text_bytes) if end is None else end)]
+
+def _url_spans(text_bytes: bytes, start=0, end=None) -> List[Dict]:
+    return [{"start": m.start(1), "end": m.end(1), "url": m.group(1).decode("UTF-8")}
+            for m in URL_REGEX.finditer(text_bytes, max(0, start - 1), len(text_bytes) if end is None else end)]
+
+def _tag_spans(text_bytes: bytes, start=0, end=None) -> List[Dict]:
+    return [{"start": m.start(1), "end": m.end(1), "tag": m.group(1)[1:].decode("UTF-8")}
+            for m in TAG_REGEX.finditer(text_bytes, max(0, start - 1), len(text_bytes) if end is None else end)]
 
 def parse_mentions(text: str) -> List[Dict]:
     """
@@ -16,53 +40,35 @@ def parse_mentions(text: str) -> List[Dict]:
     """
     Parses mentions from a given text and returns a list of dictionaries with their positions and handles.
     """
-    spans = []
-    mention_regex = rb"[$|\W](@([a-zA-Z0-9]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?\.)+[a-zA-Z]([a-zA-Z0-9-]{0,61}[a-zA-Z0-9])?)"
-    text_bytes = text.encode("UTF-8")
-    for m in re.finditer(mention_regex, text_bytes):
-        spans.append({
-            "start": m.start(1),
-            "end": m.end(1),
-            "handle": m.group(1)[1:].decode("UTF-8")
-        })
-    return spans
+    return _mention_spans(text.encode("UTF-8"))
 
 def parse_urls(text: str) -> List[Dict]:
     """
     Extracts and returns a list of URLs from the input text, including their positions.
     """
-    spans = []
-    url_regex = rb"[$|\W](https?:\/\/(www\.)?[-a-zA-Z0-9@:%._\+~#=]{1,256}\.[a-zA-Z0-9()]{1,6}\b([-a-zA-Z0-9()@:%_\+.~#?&//=]*[-a-zA-Z0-9@%_\+~#//=])?)"
-    text_bytes = text.encode("UTF-8")
-    for m in re.finditer(url_regex, text_bytes):
-        spans.append({
-            "start": m.start(1),
-            "end": m.end(1),
-            "url": m.group(1).decode("UTF-8"),
-        })
-    return spans
+    return _url_spans(text.encode("UTF-8"))
 
 def parse_tags(text: str) -> List[Dict]:
     """
     Extracts and returns a list of tags from the input text, including their positions.
     """
-    spans = []
-    tag_regex = rb"[$|\W](#([a-zA-Z0-9_]+))"
-    text_bytes = text.encode("UTF-8")
-    for h in re.finditer(tag_regex, text_bytes):
-        spans.append({
-            "start": h.start(1),
-            "end": h.end(1),
-            "tag": h.group(1)[1:].decode("UTF-8")
-        })
-    return spans
+    return _tag_spans(text.encode("UTF-8"))
 
 def parse_facets(text: str, pds_url: str) -> List[Dict]:
     """
     Parses text to extract mentions, URLs, and tags, resolving handles to DIDs, and returns a list of facets with their positions and features.
     """
+    return build_facets(parse_mentions(text), parse_urls(text), parse_tags(text), pds_url)
+
+def build_facets(mentions: List[Dict], urls: List[Dict], tags: List[Dict], pds_url: str) -> List[Dict]:
+    """
+    Returns the facets for mention, URL and tag spans (as parse_mentions, parse_urls and parse_tags return them), resolving handles to DIDs.
+    """
     facets = []
-    for mention in parse_mentions(text):
+    if mentions:
+        # Only needed to resolve handles; most posts have no mentions, so skip the import cost.
+        import requests
+    for mention in mentions:
         resp = requests.get(
             pds_url + "/xrpc/com.atproto.identity.resolveHandle",
             params={"handle": mention["handle"]},
@@ -82,7 +88,7 @@ def parse_facets(text: str, pds_url: str) -> List[Dict]:
                     "did": did}],
                 }
         )
-    for url in parse_urls(text):
+    for url in urls:
         facets.append({
             "index": {
                 "byteStart": url["start"],
@@ -96,7 +102,7 @@ def parse_facets(text: str, pds_url: str) -> List[Dict]:
                 }
             ],
         })
-    for tag in parse_tags(text):
+    for tag in tags:
         facets.append({
             "index": {
                 "byteStart": tag["start"],
@@ -112,3 +118,91 @@ def parse_facets(text: str, pds_url: str) -> List[Dict]:
         })
 
     return facets
+
+class FacetedText(str):
+    """
+    Post text carrying the facet spans found while it was assembled (see compose()).
+
+    It is a str everywhere else. Appending text that starts with whitespace keeps the spans (only the
+    appended text is scanned); other operations give a plain str, whose facets are parsed again.
+    """
+    spans: Optional[Tuple[List[Dict], List[Dict], List[Dict]]] = None  # (mentions, urls, tags)
+
+    def __add__(self, other):
+        joined = str.__add__(self, other)
+        if self.spans is None or not isinstance(other, str) or not other[:1].isspace():
+            # No facet runs across whitespace; anything else could extend a facet at the end of self.
+            return joined
+        text_bytes = joined.encode("UTF-8")
+        start = len(str.encode(self, "UTF-8"))
+        mentions, urls, tags = self.spans
+        result = FacetedText(joined)
+        result.spans = (mentions + _mention_spans(text_bytes, start),
+                        urls + _url_spans(text_bytes, start),
+                        tags + _tag_spans(text_bytes, start))
+        return result
+
+def compose(parts: Sequence[Tuple]) -> FacetedText:
+    """
+    Joins (value, kind) parts into stripped post text, with the spans parse_facets() would find in it.
+
+    kind is None for fixed text, which has no facets; 'text' for free text, which is scanned with
+    the regexes; or 'tags' for a list of tags, written as "#a #b". A tag made only of the characters
+    TAG_REGEX accepts gets its span without a scan; any other tag is scanned like free text.
+
+    Fixed text must hold no '@', '#' or URL, and must separate the other parts with characters no
+    facet runs across (whitespace, ':' or ','), so that no facet spans two parts.
+    """
+    pieces = []
+    regions = []        # (start, end) byte ranges to scan
+    known_tags = []     # (start, end, tag) of tags placed directly
+    offset = 0
+    for value, kind in parts:
+        if kind == 'tags':
+            for n, tag in enumerate(value):
+                piece = ('#' if n == 0 else ' #') + tag
+                size = len(piece.encode("UTF-8"))
+                start = offset + size - len(tag.encode("UTF-8")) - 1
+                if TAG_WORD.fullmatch(tag):
+                    known_tags.append((start, offset + size, tag))
+                else:
+                    regions.append((start, offset + size))
+                pieces.append(piece)
+                offset += size
+            continue
+        value = str(value)
+        size = len(value.encode("UTF-8"))
+        if kind == 'text':
+            regions.append((offset, offset + size))
+        pieces.append(value)
+        offset += size
+
+    joined = ''.join(pieces)
+    text = joined.strip()
+    lead = len(joined[:len(joined) - len(joined.lstrip())].encode("UTF-8"))
+    text_bytes = text.encode("UTF-8")
+    limit = len(text_bytes)
+
+    mentions, urls, tags = [], [], []
+    scans = []
+    for start, end, tag in known_tags:
+        start, end = start - lead, end - lead
+        if start > 0 and end <= limit and NON_WORD.match(text_bytes, start - 1):
+            tags.append({"start": start, "end": end, "tag": tag})
+        else:
+            # Without a non-word byte before it (e.g. at the very start of the text) TAG_REGEX decides.
+            scans.append((max(0, start), min(end, limit)))
+    for start, end in regions:
+        start, end = max(0, start - lead), min(end - lead, limit)
+        if start < end:
+            scans.append((start, end))
+
+    for start, end in sorted(scans):
+        mentions += _mention_spans(text_bytes, start, end)
+        urls += _url_spans(text_bytes, start, end)
+        tags += _tag_spans(text_bytes, start, end)
+    tags.sort(key=lambda span: span["start"])
+
+    result = FacetedText(text)
+    result.spans = (mentions, urls, tags)
+    return result
@@ -0,0 +1,15 @@
+# bluesky_limits.py
+'''
+Limits Bluesky puts on posts, in one place for every module that checks them.
+
+Only constants, and no imports, so chart worker processes and the one-shot trigger can use
+them without loading anything else.
+'''
+
+__all__ = ["MAX_POST_LENGTH", "MAX_IMAGE_BYTES"]
+
+# Post length limit, in characters.
+MAX_POST_LENGTH = 300
+
+# Maximum blob size accepted for images.
+MAX_IMAGE_BYTES = 1000000
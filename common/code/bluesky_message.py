@@ -0,0 +1,60 @@
+# bluesky_message.py
+'''
+Formats an alert as Bluesky post text.
+
+Kept apart from trigger_notify.py, which loads yaml, dotenv and the .env.local settings when
+imported, so that the one-shot trigger's dry run and JSON alerts need nothing but this module,
+alert_model and bluesky_facets.
+'''
+
+__all__ = ["build_message"]
+
+from alert_model import validate_alert
+from bluesky_facets import compose
+from bluesky_limits import MAX_POST_LENGTH
+
+def build_message(alert_json):
+    """
+    Creates a Bluesky message string from an alert.
+
+    Args:
+        alert_json: An AlertRecord, or a mapping of alert attributes (validated here).
+
+    Returns:
+        FacetedText: The formatted Bluesky message (a str carrying its facet spans).
+    """
+    alert = validate_alert(alert_json)
+
+    message_content = alert.message
+    formatted_time = alert.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    host = alert.host or 'Unknown host'
+    site_id = 'N/A' if alert.host_site_id is None else alert.host_site_id
+    sensor_id = 'N/A' if alert.host_sensor_id is None else alert.host_sensor_id
+    tags_string = ' '.join(['#' + tag for tag in alert.tags])
+
+    def assemble(content, with_ids):
+        # Facet spans are collected part by part: only the message, host and IDs are scanned,
+        # and the tags are placed where they are written. Only the full variant says "UTC".
+        parts = [(content, 'text'), ("\n\nGenerated by: ", None), (host, 'text'),
+                 (f" at {formatted_time} UTC\n" if with_ids else f" at {formatted_time}\n", None)]
+        if with_ids:
+            parts += [("(Site ID: ", None), (site_id, 'text'), (", Sensor ID: ", None), (sensor_id, 'text'), (")\n", None)]
+        parts.append((alert.tags, 'tags'))
+        return compose(parts)
+
+    # Initial message with site and sensor IDs
+    message = assemble(message_content, with_ids=True)
+
+    if len(message) <= MAX_POST_LENGTH:
+        return message
+    else:
+        # Truncate by removing site and sensor IDs
+        truncated_message = assemble(message_content, with_ids=False)
+
+    if len(truncated_message) <= MAX_POST_LENGTH:
+        return truncated_message
+    else:
+        # If still too long, further truncate the original message content
+        remaining_length = MAX_POST_LENGTH - (len(f"\n\nGenerated by: {host} at {formatted_time}\n{tags_string}") + 3) # +3 for ellipsis
+        truncated_content = message_content[:max(0, remaining_length)] + "..."
+        return assemble(truncated_content, with_ids=False)
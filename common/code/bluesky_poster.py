@@ -1,4 +1,6 @@
-from bluesky_facets import parse_facets
+from bluesky_facets import build_facets, parse_facets
+from bluesky_limits import MAX_IMAGE_BYTES
+from rate_limiter import RateLimiter, RETRY_STATUSES
 import os
 import sys
 import re
@@ -6,10 +8,56 @@ import json
 from typing import Dict, List
 from pathlib import Path
 import asyncio
+import mimetypes
+import time
 import aiohttp
 from datetime import datetime, timezone
 from datetime import timedelta
-from dotenv import load_dotenv
+
+# Maximum number of writes per com.atproto.repo.applyWrites request (the reference PDS limit).
+APPLY_WRITES_MAX = 200
+
+# applyWrites statuses after which a chunk's posts are tried one by one. The PDS rejected the
+# request as a whole (a post that doesn't validate, a record key that already exists, a request
+# too large), so nothing was written and posting them singly isolates the bad ones.
+SPLIT_STATUSES = (400, 413)
+
+# Errors a 400 carries that are about the session, not the posts; trying each post can't help.
+SESSION_ERRORS = ("ExpiredToken", "InvalidToken", "AuthRequired")
+
+# Rate limit points a PDS charges per created record.
+CREATE_POINTS = 3
+
+# Alphabet of the base32-sortable encoding used by TIDs (timestamp identifiers).
+TID_ALPHABET = "234567abcdefghijklmnopqrstuvwxyz"
+
+def deterministic_rkey(fingerprint, created_at=None):
+    """
+    Derives a record key from an alert's content hash, so a retried post overwrites instead of duplicating.
+
+    The key is a valid TID (the key type app.bsky.feed.post expects): 53 bits of microseconds
+    and 10 bits of clock ID. The seconds come from the alert's created_at, and the sub-second
+    microseconds and clock ID come from the hash, so the key sorts near the alert's time.
+
+    Args:
+        fingerprint: The alert's SHA-256 hex digest.
+        created_at: The alert's creation time (datetime), or None to use hash bits for the whole timestamp.
+
+    Returns:
+        A 13-character TID string.
+    """
+    digest = int(fingerprint[:16], 16)
+    clock_id = digest & 0x3ff
+    if created_at is not None:
+        micros = int(created_at.timestamp()) * 1000000 + (digest >> 10) % 1000000
+    else:
+        micros = (digest >> 10) & ((1 << 53) - 1)
+    value = ((micros & ((1 << 53) - 1)) << 10) | clock_id
+    chars = []
+    for _ in range(13):
+        chars.append(TID_ALPHABET[value & 0x1f])
+        value >>= 5
+    return "".join(reversed(chars))
 
 class BlueskyPoster:
     """
@@ -27,8 +75,13 @@ class BlueskyPoster:
             session_lock (asyncio.Lock): A lock to manage session creation.
             session (dict): The current session information.
             session_expiry (datetime): The expiry time of the current session.
+            write_limiter (RateLimiter): Paces record writes (createRecord, putRecord, applyWrites).
+            upload_limiter (RateLimiter): Paces blob uploads.
+            max_retries (int): Retries of a request the PDS answered with 429 or 503.
+            connection_limit (int): Most simultaneous connections to the PDS.
+            last_used (float): time.monotonic() of the last request, for idle eviction.
         """
-    def __init__(self, pds_url, handle, password):
+    def __init__(self, pds_url, handle, password, connection_limit=4):
         """
         Initializes the instance with server URL, user handle, and password, and sets up session management attributes.
         """
@@ -40,6 +93,58 @@ class BlueskyPoster:
         self.session_lock = asyncio.Lock()
         self.session = None
         self.session_expiry = None
+        # Shared by every request this poster makes, and adjusted from the PDS's ratelimit headers.
+        self.write_limiter = RateLimiter("write", rate=1.0 * CREATE_POINTS, increase=0.1 * CREATE_POINTS)
+        self.upload_limiter = RateLimiter("upload", rate=2.0)
+        self.max_retries = 3
+        # One aiohttp session (connection pool) per poster, created on first use.
+        self.connection_limit = connection_limit
+        self.http = None
+        self._http_loop = None
+        self.last_used = time.monotonic()
+
+    def http_session(self):
+        """
+        Returns this poster's aiohttp session, creating it on first use.
+
+        A session belongs to one event loop; callers that use asyncio.run() per send get a new one
+        per loop.
+        """
+        loop = asyncio.get_running_loop()
+        if self.http is None or self.http.closed or self._http_loop is not loop:
+            self.http = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.connection_limit))
+            self._http_loop = loop
+        self.last_used = time.monotonic()
+        return self.http
+
+    async def close(self):
+        """Closes the connection pool (it is recreated on next use; the login session is kept)."""
+        if self.http is not None and not self.http.closed and self._http_loop is asyncio.get_running_loop():
+            await self.http.close()
+        self.http = None
+        self._http_loop = None
+
+    async def xrpc_post(self, limiter, config, method, cost=1, **kwargs):
+        """
+        POSTs to an XRPC method, paced by a rate limiter (`cost` is the request's budget points).
+
+        Responses with 429 or 503 are retried (up to max_retries) once the limiter allows it,
+        which honours Retry-After and ratelimit-reset.
+
+        Returns:
+            (response, body): The final response, and its JSON body (None if it has none).
+        """
+        for attempt in range(self.max_retries + 1):
+            await limiter.acquire(cost)
+            async with self.http_session().post(config['pds_url'] + "/xrpc/" + method, **kwargs) as resp:
+                try:
+                    body = await resp.json(content_type=None)
+                except ValueError:
+                    body = None
+            hold = limiter.update(resp.status, resp.headers)
+            if resp.status not in RETRY_STATUSES or attempt == self.max_retries:
+                return resp, body
+            print(f"{method} returned {resp.status}; retrying in {hold:.1f}s ({limiter.describe()})", file=sys.stderr)
     
     async def bsky_login_session(self, pds_url: str, handle: str, password: str) -> Dict:
         """
@@ -57,12 +162,11 @@ class BlueskyPoster:
         headers = {'Content-Type': 'application/json'}
 
         try:
-            async with aiohttp.ClientSession() as session:  # Use aiohttp for async requests
-                resp = await session.post(  # Use await for the async post request
-                    pds_url + "/xrpc/com.atproto.server.createSession",
-                    json={"identifier": handle, "password": password},
-                    headers=headers
-                )
+            async with self.http_session().post(
+                pds_url + "/xrpc/com.atproto.server.createSession",
+                json={"identifier": handle, "password": password},
+                headers=headers
+            ) as resp:
                 resp.raise_for_status()  # This will raise an exception for 4xx and 5xx status codes
                 return await resp.json()  # Use await for async json response
         except aiohttp.ClientError as e:  # Catch aiohttp exceptions
@@ -131,27 +235,40 @@ class BlueskyPoster:
             print(f"File does not exist: {media_path}")
             return None
 
-        try:
-            with open(media_path, "rb") as media_file:
-                media_bytes = media_file.read()
+        with open(media_path, "rb") as media_file:
+            media_bytes = media_file.read()
 
-            if len(media_bytes) > 1000000:
-                raise Exception(
-                    f"Image file size too large. 1000000 bytes maximum, got: {len(media_bytes)}"
-                )
+        mime_type = mimetypes.guess_type(media_path)[0] or "application/octet-stream"
+        return await self.upload_image_bytes(config, media_bytes, mime_type)
 
-            async with aiohttp.ClientSession() as session:
-                resp = await session.post(
-                    # TODO: what is the recipe for uploading videos to Bluesky?
-                    config['pds_url'] + "/xrpc/com.atproto.repo.uploadBlob",
-                    headers={
-                        "Content-Type": "video/mp4",  # TODO: if similar enough, combine with upload_image method. 
-                        "Authorization": "Bearer " + self.access_jwt
-                    },
-                    data=media_bytes,
-                )
-                resp.raise_for_status()
-                blob = (await resp.json())["blob"] 
+    async def upload_image_bytes(self, config, media_bytes, mime_type="image/png"):
+        """
+        Uploads in-memory image bytes (e.g. a rendered chart) using com.atproto.repo.uploadBlob.
+
+        Args:
+        config: Configuration dictionary containing server details.
+        media_bytes: The encoded image.
+        mime_type: The image MIME type.
+
+        Returns:
+        The blob identifier if the upload is successful, or None if an error occurs.
+        """
+        if len(media_bytes) > MAX_IMAGE_BYTES:
+            raise Exception(
+                f"Image file size too large. {MAX_IMAGE_BYTES} bytes maximum, got: {len(media_bytes)}"
+            )
+
+        try:
+            resp, body = await self.xrpc_post(
+                self.upload_limiter, config, "com.atproto.repo.uploadBlob",
+                headers={
+                    "Content-Type": mime_type,
+                    "Authorization": "Bearer " + self.access_jwt
+                },
+                data=media_bytes,
+            )
+            resp.raise_for_status()
+            blob = body["blob"]
 
             return blob
 
@@ -197,23 +314,29 @@ class BlueskyPoster:
         else:
             return message + short_addendum
 
-    async def create_post(self, config, message):
+    @staticmethod
+    def images_embed(images):
         """
-        Creates a new post on the Bluesky platform using the provided message metadata and configuration.
-        
-            Args:
-            config: Configuration dictionary containing necessary session and API details.
-            message: A dictionary representing the message to be posted.
-        
-            Returns:
-            None
+        Builds an app.bsky.embed.images embed.
+
+        Args:
+            images: A list of (blob, alt_text) tuples, at most 4.
+
+        Returns:
+            The embed dictionary.
         """
-        bsky_session = await self.get_or_create_session()
-        if bsky_session is None:
-            return
+        return {
+            "$type": "app.bsky.embed.images",
+            "images": [{"alt": alt, "image": blob} for blob, alt in images[:4]],
+        }
 
-        #config['accessJwt'] = bsky_session["accessJwt"]
-        #config['did'] = bsky_session["did"]
+    def build_post_record(self, message, embed=None, facets=None):
+        """
+        Builds an app.bsky.feed.post record for the message, with facets and an optional embed.
+
+        Facets are taken from `facets`, else from the spans a FacetedText message carries, and
+        are only parsed out of the text when it has neither.
+        """
         #message= self.manage_bluesky_message_length(message)
 
         # trailing "Z" is preferred over "+00:00"
@@ -221,7 +344,9 @@ class BlueskyPoster:
 
         # Use the parse_facets function to generate facets
         #facets = parse_facets(message['text'] + addendum, self.pds_url)
-        facets = parse_facets(message, self.pds_url)
+        if facets is None:
+            spans = getattr(message, 'spans', None)
+            facets = build_facets(*spans, self.pds_url) if spans is not None else parse_facets(message, self.pds_url)
 
         # these are the required fields which every post must include
         post = {
@@ -231,28 +356,152 @@ class BlueskyPoster:
             "createdAt": now,
             "facets": facets,
         }
+        if embed is not None:
+            post["embed"] = embed
+        return post
+
+    async def create_post(self, config, message, embed=None, rkey=None, facets=None):
+        """
+        Creates a new post on the Bluesky platform using the provided message metadata and configuration.
+        
+            Args:
+            config: Configuration dictionary containing necessary session and API details.
+            message: A dictionary representing the message to be posted.
+            embed: Optional embed for the post, e.g. from images_embed().
+            rkey: Optional record key (see deterministic_rkey). The post is then written with
+                putRecord, so retrying with the same key overwrites the post instead of duplicating it.
+            facets: Optional facets for the post; by default they come from the message (see build_post_record).
+        
+            Returns:
+            The createRecord/putRecord response (with the post's uri and cid), or None if authentication failed.
+        """
+        bsky_session = await self.get_or_create_session()
+        if bsky_session is None:
+            return
+
+        #config['accessJwt'] = bsky_session["accessJwt"]
+        #config['did'] = bsky_session["did"]
+        post = self.build_post_record(message, embed, facets)
 
         print("post:")
         print(json.dumps(post, indent=2), file=sys.stderr)
 
-        async with aiohttp.ClientSession() as session:  # Create aiohttp ClientSession here
-            resp = await session.post(  # Use await for async post
-                config['pds_url'] + "/xrpc/com.atproto.repo.createRecord",
-                headers={"Authorization": "Bearer " + self.access_jwt},
-                json={
-                    "repo": self.did,
+        method = "com.atproto.repo.createRecord"
+        body = {
+            "repo": self.did,
+            "collection": "app.bsky.feed.post",
+            "record": post,
+        }
+        if rkey is not None:
+            method = "com.atproto.repo.putRecord"
+            body["rkey"] = rkey
+
+        resp, result = await self.xrpc_post(
+            self.write_limiter, config, method, cost=CREATE_POINTS,
+            headers={"Authorization": "Bearer " + self.access_jwt},
+            json=body,
+        )
+        print(f"{method.rsplit('.', 1)[-1]} response:", file=sys.stderr)
+        print(json.dumps(result, indent=2))
+        resp.raise_for_status()
+        return result
+
+    async def create_posts(self, config, messages):
+        """
+        Creates many posts with com.atproto.repo.applyWrites, one request per APPLY_WRITES_MAX posts.
+
+        Args:
+            config: Configuration dictionary containing necessary session and API details.
+            messages: A list of message strings, or (message, embed) or (message, embed, rkey) tuples.
+
+        Returns:
+            One result per message, in order: {"ok": bool, "uri": ..., "cid": ..., "error": ...}.
+            A failed request marks every post in its chunk as failed; other chunks are unaffected.
+            Only when the PDS rejects a chunk as invalid (SPLIT_STATUSES) are its posts tried one
+            by one, with putRecord where they have record keys, so one bad post doesn't fail the
+            rest, and a batch that was already committed before a crash still completes. A 429,
+            a 5xx or a connection error fails the chunk without further requests, and leaves the
+            write limiter slowed down.
+        """
+        results = []
+        bsky_session = await self.get_or_create_session()
+        if bsky_session is None:
+            return [{"ok": False, "uri": None, "cid": None, "error": "Authentication failed"} for _ in messages]
+
+        for start in range(0, len(messages), APPLY_WRITES_MAX):
+            chunk = messages[start:start + APPLY_WRITES_MAX]
+            writes = []
+            items = []
+            for item in chunk:
+                message, embed, rkey = (tuple(item) + (None, None))[:3] if isinstance(item, tuple) else (item, None, None)
+                items.append((message, embed, rkey))
+                write = {
+                    "$type": "com.atproto.repo.applyWrites#create",
                     "collection": "app.bsky.feed.post",
-                    "record": post,
-                },
-            )
-            print("createRecord response:", file=sys.stderr)
-            print(json.dumps(await resp.json(), indent=2))  # Use await for async json response
-            resp.raise_for_status()
-        
+                    "value": self.build_post_record(message, embed),
+                }
+                if rkey is not None:
+                    write["rkey"] = rkey
+                writes.append(write)
+
+            def chunk_failed(error):
+                results.extend({"ok": False, "uri": None, "cid": None, "error": error} for _ in items)
+
+            try:
+                resp, body = await self.xrpc_post(
+                    self.write_limiter, config, "com.atproto.repo.applyWrites", cost=CREATE_POINTS * len(writes),
+                    headers={"Authorization": "Bearer " + self.access_jwt},
+                    json={"repo": self.did, "writes": writes},
+                )
+            except (aiohttp.ClientError, asyncio.TimeoutError) as e:
+                # No answer from the PDS: slow down as for a 503, and leave the chunk to be sent again.
+                hold = self.write_limiter.update(503)
+                print(f"applyWrites failed: {e}; holding writes for {hold:.1f}s", file=sys.stderr)
+                chunk_failed(f"{e}")
+                continue
+            print(f"applyWrites response ({len(writes)} writes): {resp.status}", file=sys.stderr)
+
+            if resp.status >= 300:
+                body = body if isinstance(body, dict) else {}
+                error = f"applyWrites returned {resp.status}: {body.get('message') or body.get('error') or resp.reason}"
+                if resp.status not in SPLIT_STATUSES or body.get('error') in SESSION_ERRORS:
+                    # A 429/503 left after the retries has already slowed the limiter; more
+                    # requests now would only be refused too. Server and session errors fail alike.
+                    chunk_failed(error)
+                    continue
+                stopped = None
+                for message, embed, rkey in items:
+                    if stopped is not None:
+                        results.append({"ok": False, "uri": None, "cid": None, "error": stopped})
+                        continue
+                    try:
+                        result = await self.create_post(config, message, embed, rkey=rkey)
+                        if result is None:
+                            raise Exception("Authentication failed")
+                        results.append({"ok": True, "uri": result.get("uri"), "cid": result.get("cid"), "error": None})
+                    except Exception as retry_error:
+                        results.append({"ok": False, "uri": None, "cid": None, "error": f"{retry_error}"})
+                        # Once the PDS is throttling or unreachable, the posts left fail without a request.
+                        if isinstance(retry_error, aiohttp.ClientResponseError):
+                            if retry_error.status in RETRY_STATUSES:
+                                stopped = f"{retry_error}"
+                        elif isinstance(retry_error, (aiohttp.ClientError, asyncio.TimeoutError)):
+                            self.write_limiter.update(503)
+                            stopped = f"{retry_error}"
+                continue
+
+            # Older PDS versions don't return per-write results; the commit still covers every write.
+            write_results = (body or {}).get("results") or [{}] * len(chunk)
+            for write_result in write_results:
+                results.append({"ok": True, "uri": write_result.get("uri"), "cid": write_result.get("cid"), "error": None})
+
+        return results
+
 async def main():
     """
     Asynchronously loads environment variables, initializes configurations, and posts using BlueskyPoster.
     """
+    from dotenv import load_dotenv
 
     # Get the directory of the current script
     script_dir = Path(__file__).parent 
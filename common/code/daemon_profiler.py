@@ -0,0 +1,208 @@
+# daemon_profiler.py
+'''
+Low-overhead profiling for the trigger_notify daemon.
+
+Writes three kinds of dumps into a rotating output directory:
+* cProfile/pstats dumps every N alerts or N seconds (binary .pstats plus a readable .txt summary).
+* tracemalloc snapshot diffs, to spot memory that keeps growing between dumps.
+* Async task dumps, showing what an attached event loop is waiting on, plus the stacks of all threads.
+'''
+
+__all__ = ["DaemonProfiler"]
+
+import asyncio
+import cProfile
+import io
+import os
+import pstats
+import sys
+import threading
+import time
+import traceback
+import tracemalloc
+from datetime import datetime, timezone
+
+class DaemonProfiler:
+    """
+    Collects periodic profile, memory and task dumps for the daemon.
+
+    cProfile only profiles the thread that enabled it, so start(), record_alert() and maybe_dump()
+    should be called from the daemon's main thread. Task dumps run on a background timer thread.
+
+    Attributes:
+        output_dir (str): Directory the dumps are written to.
+        every_alerts (int): Dump after this many alerts (0 disables).
+        every_seconds (float): Dump after this many seconds (0 disables).
+        task_interval (float): Seconds between async task dumps (0 disables).
+        keep (int): Number of dump sets to keep; older ones are deleted.
+        top (int): Number of entries in the text summaries.
+    """
+    def __init__(self, output_dir, every_alerts=100, every_seconds=300, task_interval=60, keep=20, top=30,
+                 tracemalloc_frames=5):
+        self.output_dir = output_dir
+        self.every_alerts = every_alerts
+        self.every_seconds = every_seconds
+        self.task_interval = task_interval
+        self.keep = keep
+        self.top = top
+        self.tracemalloc_frames = tracemalloc_frames
+        self.profile = None
+        self.alert_count = 0
+        self.last_dump = time.monotonic()
+        self.last_snapshot = None
+        self._loop = None
+        self._stop = threading.Event()
+        self._task_thread = None
+
+    def start(self):
+        """Starts profiling, memory tracing and the task dump timer."""
+        os.makedirs(self.output_dir, exist_ok=True)
+        if not tracemalloc.is_tracing():
+            tracemalloc.start(self.tracemalloc_frames)
+        self.last_snapshot = self._take_snapshot()
+        self.profile = cProfile.Profile()
+        self.profile.enable()
+        self.last_dump = time.monotonic()
+        if self.task_interval > 0:
+            self._task_thread = threading.Thread(target=self._task_timer, name="profiler-tasks", daemon=True)
+            self._task_thread.start()
+        print(f"Profiling enabled, writing to {self.output_dir}")
+
+    def stop(self):
+        """Writes a final dump and stops profiling."""
+        self._stop.set()
+        if self.profile is not None:
+            self.dump("final")
+            self.profile.disable()
+            self.profile = None
+        tracemalloc.stop()
+
+    def attach_loop(self, loop=None):
+        """
+        Registers the event loop whose tasks should appear in task dumps.
+
+        Call from inside the loop (loop=None uses the running loop).
+        """
+        self._loop = loop or asyncio.get_running_loop()
+
+    def record_alert(self):
+        """Counts one processed alert and dumps when the alert interval is reached."""
+        self.alert_count += 1
+        if self.every_alerts and self.alert_count % self.every_alerts == 0:
+            self.dump(f"alerts{self.alert_count}")
+
+    def maybe_dump(self):
+        """Dumps when the time interval has elapsed; call once per daemon cycle."""
+        if self.every_seconds and time.monotonic() - self.last_dump >= self.every_seconds:
+            self.dump("interval")
+
+    def dump(self, reason):
+        """Writes a pstats dump and a tracemalloc diff, then restarts the profile window."""
+        if self.profile is None:
+            return
+        prefix = self._prefix(reason)
+
+        # Profiling stays paused while dumping so the dump itself stays out of the numbers.
+        self.profile.disable()
+        try:
+            self.profile.dump_stats(prefix + ".pstats")
+            summary = io.StringIO()
+            stats = pstats.Stats(self.profile, stream=summary)
+            stats.sort_stats(pstats.SortKey.CUMULATIVE).print_stats(self.top)
+            stats.sort_stats(pstats.SortKey.TIME).print_stats(self.top)
+            with open(prefix + ".txt", "w") as f:
+                f.write(f"alerts processed: {self.alert_count}\n")
+                f.write(summary.getvalue())
+
+            snapshot = self._take_snapshot()
+            with open(prefix + ".memory.txt", "w") as f:
+                current, peak = tracemalloc.get_traced_memory()
+                f.write(f"traced memory: current={current} peak={peak}\n")
+                f.write(f"top {self.top} allocation changes since the previous dump:\n")
+                for stat in self._own_stats_removed(snapshot.compare_to(self.last_snapshot, "traceback")):
+                    f.write(f"{stat}\n")
+                    for line in stat.traceback.format(limit=self.tracemalloc_frames):
+                        f.write(f"    {line}\n")
+            self.last_snapshot = snapshot
+        finally:
+            self.profile = cProfile.Profile()
+            self.profile.enable()
+
+        self.last_dump = time.monotonic()
+        self._rotate()
+        print(f"Profile dump written: {prefix}")
+
+    def dump_tasks(self, reason="tasks"):
+        """
+        Writes the stacks of all threads and schedules a dump of the attached loop's tasks.
+
+        The task dump runs inside the loop (call_soon_threadsafe), so a loop that is blocked
+        shows up as a thread stack without a matching task dump.
+        """
+        prefix = self._prefix(reason)
+        with open(prefix + ".threads.txt", "w") as f:
+            names = {thread.ident: thread.name for thread in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                f.write(f"--- thread {names.get(ident, ident)}\n")
+                f.write("".join(traceback.format_stack(frame)))
+
+        loop = self._loop
+        if loop is not None and not loop.is_closed() and loop.is_running():
+            try:
+                loop.call_soon_threadsafe(self._write_tasks, prefix + ".tasks.txt")
+            except RuntimeError:
+                pass  # Loop closed in between.
+
+    def _write_tasks(self, path):
+        with open(path, "w") as f:
+            for task in asyncio.all_tasks():
+                f.write(f"--- {task.get_name()}: {task.get_coro()!r}\n")
+                stream = io.StringIO()
+                task.print_stack(limit=10, file=stream)
+                f.write(stream.getvalue())
+
+    def _task_timer(self):
+        while not self._stop.wait(self.task_interval):
+            try:
+                self.dump_tasks()
+                self._rotate()
+            except Exception as e:
+                print(f"Error writing task dump: {e}")
+
+    def _take_snapshot(self):
+        return tracemalloc.take_snapshot()
+
+    def _own_stats_removed(self, stats):
+        """
+        Returns the top stats, leaving out the profiler's own allocations.
+
+        Filtering the (short) result is far cheaper than Snapshot.filter_traces() on every live allocation.
+        """
+        own = {tracemalloc.__file__, cProfile.__file__, pstats.__file__, traceback.__file__, __file__}
+        kept = []
+        for stat in stats:
+            if stat.traceback[0].filename not in own:
+                kept.append(stat)
+                if len(kept) == self.top:
+                    break
+        return kept
+
+    def _prefix(self, reason):
+        stamp = datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%S%fZ')
+        return os.path.join(self.output_dir, f"{stamp}-{reason}")
+
+    def _rotate(self):
+        """Keeps the newest `keep` dump sets of each kind (task dumps, profile dumps), grouped by timestamp prefix."""
+        groups = {}
+        for name in os.listdir(self.output_dir):
+            stamp, _, rest = name.partition("-")
+            kind = "tasks" if rest.startswith("tasks") else "profile"
+            groups.setdefault(kind, {}).setdefault(stamp, []).append(name)
+        for sets in groups.values():
+            stamps = sorted(sets)
+            for stamp in stamps[:max(0, len(stamps) - self.keep)]:
+                for name in sets[stamp]:
+                    try:
+                        os.remove(os.path.join(self.output_dir, name))
+                    except OSError:
+                        pass
@@ -0,0 +1,204 @@
+# db_pool.py
+'''
+Shared async Postgres access for the message table.
+
+One psycopg AsyncConnectionPool serves both sides of the database trigger path: the message
+writer (scripts/create_message) inserts rows, and DatabaseAlert claims pending rows and marks
+them sent or failed. Status changes for a whole batch go out as one UPDATE per outcome (sent rows
+joined against unnest()ed id/URI arrays, failed rows by id = ANY(...)).
+
+The table's columns and indexes are managed by scripts/migrate_db.
+
+Connection settings come from the POSTGRES_DATABASE_* variables used by create_message.
+Pool settings:
+
+    POSTGRES_POOL_MIN_SIZE       Connections kept open (default 1).
+    POSTGRES_POOL_MAX_SIZE       Connection cap (default 4).
+    POSTGRES_PREPARE_THRESHOLD   Executions before a statement is prepared server-side (default 5;
+                                 0 prepares at once, 'none' disables - needed behind a transaction-mode
+                                 pooler such as PgBouncer or Supabase's port 6543).
+'''
+
+__all__ = ["db_config_from_env", "pool_settings_from_env", "message_row", "AlertDatabase", "MESSAGE_COLUMNS"]
+
+import os
+from typing import Dict, Iterable, List, Optional
+
+from alert_model import parse_coordinate
+
+# Columns written by the message writer and read back by the consumer.
+MESSAGE_COLUMNS = (
+    'message', 'created_by', 'created_at', 'site_uuid', 'host',
+    'host_site_id', 'host_sensor_id', 'trigger_type',
+    'target_channels', 'site_lat', 'site_long', 'tags',
+)
+
+INSERT_MESSAGE_SQL = (
+    "INSERT INTO message (" + ", ".join(MESSAGE_COLUMNS) + ") VALUES ("
+    + ", ".join(f"%({column})s" for column in MESSAGE_COLUMNS) + ")"
+)
+
+# Claims the oldest pending rows; SKIP LOCKED lets several consumers share the table.
+CLAIM_PENDING_SQL = (
+    "UPDATE message SET status = 'sending', attempts = attempts + 1, claimed_at = now() WHERE id IN ("
+    " SELECT id FROM message WHERE status = 'pending' ORDER BY id LIMIT %s FOR UPDATE SKIP LOCKED"
+    ") RETURNING id, " + ", ".join(MESSAGE_COLUMNS)
+)
+
+MARK_SENT_SQL = (
+    "UPDATE message AS m SET status = 'sent', sent_at = now(), post_uri = s.post_uri"
+    " FROM unnest(%s::integer[], %s::text[]) AS s(id, post_uri) WHERE m.id = s.id"
+)
+MARK_FAILED_SQL = "UPDATE message SET status = 'failed' WHERE id = ANY(%s)"
+# Hands back claims older than the lease: their consumer stopped (or stalled) mid-batch.
+REQUEUE_STALE_SQL = (
+    "UPDATE message SET status = 'pending' WHERE status = 'sending'"
+    " AND (claimed_at IS NULL OR claimed_at < now() - make_interval(secs => %s))"
+)
+
+# Seconds a claim is held before another consumer may take its rows back.
+CLAIM_LEASE_SECONDS = 600
+
+def message_row(data: Dict) -> Dict:
+    """
+    Returns the message columns of an alert mapping (missing ones are None), with site_lat and
+    site_long in decimal degrees, as the double precision columns need ("39:39:55" included).
+
+    Raises:
+        AlertValidationError: A coordinate can't be read or is out of range.
+    """
+    row = {column: data.get(column) for column in MESSAGE_COLUMNS}
+    row['site_lat'] = parse_coordinate(row['site_lat'], 90)
+    row['site_long'] = parse_coordinate(row['site_long'], 180)
+    return row
+
+def db_config_from_env() -> Dict:
+    """Returns psycopg connection keywords from the POSTGRES_DATABASE_* variables."""
+    config = {
+        'dbname': os.getenv("POSTGRES_DATABASE_NAME"),
+        'user': os.getenv("POSTGRES_DATABASE_USER"),
+        'password': os.getenv("POSTGRES_DATABASE_PASSWORD"),
+        'host': os.getenv("POSTGRES_DATABASE_HOST"),
+        'port': os.getenv("POSTGRES_DATABASE_PORT"),
+    }
+    return {key: value for key, value in config.items() if value}
+
+def pool_settings_from_env() -> Dict:
+    """Returns the pool size and prepare threshold from the POSTGRES_POOL_* variables."""
+    threshold = os.getenv("POSTGRES_PREPARE_THRESHOLD", "5").strip().lower()
+    return {
+        'min_size': int(os.getenv("POSTGRES_POOL_MIN_SIZE", "1")),
+        'max_size': int(os.getenv("POSTGRES_POOL_MAX_SIZE", "4")),
+        'prepare_threshold': None if threshold in ("", "none") else int(threshold),
+    }
+
+class AlertDatabase:
+    """
+    The message table, behind a shared async connection pool.
+
+    Settings not passed in are read from the environment when the object is created, so
+    scripts can load their .env.local first.
+
+    Attributes:
+        min_size (int): Connections kept open.
+        max_size (int): Connection cap; callers wait for a free connection beyond it.
+        prepare_threshold (int or None): Passed to every pooled connection.
+    """
+    def __init__(self, config: Optional[Dict] = None, min_size=None, max_size=None, prepare_threshold=-1):
+        settings = pool_settings_from_env()
+        self.config = db_config_from_env() if config is None else config
+        self.min_size = settings['min_size'] if min_size is None else min_size
+        self.max_size = settings['max_size'] if max_size is None else max_size
+        self.prepare_threshold = settings['prepare_threshold'] if prepare_threshold == -1 else prepare_threshold
+        self.pool = None
+
+    async def _configure(self, conn):
+        conn.prepare_threshold = self.prepare_threshold
+
+    async def open(self):
+        """Opens the pool and waits for the first min_size connections."""
+        if self.pool is not None:
+            return
+        from psycopg.conninfo import make_conninfo
+        from psycopg_pool import AsyncConnectionPool
+
+        self.pool = AsyncConnectionPool(
+            make_conninfo(**self.config),
+            min_size=self.min_size,
+            max_size=self.max_size,
+            configure=self._configure,
+            open=False,
+        )
+        await self.pool.open(wait=True)
+
+    async def close(self):
+        if self.pool is not None:
+            await self.pool.close()
+            self.pool = None
+
+    async def insert_message(self, data: Dict):
+        """Inserts one message row (missing columns are NULL)."""
+        await self.insert_messages([data])
+
+    async def insert_messages(self, rows: Iterable[Dict]):
+        """Inserts message rows in one transaction, with a single executemany round trip (see message_row)."""
+        rows = [message_row(row) for row in rows]
+        if not rows:
+            return
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                await cur.executemany(INSERT_MESSAGE_SQL, rows)
+
+    async def claim_pending(self, limit: int) -> List[Dict]:
+        """
+        Marks up to `limit` of the oldest pending rows as 'sending' and returns them as dicts.
+        """
+        from psycopg.rows import dict_row
+
+        async with self.pool.connection() as conn:
+            async with conn.cursor(row_factory=dict_row) as cur:
+                await cur.execute(CLAIM_PENDING_SQL, (limit,))
+                rows = await cur.fetchall()
+        rows.sort(key=lambda row: row['id'])
+        return rows
+
+    async def mark_sent(self, ids: List[int], post_uris: Optional[List[str]] = None):
+        """Marks rows sent (recording each post's URI when given), in one statement."""
+        await self.mark(ids, [], post_uris)
+
+    async def mark_failed(self, ids: List[int]):
+        """Marks rows failed, in one statement."""
+        await self.mark([], ids)
+
+    async def mark(self, sent_ids: List[int], failed_ids: List[int], post_uris: Optional[List[str]] = None):
+        """
+        Records a batch's outcome in one transaction: one UPDATE for the sent rows, one for the failed.
+
+        Args:
+            sent_ids: Rows that were posted.
+            failed_ids: Rows that failed.
+            post_uris: Optional post URI per sent row, in the same order (None entries are allowed).
+        """
+        if not sent_ids and not failed_ids:
+            return
+        if post_uris is None:
+            post_uris = [None] * len(sent_ids)
+        async with self.pool.connection() as conn:
+            async with conn.cursor() as cur:
+                if sent_ids:
+                    await cur.execute(MARK_SENT_SQL, (list(sent_ids), list(post_uris)))
+                if failed_ids:
+                    await cur.execute(MARK_FAILED_SQL, (list(failed_ids),))
+
+    async def requeue_stale(self, lease_seconds: float = CLAIM_LEASE_SECONDS) -> int:
+        """
+        Returns rows claimed more than lease_seconds ago and still in 'sending' to 'pending'.
+
+        Claims younger than the lease are left alone, so this is safe while other consumers are
+        running, as long as the lease is longer than a consumer takes to send one batch.
+        Re-sending a row cannot duplicate its post, because posts are written under
+        deterministic record keys.
+        """
+        async with self.pool.connection() as conn:
+            cur = await conn.execute(REQUEUE_STALE_SQL, (lease_seconds,))
+            return cur.rowcount
@@ -0,0 +1,152 @@
+# inbox_scanner.py
+'''
+Incremental polling of an alert folder, for inboxes on NFS (no inotify) and large backlogs.
+
+A scan costs one stat of the folder when nothing changed: the folder's mtime moves whenever a
+file is added, renamed or removed, so an unchanged mtime means there is nothing new. Otherwise
+the folder is walked lazily with os.scandir, and only entries not already handed out (by name
+and inode) are considered. At most page_size of them, oldest first, are kept while walking and
+returned; the rest are picked up by the next scan. A 100k-file backlog never sits in memory as
+a list, and scanning stays cheap while it drains.
+
+Files are ordered by the timestamp in their name (alert_20250530T041854Z...), which needs no
+stat; names without one fall back to their modification time.
+
+Directory mtimes can be coarse (1 second, or worse on some NFS servers), so a folder modified
+within `settle` seconds of the last scan is scanned again, and every full_rescan_interval the
+handed-out set is dropped and the folder is walked from scratch.
+
+forget() may be called from another thread while a scan runs (the pipeline parses and
+discovers in separate worker threads): the handed-out set is only swapped under a lock, and
+names forgotten during a walk are left out of the set the walk builds.
+'''
+
+__all__ = ["InboxScanner"]
+
+import heapq
+import os
+import re
+import threading
+import time
+from datetime import datetime, timezone
+from typing import List
+
+ALERT_TIMESTAMP = re.compile(r'\d{8}T\d{6}Z')
+
+class InboxScanner:
+    """
+    Returns new files of a folder, oldest first, a page at a time.
+
+    Attributes:
+        folder (str): The folder to poll.
+        prefix (str): Only names starting with this are returned.
+        page_size (int): Most names returned per scan.
+        settle (float): Seconds after a folder change during which it is scanned again anyway.
+        full_rescan_interval (float): Seconds between scans that forget what was handed out (0 never).
+        more (bool): Whether the last scan left new files for the next one.
+    """
+    def __init__(self, folder, prefix='alert_', page_size=1000, settle=2.0, full_rescan_interval=300):
+        self.folder = folder
+        self.prefix = prefix
+        self.page_size = page_size
+        self.settle = settle
+        self.full_rescan_interval = full_rescan_interval
+
+        self.seen = {}          # name -> inode of files handed out and still in the folder
+        self.more = False
+        self._mtime_ns = None
+        self._scanned_at = 0.0
+        self._full_scan_at = 0.0
+        self._dirty = True
+        self._lock = threading.Lock()
+        self._forgotten = set()     # Names forgotten since the current scan started
+
+    def forget(self, name):
+        """Hands a file out again on the next scan (e.g. it was still empty when read). Thread-safe."""
+        with self._lock:
+            self.seen.pop(name, None)
+            self._forgotten.add(name)
+            self._dirty = True
+
+    def _changed(self, st, now):
+        if self._dirty or self.more or st.st_mtime_ns != self._mtime_ns:
+            return True
+        # The folder changed so close to the last scan that a later change may share its mtime.
+        return self._scanned_at - st.st_mtime_ns / 1e9 < self.settle
+
+    @staticmethod
+    def _order_key(entry):
+        match = ALERT_TIMESTAMP.search(entry.name)
+        if match:
+            return match.group(0)
+        try:
+            mtime = entry.stat().st_mtime
+        except FileNotFoundError:
+            return None
+        return datetime.fromtimestamp(mtime, timezone.utc).strftime('%Y%m%dT%H%M%SZ')
+
+    def scan(self, now=None) -> List[str]:
+        """Returns up to page_size names not handed out before, oldest first."""
+        now = time.time() if now is None else now
+        try:
+            st = os.stat(self.folder)
+        except FileNotFoundError:
+            return []
+        with self._lock:
+            if self.full_rescan_interval and now - self._full_scan_at >= self.full_rescan_interval:
+                self.seen = {}
+                self._full_scan_at = now
+                self._dirty = True
+            if not self._changed(st, now):
+                return []
+            self._mtime_ns = st.st_mtime_ns
+            self._scanned_at = now
+            self._dirty = False
+            self._forgotten.clear()
+            seen = self.seen
+
+        # A max-heap (by negated order) of the oldest page_size new entries seen so far.
+        page = []
+        present = {}
+        overflow = False
+        with os.scandir(self.folder) as entries:
+            for entry in entries:
+                if not entry.name.startswith(self.prefix):
+                    continue
+                inode = entry.inode()
+                if seen.get(entry.name) == inode:
+                    present[entry.name] = inode
+                    continue
+                key = self._order_key(entry)
+                if key is None:
+                    continue  # Gone since the directory was read.
+                item = (_Reversed(key, entry.name), entry.name, inode)
+                if len(page) < self.page_size:
+                    heapq.heappush(page, item)
+                else:
+                    overflow = True
+                    heapq.heappushpop(page, item)
+
+        names = sorted((order.key, name, inode) for order, name, inode in page)
+        for _, name, inode in names:
+            present[name] = inode
+        with self._lock:
+            # A name forgotten during the walk must be handed out again, even if the walk kept it.
+            for name in self._forgotten:
+                present.pop(name, None)
+            self._forgotten.clear()
+            # Forget files that have left the folder, so the cache only holds what is still there.
+            self.seen = present
+            self.more = overflow
+        return [name for _, name, _ in names]
+
+class _Reversed:
+    """Orders (key, name) newest first, so heapq's min-heap keeps the oldest entries."""
+    __slots__ = ('key', 'name')
+
+    def __init__(self, key, name):
+        self.key = key
+        self.name = name
+
+    def __lt__(self, other):
+        return (self.key, self.name) > (other.key, other.name)
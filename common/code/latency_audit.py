@@ -0,0 +1,257 @@
+# latency_audit.py
+'''
+A per-alert latency audit trail, and a report over it.
+
+LatencyAudit appends one JSON line per finished alert to a daily file next to the sent alerts
+(inbox/sent/latency-2025-05-30.jsonl):
+
+    {"key": ..., "site": ..., "host": ..., "ok": true, "uri": "at://...",
+     "created_at": ..., "discovered_at": ..., "parsed_at": ..., "rendered_at": ..., "sent_at": ...}
+
+Times are UNIX seconds; created_at is the base station's own clock, the others are ours.
+sent_at is when the PDS answered the post.
+
+The report gives sensor-to-post latency (sent_at - created_at) percentiles by site, host or
+time window. A base station whose clock is off shows up in the gap between its created_at and
+our discovery time: a gap below -skew_tolerance means its clock runs ahead, and a smallest gap
+above slow_gap means it runs behind (or holds alerts back). Such sites are flagged, as their
+latencies can't be taken at face value.
+
+    python3 latency_audit.py report inbox/sent --by site --target 120
+    python3 latency_audit.py report inbox/sent --by window --window 3600 --since 2025-05-01
+'''
+
+__all__ = ["LatencyAudit", "load_records", "percentile", "summarize", "clock_skew"]
+
+import glob
+import json
+import math
+import os
+import time
+from datetime import datetime, timezone
+from typing import Dict, Iterable, List, Optional
+
+# Lifecycle stages, in order, as recorded by the pipeline.
+STAGES = ('discovered_at', 'parsed_at', 'rendered_at', 'sent_at')
+
+PERCENTILES = (50, 90, 95, 99)
+
+def site_name(alert) -> str:
+    """Returns the name alerts are grouped by: site_key, else site_uuid, else host/host_site_id."""
+    if alert.get('site_key'):
+        return str(alert.get('site_key'))
+    if alert.get('site_uuid') is not None:
+        return str(alert.get('site_uuid'))
+    if alert.get('host_site_id') is not None:
+        return f"{alert.get('host') or '?'}/{alert.get('host_site_id')}"
+    return 'unknown'
+
+class LatencyAudit:
+    """
+    Appends lifecycle records to daily JSON-lines files.
+
+    Attributes:
+        folder (str): Where the latency-YYYY-MM-DD.jsonl files go (e.g. inbox/sent).
+    """
+    def __init__(self, folder):
+        self.folder = folder
+        self._day = None
+        self._file = None
+
+    def _open(self, when):
+        day = datetime.fromtimestamp(when, timezone.utc).strftime('%Y-%m-%d')
+        if day != self._day:
+            self.close()
+            os.makedirs(self.folder, exist_ok=True)
+            self._file = open(os.path.join(self.folder, f"latency-{day}.jsonl"), 'a')
+            self._day = day
+        return self._file
+
+    def record(self, key, alert, stamps: Dict, ok, uri=None):
+        """
+        Writes one alert's record.
+
+        Args:
+            key: The alert's source key (file name, stream offset, row id).
+            alert: The AlertRecord (or mapping) that was sent.
+            stamps: {stage: UNIX time} for the stages in STAGES that were seen.
+            ok: Whether the post succeeded.
+            uri: The post's URI, when the notifier returned one.
+        """
+        sent_at = stamps.get('sent_at') or time.time()
+        created_at = alert.get('created_at') if alert is not None else None
+        entry = {
+            'key': str(key),
+            'site': site_name(alert) if alert is not None else 'unknown',
+            'host': (alert.get('host') or '') if alert is not None else '',
+            'ok': bool(ok),
+            'uri': uri,
+            'created_at': created_at.timestamp() if isinstance(created_at, datetime) else None,
+        }
+        for stage in STAGES:
+            value = stamps.get(stage)
+            entry[stage] = round(value, 3) if value is not None else None
+        entry['sent_at'] = round(sent_at, 3)
+        f = self._open(sent_at)
+        f.write(json.dumps(entry) + '\n')
+        f.flush()
+
+    def close(self):
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+            self._day = None
+
+def load_records(paths: Iterable[str], since=None, until=None) -> List[Dict]:
+    """
+    Reads audit records from files or folders (folders contribute their latency-*.jsonl files).
+
+    since/until are UNIX times that bound created_at (records without one are bounded by sent_at).
+    """
+    files = []
+    for path in paths:
+        if os.path.isdir(path):
+            files.extend(sorted(glob.glob(os.path.join(path, 'latency-*.jsonl'))))
+        else:
+            files.append(path)
+
+    records = []
+    for path in files:
+        with open(path, 'r') as f:
+            for line in f:
+                try:
+                    record = json.loads(line)
+                except ValueError:
+                    continue
+                when = record.get('created_at') or record.get('sent_at')
+                if when is None or (since is not None and when < since) or (until is not None and when >= until):
+                    continue
+                records.append(record)
+    return records
+
+def percentile(values: List[float], pct) -> Optional[float]:
+    """Nearest-rank percentile of sorted values (None for no values)."""
+    if not values:
+        return None
+    rank = max(1, math.ceil(pct / 100 * len(values)))
+    return values[rank - 1]
+
+def clock_skew(records: List[Dict], skew_tolerance=5.0, slow_gap=900.0) -> Dict[str, str]:
+    """
+    Returns {site: reason} for sites whose base-station clock looks wrong.
+
+    The gap between a site's created_at and our discovery can't be negative, and its smallest
+    value is close to zero for a station that hands alerts over promptly.
+    """
+    gaps = {}
+    for record in records:
+        created, discovered = record.get('created_at'), record.get('discovered_at')
+        if created is not None and discovered is not None:
+            gaps.setdefault(record['site'], []).append(discovered - created)
+
+    flagged = {}
+    for site, values in gaps.items():
+        smallest = min(values)
+        if smallest < -skew_tolerance:
+            flagged[site] = f"clock ahead by at least {-smallest:.0f}s"
+        elif smallest > slow_gap:
+            flagged[site] = f"clock behind (or alerts held) by at least {smallest:.0f}s"
+    return flagged
+
+def _group_key(record, by, window):
+    if by == 'site':
+        return record['site']
+    if by == 'host':
+        return record.get('host') or '?'
+    when = record.get('created_at') or record['sent_at']
+    start = when - when % window
+    return datetime.fromtimestamp(start, timezone.utc).strftime('%Y-%m-%d %H:%M')
+
+def summarize(records: List[Dict], by='site', window=3600, target=None, exclude_sites=()) -> List[Dict]:
+    """
+    Returns one row per group (plus 'all'): count, failures, latency percentiles and max, and
+    the share within `target` seconds when a target is given.
+
+    Sites in exclude_sites (e.g. those clock_skew() flags) still get their own rows, but are
+    left out of 'all'.
+    """
+    groups = {}
+    for record in records:
+        groups.setdefault(_group_key(record, by, window), []).append(record)
+    groups = dict(sorted(groups.items()))
+    groups['all'] = [record for record in records if record['site'] not in exclude_sites]
+
+    rows = []
+    for name, group in groups.items():
+        latencies = sorted(r['sent_at'] - r['created_at'] for r in group
+                           if r.get('ok') and r.get('created_at') is not None)
+        row = {'group': name, 'count': len(group), 'failed': sum(1 for r in group if not r.get('ok'))}
+        for pct in PERCENTILES:
+            row[f"p{pct}"] = percentile(latencies, pct)
+        row['max'] = latencies[-1] if latencies else None
+        if target is not None:
+            row['within'] = (sum(1 for value in latencies if value <= target) / len(latencies)) if latencies else None
+        rows.append(row)
+    return rows
+
+def _parse_when(value):
+    when = datetime.fromisoformat(value)
+    if when.tzinfo is None:
+        when = when.replace(tzinfo=timezone.utc)
+    return when.timestamp()
+
+def main():
+    """
+    Reports sensor-to-post latency from the audit files.
+
+        python3 latency_audit.py report inbox/sent --by site --target 120
+    """
+    import argparse
+
+    parser = argparse.ArgumentParser(description="Sensor-to-post latency report from the latency audit files.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    report_parser = subparsers.add_parser('report', help='Latency percentiles by site, host or time window')
+    report_parser.add_argument('paths', nargs='+', help='Audit files, or folders of latency-*.jsonl files (e.g. inbox/sent)')
+    report_parser.add_argument('--by', choices=('site', 'host', 'window'), default='site', help='Grouping (default site)')
+    report_parser.add_argument('--window', type=float, default=3600, help='Window length in seconds for --by window (default 3600)')
+    report_parser.add_argument('--since', help='Only alerts created at or after this time (ISO 8601, UTC if no zone)')
+    report_parser.add_argument('--until', help='Only alerts created before this time')
+    report_parser.add_argument('--target', type=float, help='Latency target in seconds; adds the share of alerts within it')
+    report_parser.add_argument('--skew-tolerance', type=float, default=5, help='Seconds a station clock may run ahead before it is flagged (default 5)')
+    report_parser.add_argument('--slow-gap', type=float, default=900, help='Smallest creation-to-discovery gap that flags a station as behind (default 900)')
+    report_parser.add_argument('--json', action='store_true', help='Print JSON instead of a table')
+
+    args = parser.parse_args()
+
+    records = load_records(args.paths,
+                           since=_parse_when(args.since) if args.since else None,
+                           until=_parse_when(args.until) if args.until else None)
+    skewed = clock_skew(records, args.skew_tolerance, args.slow_gap)
+    rows = summarize(records, by=args.by, window=args.window, target=args.target, exclude_sites=skewed)
+
+    if args.json:
+        print(json.dumps({'rows': rows, 'skewed_sites': skewed}, indent=2))
+        return
+
+    def seconds(value):
+        return '-' if value is None else f"{value:.1f}"
+
+    columns = ['count', 'failed'] + [f"p{pct}" for pct in PERCENTILES] + ['max'] + (['within'] if args.target is not None else [])
+    width = max([len(str(row['group'])) for row in rows] + [5]) + 2
+    print(f"{args.by:<{width}}" + "".join(f"{column:>9}" for column in columns))
+    for row in rows:
+        cells = [f"{row['count']:>9}", f"{row['failed']:>9}"]
+        cells += [f"{seconds(row[column]):>9}" for column in columns[2:] if column != 'within']
+        if args.target is not None:
+            cells.append(f"{'-' if row['within'] is None else format(row['within'], '.1%'):>9}")
+        flag = ' *' if args.by == 'site' and row['group'] in skewed else ''
+        print(f"{str(row['group']):<{width}}" + "".join(cells) + flag)
+
+    if skewed:
+        print("\nSites with suspect clocks (their latencies are unreliable and left out of 'all'):")
+        for site, reason in sorted(skewed.items()):
+            print(f"  {site}: {reason}")
+
+if __name__ == "__main__":
+    main()
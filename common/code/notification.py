@@ -0,0 +1,375 @@
+# notification.py
+'''
+The notification channels an alert can be sent through: Bluesky, email (and an SMS stub).
+
+Kept out of trigger_notify.py, which loads yaml, dotenv and the inbox machinery when imported,
+so that the one-shot trigger can post an alert with only what posting needs. Network and
+SMTP clients are imported when a notifier is made.
+'''
+
+__all__ = ["Notification", "SMSNotification", "EMailNotification", "BlueskyNotification"]
+
+import asyncio
+import os
+import sys
+
+from alert_model import validate_alert
+from bluesky_message import build_message as build_bluesky_message
+from sent_cache import alert_fingerprint
+
+class Notification:
+    """
+    Base class for sending notifications. Subclasses will implement specific
+    methods for sending notifications through different channels.
+    """
+    def send_notification(self, message, alert_json=None):
+        raise NotImplementedError("Subclasses must implement send_notification")
+    
+    def build_message(self):
+        raise NotImplementedError("Subclasses must implement build_message")
+
+class SMSNotification(Notification):
+    def send_notification(self, message, alert_json=None):
+        pass
+
+class EMailNotification(Notification):
+    """
+    Sends notifications by email to a subscriber list, over a pool of SMTP connections.
+
+    Each alert's message is rendered to MIME once and delivered in envelopes of up to
+    SMTP_MAX_RECIPIENTS, so subscribers never see each other's addresses (see smtp_pool).
+    Subscribers come from EMAIL_SUBSCRIBERS (comma separated) and/or EMAIL_SUBSCRIBERS_FILE
+    (one address per line), and the sender from SMTP_FROM.
+    """
+    def __init__(self, subscribers=None, sender=None, pool=None):
+        from smtp_pool import SMTPPool, smtp_settings_from_env
+        self.pool = pool or SMTPPool(**smtp_settings_from_env())
+        self.sender = sender or os.getenv("SMTP_FROM") or self.pool.username
+        self.subscribers = list(subscribers) if subscribers is not None else self.subscribers_from_env()
+        if not self.sender:
+            raise ValueError("An email sender must be set (SMTP_FROM).")
+        if not self.subscribers:
+            raise ValueError("Email subscribers must be set (EMAIL_SUBSCRIBERS or EMAIL_SUBSCRIBERS_FILE).")
+
+    @staticmethod
+    def subscribers_from_env():
+        subscribers = [address for address in os.getenv("EMAIL_SUBSCRIBERS", "").split(',') if address.strip()]
+        path = os.getenv("EMAIL_SUBSCRIBERS_FILE")
+        if path:
+            with open(path, 'r') as f:
+                subscribers += [line.strip() for line in f if line.strip() and not line.startswith('#')]
+        return subscribers
+
+    @staticmethod
+    def build_message(alert_json):
+        """
+        Creates the email body from an alert. There is no length limit, so nothing is truncated.
+        """
+        alert = validate_alert(alert_json)
+        lines = [
+            alert.message,
+            "",
+            f"Generated by: {alert.host or 'Unknown host'} at {alert.created_at.strftime('%Y-%m-%d %H:%M:%S UTC')}",
+            f"Site ID: {'N/A' if alert.host_site_id is None else alert.host_site_id}, "
+            f"Sensor ID: {'N/A' if alert.host_sensor_id is None else alert.host_sensor_id}",
+        ]
+        if alert.site_lat is not None and alert.site_long is not None:
+            lines.append(f"Location: {alert.site_lat:.5f}, {alert.site_long:.5f}")
+        if alert.tags:
+            lines.append(' '.join('#' + tag for tag in alert.tags))
+        return '\n'.join(lines)
+
+    def render(self, message, alert_json=None) -> bytes:
+        """Returns the MIME message for an alert, serialized once for every recipient."""
+        from email.message import EmailMessage
+        from email.utils import formatdate, make_msgid
+
+        subject = message.strip().splitlines()[0] if message.strip() else "Alert"
+        if alert_json is not None:
+            severity = validate_alert(alert_json).severity
+            if severity is not None:
+                subject = f"[{str(severity).upper()}] {subject}"
+        mime = EmailMessage()
+        mime['From'] = self.sender
+        # Recipients are only in the envelopes; the header doesn't list them.
+        mime['To'] = "undisclosed-recipients:;"
+        mime['Subject'] = subject[:120]
+        mime['Date'] = formatdate(usegmt=True)
+        mime['Message-ID'] = make_msgid(domain=self.sender.rpartition('@')[2] or None)
+        mime.set_content(message)
+        return mime.as_bytes()
+
+    def send_notification(self, message, alert_json=None):
+        result = asyncio.run(self._run_and_close(self.send_notification_async(message, alert_json)))
+        print(f"Email notification sent to {result['accepted']} subscribers")
+
+    async def _run_and_close(self, coro):
+        try:
+            return await coro
+        finally:
+            await self.close_async()
+
+    async def close_async(self):
+        await self.pool.close()
+
+    async def send_notification_async(self, message, alert_json=None, embed=None, render=True):
+        """
+        Emails the message to every subscriber.
+
+        embed and render are accepted for the pipeline's sake (see BlueskyNotification) and ignored:
+        emails carry no embeds.
+
+        Returns:
+            {"accepted", "refused", "failed"} (see SMTPPool.deliver).
+
+        Raises:
+            Exception: No subscriber accepted the message.
+        """
+        result = await self.pool.deliver(self.sender, self.subscribers, self.render(message, alert_json))
+        for recipient, reason in {**result['refused'], **result['failed']}.items():
+            print(f"Email to {recipient} failed: {reason}")
+        if result['accepted'] == 0:
+            raise Exception(f"Email not delivered to any of {len(self.subscribers)} subscribers")
+        return result
+
+class BlueskyNotification(Notification):
+    """
+    Sends notifications via Bluesky using the BlueskyPoster.
+    """
+    # Optional DaemonProfiler; the send loop is attached so task dumps can see it.
+    profiler = None
+
+    def __init__(self, pds_url=None, handle=None, password=None, chart_renderer=None, router=None):
+        # The account defaults come from BLUESKY_* in .env.local, read when the notifier is made
+        # (after the daemon or the one-shot trigger has loaded the file).
+        pds_url = pds_url or os.getenv("BLUESKY_PDS_URL")
+        handle = handle or os.getenv("BLUESKY_HANDLE")
+        password = password or os.getenv("BLUESKY_PASSWORD")
+        # Optional AccountRouter; alerts it routes post through their own account, the rest through the .env one.
+        self.router = router
+        self.poster = None
+        if all([pds_url, handle, password]):
+            # Imported here so that paths which never post (e.g. a dry run) don't load aiohttp.
+            from bluesky_poster import BlueskyPoster
+            self.poster = BlueskyPoster(pds_url, handle, password)
+        elif router is None or router.default is None:
+            raise ValueError("Bluesky PDS URL, handle, and password must be set in the .env file.")
+        # Optional RainChartRenderer; alerts carrying a 'rain' mapping get a chart attached.
+        self.chart_renderer = chart_renderer
+        # Optional RainStore; alerts with a site_key but no 'rain' mapping are charted from its latest report.
+        self.rain_store = None
+        # Optional SentCache of recently sent alert fingerprints, to skip repeats locally.
+        self.sent_cache = None
+
+    @staticmethod
+    def build_message(alert_json):
+        """
+        Creates a Bluesky message string from an alert (see bluesky_message.build_message).
+
+        Returns:
+            FacetedText: The formatted Bluesky message (a str carrying its facet spans).
+        """
+        return build_bluesky_message(alert_json)
+
+    def send_notification(self, message, alert_json=None):
+        try:
+            # Run the asynchronous send using asyncio.run
+            asyncio.run(self._run_and_close(self.send_notification_async(message, alert_json)))
+            print(f"Bluesky notification sent: {message}")
+        except Exception as e:
+            raise Exception(f"Error sending Bluesky notification: {e}")
+
+    async def _run_and_close(self, coro):
+        """Runs a send, then closes the connection pools bound to this asyncio.run() loop."""
+        try:
+            return await coro
+        finally:
+            await self.close_async()
+
+    async def close_async(self):
+        """Closes the connection pools of every poster (they reopen on the next send)."""
+        posters = [self.poster] if self.poster is not None else []
+        if self.router is not None:
+            posters += list(self.router.posters.values())
+        await asyncio.gather(*[poster.close() for poster in posters], return_exceptions=True)
+
+    def poster_for(self, alert_json=None):
+        """
+        Returns the BlueskyPoster an alert posts through: its routed account, else the .env account.
+
+        Raises:
+            ValueError: No route matches the alert and there is no .env account.
+        """
+        if self.router is not None and alert_json is not None:
+            poster = self.router.poster_for(alert_json)
+            if poster is not None:
+                return poster
+        if self.poster is None:
+            raise ValueError("No account is routed for this alert and no default account is set")
+        return self.poster
+
+    def poster_config(self, poster=None):
+        """Returns the configuration dictionary BlueskyPoster methods expect, for a poster's account."""
+        poster = poster or self.poster
+        config = {}
+        config['handle'] = poster.handle
+        config['password'] = poster.password
+        config['pds_url'] = poster.pds_url
+        config['media_folder'] = ''
+
+        if not (config['handle'] and config['password']):
+            print("both handle and password are required", file=sys.stderr)
+            sys.exit(-1)
+        return config
+
+    def idempotency_key(self, message, alert_json=None):
+        """
+        Returns the (fingerprint, record key) pair for an alert.
+
+        The fingerprint is a hash of the alert's content (the message text when there is no alert),
+        and the record key derived from it makes a retried post overwrite the first one.
+        """
+        from bluesky_poster import deterministic_rkey
+
+        if alert_json is None:
+            return alert_fingerprint(message), deterministic_rkey(alert_fingerprint(message))
+        alert = validate_alert(alert_json)
+        fingerprint = alert_fingerprint(alert.to_dict())
+        return fingerprint, deterministic_rkey(fingerprint, alert.created_at)
+
+    async def send_notification_async(self, message, alert_json=None, embed=None, render=True):
+        """
+        Posts the message, attaching a rain chart when a chart renderer is configured and the alert has rain data.
+
+        Alerts already in the sent cache are skipped without any network call.
+
+        Args:
+            message: The post text.
+            alert_json: The alert the message was built from.
+            embed: An embed prepared earlier (see prepare_embed_async).
+            render: If False, `embed` is used as is, instead of rendering a chart here.
+        """
+        if self.profiler is not None:
+            self.profiler.attach_loop()
+
+        fingerprint, rkey = self.idempotency_key(message, alert_json)
+        if self.sent_cache is not None and fingerprint in self.sent_cache:
+            print(f"Skipping alert already sent as {self.sent_cache.get(fingerprint)}")
+            return {"uri": self.sent_cache.get(fingerprint), "duplicate": True}
+
+        if self.router is not None:
+            await self.router.evict_idle()
+        poster = self.poster_for(alert_json)
+        config = self.poster_config(poster)
+
+        if render and embed is None and self.chart_renderer is not None and alert_json is not None:
+            embed = await self.build_chart_embed(config, alert_json, poster)
+
+        result = await poster.create_post(config, message, embed=embed, rkey=rkey)
+        if result is None:
+            raise Exception("Authentication failed")
+        if self.sent_cache is not None:
+            self.sent_cache.add(fingerprint, result.get("uri"))
+        return result
+
+    def send_notifications(self, messages):
+        """
+        Posts many messages with as few requests as possible (see BlueskyPoster.create_posts).
+
+        With an account router, each account's messages go out as their own batch, and the
+        accounts post in parallel.
+
+        Args:
+            messages: A list of (message, alert_json) tuples, or (message, alert_json, embed) tuples
+                whose embeds were prepared earlier (see prepare_embed_async).
+
+        Returns:
+            One result dictionary per message, in order, with "ok" and "error" keys.
+        """
+        return asyncio.run(self._run_and_close(self.send_notifications_async(messages)))
+
+    async def send_notifications_async(self, messages):
+        if self.profiler is not None:
+            self.profiler.attach_loop()
+
+        results = [None] * len(messages)
+        pending = []
+        for i, item in enumerate(messages):
+            message, alert_json = item[0], item[1]
+            fingerprint, rkey = self.idempotency_key(message, alert_json)
+            if self.sent_cache is not None and fingerprint in self.sent_cache:
+                results[i] = {"ok": True, "uri": self.sent_cache.get(fingerprint), "cid": None, "error": None, "duplicate": True}
+            else:
+                pending.append((i, item, fingerprint, rkey))
+        if not pending:
+            return results
+
+        if self.router is not None:
+            await self.router.evict_idle()
+        by_poster = {}
+        for entry in pending:
+            i, item = entry[0], entry[1]
+            try:
+                poster = self.poster_for(item[1])
+            except ValueError as e:
+                results[i] = {"ok": False, "uri": None, "cid": None, "error": f"{e}"}
+                continue
+            by_poster.setdefault(poster, []).append(entry)
+
+        async def post_account(poster, entries):
+            config = self.poster_config(poster)
+
+            async def embed_for(item):
+                if len(item) > 2:
+                    return item[2]
+                if self.chart_renderer is None or item[1] is None:
+                    return None
+                return await self.build_chart_embed(config, item[1], poster)
+
+            embeds = await asyncio.gather(*[embed_for(item) for _, item, _, _ in entries])
+            items = [(item[0], embed, rkey) for (_, item, _, rkey), embed in zip(entries, embeds)]
+            return await poster.create_posts(config, items)
+
+        outcomes = await asyncio.gather(*[post_account(poster, entries) for poster, entries in by_poster.items()])
+        for entries, account_results in zip(by_poster.values(), outcomes):
+            for (i, _, fingerprint, _), result in zip(entries, account_results):
+                results[i] = result
+                if result["ok"] and self.sent_cache is not None:
+                    self.sent_cache.add(fingerprint, result.get("uri"))
+        return results
+
+    async def prepare_embed_async(self, alert_json):
+        """Returns the embed to attach to an alert's post (a rain chart), or None."""
+        if self.chart_renderer is None or alert_json is None:
+            return None
+        poster = self.poster_for(alert_json)
+        return await self.build_chart_embed(self.poster_config(poster), alert_json, poster)
+
+    async def build_chart_embed(self, config, alert_json, poster=None):
+        """
+        Renders the alert's rain chart and uploads it, returning an images embed or None.
+
+        The chart is uploaded through `poster` (default: the .env account's), which must be the
+        poster that makes the post: a blob belongs to the repository it was uploaded to.
+        A chart that fails to render or upload never blocks the text post.
+        """
+        poster = poster or self.poster
+        try:
+            alert = validate_alert(alert_json)
+            report = {'rain': alert.rain} if alert.rain is not None else None
+            if report is None and self.rain_store is not None and alert.site_key:
+                report = self.rain_store.latest(alert.site_key)
+            if report is None:
+                return None
+            png = await self.chart_renderer.render(report)
+            if png is None:
+                return None
+            if await poster.get_or_create_session() is None:
+                return None
+            blob = await poster.upload_image_bytes(config, png, "image/png")
+        except Exception as e:
+            print(f"Error rendering rain chart: {e}")
+            return None
+        if blob is None:
+            return None
+        return poster.images_embed([(blob, "Rain accumulation by window, 15 minutes to 30 days.")])
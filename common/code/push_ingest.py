@@ -0,0 +1,174 @@
+# push_ingest.py
+'''
+Lets co-located producers push alerts to the daemon instead of leaving files or rows to be found.
+
+The daemon listens on a Unix domain socket and/or a loopback HTTP port:
+
+    POST /alerts    A body of one alert mapping, a list of them, or {"alerts": [...]}, as JSON
+                    (or YAML, with a yaml Content-Type). Answers 202 once the valid alerts are
+                    durably enqueued (fsynced into the source), with one result per alert.
+    GET  /health    Pipeline queue depths and counters.
+
+Pushed alerts are validated like any other, then written through the alert source's enqueue()
+(alert files for FileAlert, appended lines for StreamAlert), so they survive a crash after the
+acknowledgement and take the same path through the pipeline. The pipeline is woken at once
+instead of at its next poll.
+
+    curl --unix-socket inbox/alerts.sock -H 'Content-Type: application/json' \
+         -d '{"message": "Heavy rain at Gross Dam", "host": "north-1"}' http://localhost/alerts
+'''
+
+__all__ = ["PushIngest"]
+
+import asyncio
+import ipaddress
+import json
+import os
+
+import yaml
+from aiohttp import web
+
+from alert_model import AlertValidationError, load_alert_yaml, validate_alert
+from alert_writer import AlertWriteError
+
+LOOPBACK_NAMES = ('localhost',)
+
+def _is_loopback(host):
+    if host in LOOPBACK_NAMES:
+        return True
+    try:
+        return ipaddress.ip_address(host).is_loopback
+    except ValueError:
+        return False
+
+class PushIngest:
+    """
+    A small aiohttp server feeding pushed alerts into an alert source.
+
+    Attributes:
+        source: The alert source; it needs enqueue(alerts).
+        pipeline (AlertPipeline): Woken after each accepted batch (optional).
+        socket_path (str): Unix domain socket to listen on (optional).
+        host, port: Loopback address to listen on (optional; only loopback hosts are accepted).
+        max_batch (int): Most alerts per request.
+        max_body (int): Largest request body, in bytes.
+    """
+    def __init__(self, source, pipeline=None, socket_path=None, host='127.0.0.1', port=None,
+                 max_batch=500, max_body=1024 * 1024):
+        if socket_path is None and port is None:
+            raise ValueError("Push ingest needs a socket path or a port")
+        if port is not None and not _is_loopback(host):
+            raise ValueError(f"Push ingest only listens on loopback addresses, not '{host}'")
+        self.source = source
+        self.pipeline = pipeline
+        self.socket_path = socket_path
+        self.host = host
+        self.port = port
+        self.max_batch = max_batch
+        self.max_body = max_body
+        self.counts = {'accepted': 0, 'rejected': 0}
+        self.runner = None
+
+    async def start(self):
+        app = web.Application(client_max_size=self.max_body)
+        app.router.add_post('/alerts', self.handle_alerts)
+        app.router.add_get('/health', self.handle_health)
+        self.runner = web.AppRunner(app, access_log=None)
+        await self.runner.setup()
+
+        if self.socket_path:
+            if os.path.exists(self.socket_path):
+                os.remove(self.socket_path)  # Left behind by a daemon that didn't shut down cleanly.
+            await web.UnixSite(self.runner, self.socket_path).start()
+            os.chmod(self.socket_path, 0o660)
+            print(f"Accepting pushed alerts on {self.socket_path}")
+        if self.port is not None:
+            await web.TCPSite(self.runner, self.host, self.port).start()
+            print(f"Accepting pushed alerts on http://{self.host}:{self.port}/alerts")
+
+    async def stop(self):
+        if self.runner is not None:
+            await self.runner.cleanup()
+            self.runner = None
+        if self.socket_path and os.path.exists(self.socket_path):
+            os.remove(self.socket_path)
+
+    @staticmethod
+    def parse_body(text, content_type=''):
+        """
+        Returns the alert mappings in a request body.
+
+        Raises:
+            ValueError: The body is not JSON/YAML, or not a mapping, a list or {"alerts": [...]}.
+        """
+        if 'yaml' in content_type:
+            try:
+                data = load_alert_yaml(text)
+            except yaml.YAMLError as e:
+                raise ValueError(f"Unreadable YAML: {e}") from None
+        else:
+            try:
+                data = json.loads(text)
+            except ValueError as e:
+                raise ValueError(f"Unreadable JSON: {e}") from None
+        if isinstance(data, dict) and isinstance(data.get('alerts'), list):
+            data = data['alerts']
+        if isinstance(data, dict):
+            return [data]
+        if isinstance(data, list):
+            return data
+        raise ValueError("Send an alert mapping, a list of alerts, or {\"alerts\": [...]}")
+
+    async def handle_alerts(self, request):
+        try:
+            alerts = self.parse_body(await request.text(), request.content_type)
+        except ValueError as e:
+            return web.json_response({'error': f"{e}"}, status=400)
+        if not alerts:
+            return web.json_response({'error': "No alerts"}, status=400)
+        if len(alerts) > self.max_batch:
+            return web.json_response({'error': f"At most {self.max_batch} alerts per request"}, status=413)
+
+        results = []
+        accepted = []
+        for alert_json in alerts:
+            try:
+                validate_alert(alert_json)
+            except AlertValidationError as e:
+                results.append({'ok': False, 'error': f"{e}"})
+                continue
+            results.append({'ok': True, 'error': None})
+            accepted.append(alert_json)
+
+        published = len(accepted)
+        if accepted:
+            try:
+                await asyncio.to_thread(self.source.enqueue, accepted)
+            except AlertWriteError as e:
+                # Part of the batch was published; only the rest should be sent again.
+                print(f"Error enqueueing pushed alerts: {e}")
+                failed = iter([name in e.failed for name in e.names])
+                for result in results:
+                    if result['ok'] and next(failed):
+                        result.update(ok=False, error="Could not enqueue")
+                published = len(e.names) - len(e.failed)
+                if not published:
+                    return web.json_response({'error': f"Could not enqueue: {e}", 'results': results}, status=503)
+            except OSError as e:
+                print(f"Error enqueueing {len(accepted)} pushed alerts: {e}")
+                return web.json_response({'error': f"Could not enqueue: {e}"}, status=503)
+            if self.pipeline is not None:
+                self.pipeline.wake()
+
+        self.counts['accepted'] += published
+        self.counts['rejected'] += len(alerts) - published
+        status = 202 if published else 422
+        return web.json_response({'accepted': published, 'results': results}, status=status)
+
+    async def handle_health(self, request):
+        body = {'ingest': self.counts}
+        if self.pipeline is not None:
+            body['pipeline'] = {name: list(value) if isinstance(value, tuple) else value
+                                for name, value in self.pipeline.depths().items()}
+            body['counts'] = self.pipeline.counts
+        return web.json_response(body)
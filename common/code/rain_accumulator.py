@@ -0,0 +1,225 @@
+# rain_accumulator.py
+'''
+Computes the m15 ... d30 rain accumulations from raw tipping-bucket increments.
+
+Each site keeps a ring of per-interval totals covering the longest window (30 days) and
+a running sum per window. A new sample adds to its bucket and to the sums of the windows
+that contain it; moving time forward subtracts the buckets that fall out of each window.
+Nothing is ever re-summed, so the cost per sample stays flat however long the windows are.
+
+Amounts are kept as integers (1/10000 inch by default), so the running sums never drift.
+'''
+
+__all__ = ["SiteAccumulator", "RainAccumulator"]
+
+from array import array
+from datetime import datetime, timezone
+from typing import Dict, Iterable, Optional
+
+from rain_report import RAIN_WINDOWS, WINDOW_SECONDS
+
+# Integer units per inch (or per whatever unit the gauges report).
+AMOUNT_SCALE = 10000
+
+def _epoch_seconds(value) -> float:
+    """Converts a datetime, ISO 8601 string or number to epoch seconds (naive times are UTC)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return value.timestamp()
+    raise ValueError(f"Unsupported timestamp: {value!r}")
+
+class SiteAccumulator:
+    """
+    Rolling window sums for one site.
+
+    Windows end at the newest bucket seen (or the time passed to advance()), and a window of
+    N buckets covers that bucket and the N - 1 before it.
+
+    Attributes:
+        resolution (int): Bucket width in seconds; every window length must be a multiple of it.
+    """
+    __slots__ = ('resolution', 'size', 'window_buckets', 'buckets', 'sums', 'seen', 'head')
+
+    def __init__(self, resolution=60):
+        for window in RAIN_WINDOWS:
+            if WINDOW_SECONDS[window] % resolution:
+                raise ValueError(f"Resolution {resolution}s does not divide the {window} window")
+        self.resolution = resolution
+        self.window_buckets = [WINDOW_SECONDS[window] // resolution for window in RAIN_WINDOWS]
+        self.size = max(self.window_buckets)
+        self.buckets = array('q', bytes(8 * self.size))
+        self.sums = [0] * len(RAIN_WINDOWS)
+        # Absolute bucket -> sample keys seen in it, for duplicate detection; dropped as buckets expire.
+        self.seen = {}
+        self.head = None
+
+    def advance(self, bucket):
+        """Moves the window end forward to `bucket`, expiring what falls out of each window."""
+        if self.head is None:
+            self.head = bucket
+            return
+        steps = bucket - self.head
+        if steps <= 0:
+            return
+
+        if steps >= self.size:
+            # Everything has expired.
+            self.buckets = array('q', bytes(8 * self.size))
+            self.sums = [0] * len(self.sums)
+            self.seen.clear()
+            self.head = bucket
+            return
+
+        buckets, size = self.buckets, self.size
+        for w, count in enumerate(self.window_buckets):
+            if steps >= count:
+                self.sums[w] = 0
+            else:
+                leaving = 0
+                for b in range(self.head - count + 1, bucket - count + 1):
+                    leaving += buckets[b % size]
+                self.sums[w] -= leaving
+
+        # The slots for the new buckets held the oldest buckets of the ring.
+        for b in range(self.head + 1, bucket + 1):
+            buckets[b % size] = 0
+            self.seen.pop(b - size, None)
+        self.head = bucket
+
+    def add(self, t, amount, sample_id=None):
+        """
+        Adds one increment at time t (epoch seconds).
+
+        Samples older than the longest window are dropped; out-of-order samples inside it are
+        added to their own bucket and to the windows that cover it. A repeat of a sample
+        (same sample_id, or same time and amount when there is no ID) is ignored.
+
+        Returns:
+            True if the sample was counted.
+        """
+        bucket = int(t // self.resolution)
+        units = int(round(amount * AMOUNT_SCALE))
+        if self.head is None or bucket > self.head:
+            self.advance(bucket)
+        age = self.head - bucket
+        if age >= self.size:
+            return False
+
+        key = sample_id if sample_id is not None else (t, units)
+        seen = self.seen.get(bucket)
+        if seen is None:
+            seen = self.seen[bucket] = set()
+        elif key in seen:
+            return False
+        seen.add(key)
+
+        self.buckets[bucket % self.size] += units
+        for w, count in enumerate(self.window_buckets):
+            if age < count:
+                self.sums[w] += units
+        return True
+
+    def totals(self) -> Dict[str, float]:
+        """Returns the current sum of every window, in RAIN_WINDOWS order."""
+        return {window: total / AMOUNT_SCALE for window, total in zip(RAIN_WINDOWS, self.sums)}
+
+class RainAccumulator:
+    """
+    Rolling accumulations for many sites.
+
+    Attributes:
+        resolution (int): Bucket width in seconds. Memory per site is 8 bytes per bucket over
+            30 days: about 350 KB at 60 s, 70 KB at 300 s.
+    """
+    def __init__(self, resolution=60):
+        self.resolution = resolution
+        self.sites = {}
+
+    def add_sample(self, site_key, t, amount, sample_id=None):
+        """Adds one tipping-bucket increment for a site; returns True if it was counted."""
+        site = self.sites.get(site_key)
+        if site is None:
+            site = self.sites[site_key] = SiteAccumulator(self.resolution)
+        return site.add(_epoch_seconds(t), float(amount), sample_id)
+
+    def add_samples(self, samples: Iterable[Dict]):
+        """
+        Adds samples shaped like {"site_key", "time", "amount", optional "sample_id"}.
+
+        Returns:
+            The number of samples counted.
+        """
+        counted = 0
+        for sample in samples:
+            counted += self.add_sample(sample['site_key'], sample['time'], sample['amount'], sample.get('sample_id'))
+        return counted
+
+    def report(self, site_key, now=None) -> Optional[Dict]:
+        """
+        Returns a site's accumulations in the rain_intensity.json shape, or None for an unknown site.
+
+        Args:
+            site_key: The site.
+            now: Optional current time; windows are first moved forward to it, so a site that
+                stopped reporting decays to zero instead of holding its last totals.
+        """
+        site = self.sites.get(site_key)
+        if site is None:
+            return None
+        if now is not None:
+            site.advance(int(_epoch_seconds(now) // self.resolution))
+        end = (site.head + 1) * self.resolution
+        return {
+            'site_key': site_key,
+            'created_at': datetime.fromtimestamp(end, timezone.utc).isoformat(),
+            'rain': site.totals(),
+        }
+
+    def reports(self, now=None):
+        """Returns a report for every site."""
+        return [self.report(site_key, now) for site_key in self.sites]
+
+def main():
+    """
+    Replays raw samples (JSON lines of {"site_key", "time", "amount"}) and prints reports as JSON lines.
+
+        python3 rain_accumulator.py samples.jsonl --every 300 > reports.jsonl
+    """
+    import argparse
+    import json
+    import sys
+
+    parser = argparse.ArgumentParser(description="Compute m15 ... d30 rain accumulations from raw increments.")
+    parser.add_argument("files", nargs="*", help="JSON-lines sample files (default: stdin)")
+    parser.add_argument("--resolution", type=int, default=60, help="Bucket width in seconds (default 60)")
+    parser.add_argument("--every", type=float, default=0, help="Also print reports every N seconds of sample time")
+    args = parser.parse_args()
+
+    accumulator = RainAccumulator(args.resolution)
+    next_report = None
+    latest = None
+    streams = [open(path, "r") for path in args.files] if args.files else [sys.stdin]
+    for stream in streams:
+        for line in stream:
+            if not line.strip():
+                continue
+            sample = json.loads(line)
+            t = _epoch_seconds(sample['time'])
+            accumulator.add_sample(sample['site_key'], t, sample['amount'], sample.get('sample_id'))
+            latest = t if latest is None else max(latest, t)
+            if args.every:
+                next_report = next_report or latest + args.every
+                if latest >= next_report:
+                    for report in accumulator.reports(now=next_report):
+                        print(json.dumps(report))
+                    next_report += args.every
+    for report in accumulator.reports(now=latest):
+        print(json.dumps(report))
+
+if __name__ == "__main__":
+    main()
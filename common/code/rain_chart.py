@@ -0,0 +1,207 @@
+# rain_chart.py
+'''
+Renders a compact accumulation bar chart (PNG) from the m15 ... d30 windows of a rain report.
+
+The PNG is encoded by hand (palette image + zlib) so worker processes only need the standard library.
+'''
+
+__all__ = ["chart_key", "render_rain_chart", "RainChartRenderer"]
+
+import asyncio
+import struct
+import zlib
+from collections import OrderedDict
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, Optional, Sequence, Tuple
+
+from bluesky_limits import MAX_IMAGE_BYTES
+from rain_report import RAIN_WINDOWS, rain_values
+
+# Palette: background, text, bars, axis.
+PALETTE = bytes([255, 255, 255,  33, 37, 41,  30, 110, 200,  160, 160, 160])
+BACKGROUND, TEXT, BAR, AXIS = 0, 1, 2, 3
+
+SLOT_WIDTH = 44
+BAR_WIDTH = 30
+MARGIN = 8
+HEIGHT = 240
+LABEL_HEIGHT = 24   # Window labels under the axis.
+VALUE_HEIGHT = 16   # Value labels above each bar.
+FONT_SCALE = 2
+
+# 3x5 bitmap glyphs for the characters used in labels.
+GLYPHS = {
+    '0': ('111', '101', '101', '101', '111'),
+    '1': ('010', '110', '010', '010', '111'),
+    '2': ('111', '001', '111', '100', '111'),
+    '3': ('111', '001', '111', '001', '111'),
+    '4': ('101', '101', '111', '001', '001'),
+    '5': ('111', '100', '111', '001', '111'),
+    '6': ('111', '100', '111', '101', '111'),
+    '7': ('111', '001', '001', '001', '001'),
+    '8': ('111', '101', '111', '101', '111'),
+    '9': ('111', '101', '111', '001', '111'),
+    '.': ('000', '000', '000', '000', '010'),
+    'M': ('101', '111', '111', '101', '101'),
+    'H': ('101', '101', '111', '101', '101'),
+    'D': ('110', '101', '101', '101', '110'),
+}
+
+def chart_key(values: Sequence[float], precision: int = 2) -> Tuple[float, ...]:
+    """
+    Returns the cache key for a set of window values: the values rounded to `precision` decimals.
+    """
+    return tuple(round(float(value), precision) for value in values)
+
+def _fill(pixels: bytearray, width: int, x0: int, y0: int, x1: int, y1: int, color: int):
+    """Fills the rectangle [x0, x1) x [y0, y1) with a palette color."""
+    x0, x1 = max(0, x0), min(width, x1)
+    if x1 <= x0:
+        return
+    row = bytes([color]) * (x1 - x0)
+    for y in range(max(0, y0), min(len(pixels) // width, y1)):
+        pixels[y * width + x0:y * width + x1] = row
+
+def _draw_text(pixels: bytearray, width: int, x: int, y: int, text: str):
+    """Draws `text` with its top-left corner at (x, y), skipping characters without a glyph."""
+    for char in text:
+        glyph = GLYPHS.get(char)
+        if glyph is not None:
+            for gy, bits in enumerate(glyph):
+                for gx, bit in enumerate(bits):
+                    if bit == '1':
+                        _fill(pixels, width,
+                              x + gx * FONT_SCALE, y + gy * FONT_SCALE,
+                              x + (gx + 1) * FONT_SCALE, y + (gy + 1) * FONT_SCALE, TEXT)
+        x += 4 * FONT_SCALE
+
+def _text_width(text: str) -> int:
+    return max(0, len(text) * 4 * FONT_SCALE - FONT_SCALE)
+
+def _png_chunk(kind: bytes, data: bytes) -> bytes:
+    return struct.pack('>I', len(data)) + kind + data + struct.pack('>I', zlib.crc32(kind + data) & 0xffffffff)
+
+def _encode_png(pixels: bytearray, width: int, height: int) -> bytes:
+    """Encodes an 8-bit palette image as PNG."""
+    raw = bytearray()
+    for y in range(height):
+        raw.append(0)  # Filter type: none.
+        raw += pixels[y * width:(y + 1) * width]
+    return (
+        b'\x89PNG\r\n\x1a\n'
+        + _png_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, 3, 0, 0, 0))
+        + _png_chunk(b'PLTE', PALETTE)
+        + _png_chunk(b'IDAT', zlib.compress(bytes(raw), 9))
+        + _png_chunk(b'IEND', b'')
+    )
+
+def render_rain_chart(values: Sequence[float]) -> bytes:
+    """
+    Renders one bar per accumulation window (RAIN_WINDOWS order) and returns the PNG bytes.
+
+    This runs in worker processes, so it only takes plain values and uses the standard library.
+
+    Args:
+        values: The window accumulations, in RAIN_WINDOWS order.
+
+    Returns:
+        The PNG image as bytes.
+    """
+    width = MARGIN * 2 + SLOT_WIDTH * len(RAIN_WINDOWS)
+    pixels = bytearray(width * HEIGHT)
+
+    axis_y = HEIGHT - LABEL_HEIGHT
+    bar_area = axis_y - VALUE_HEIGHT - MARGIN
+    peak = max(values) if values else 0
+
+    for i, (window, value) in enumerate(zip(RAIN_WINDOWS, values)):
+        slot_x = MARGIN + i * SLOT_WIDTH
+        bar_x = slot_x + (SLOT_WIDTH - BAR_WIDTH) // 2
+        bar_height = int(round(bar_area * value / peak)) if peak > 0 else 0
+        _fill(pixels, width, bar_x, axis_y - bar_height, bar_x + BAR_WIDTH, axis_y, BAR)
+
+        label = f"{value:.2f}"
+        _draw_text(pixels, width, slot_x + (SLOT_WIDTH - _text_width(label)) // 2,
+                   axis_y - bar_height - VALUE_HEIGHT + 3, label)
+        label = window.upper()
+        _draw_text(pixels, width, slot_x + (SLOT_WIDTH - _text_width(label)) // 2, axis_y + 7, label)
+
+    _fill(pixels, width, MARGIN, axis_y, width - MARGIN, axis_y + 2, AXIS)
+
+    png = _encode_png(pixels, width, HEIGHT)
+    if len(png) > MAX_IMAGE_BYTES:
+        raise ValueError(f"Chart too large. {MAX_IMAGE_BYTES} bytes maximum, got: {len(png)}")
+    return png
+
+class RainChartRenderer:
+    """
+    Renders rain accumulation charts in a process pool, reusing images for identical readings.
+
+    Many gauges report the same values during a storm, so charts are cached by their rounded
+    values, and concurrent requests for the same key share one render.
+
+    Attributes:
+        max_workers (int): Size of the render process pool.
+        cache_size (int): Maximum number of cached PNGs.
+        precision (int): Decimal places used when rounding values for the cache key.
+    """
+    def __init__(self, max_workers=2, cache_size=256, precision=2):
+        self.max_workers = max_workers
+        self.cache_size = cache_size
+        self.precision = precision
+        self._executor = None
+        self._cache = OrderedDict()
+        self._in_flight = {}
+        self.hits = 0
+        self.misses = 0
+
+    def _get_executor(self):
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_workers)
+        return self._executor
+
+    async def render(self, report: Dict) -> Optional[bytes]:
+        """
+        Returns a PNG chart for a rain report without blocking the event loop.
+
+        Args:
+            report: A rain intensity report (or an alert carrying a 'rain' mapping).
+
+        Returns:
+            The PNG bytes, or None if the report has no rain data.
+        """
+        values = rain_values(report)
+        if values is None:
+            return None
+
+        key = chart_key(values, self.precision)
+        png = self._cache.get(key)
+        if png is not None:
+            self._cache.move_to_end(key)
+            self.hits += 1
+            return png
+
+        future = self._in_flight.get(key)
+        if future is not None:
+            self.hits += 1
+            return await asyncio.shield(future)
+
+        self.misses += 1
+        loop = asyncio.get_running_loop()
+        future = loop.run_in_executor(self._get_executor(), render_rain_chart, key)
+        self._in_flight[key] = future
+        try:
+            png = await future
+        finally:
+            self._in_flight.pop(key, None)
+
+        self._cache[key] = png
+        if len(self._cache) > self.cache_size:
+            self._cache.popitem(last=False)
+        return png
+
+    def close(self):
+        """Shuts down the render process pool."""
+        if self._executor is not None:
+            self._executor.shutdown(wait=True)
+            self._executor = None
@@ -0,0 +1,51 @@
+# rain_report.py
+'''
+Helpers for the rain intensity report object (see common/objects/rain_intensity.json).
+'''
+
+__all__ = ["RAIN_WINDOWS", "WINDOW_SECONDS", "rain_values"]
+
+from typing import Dict, List, Optional
+
+# Accumulation windows, shortest first, in the order they appear in rain_intensity.json.
+RAIN_WINDOWS = ('m15', 'm30', 'h1', 'h3', 'h6', 'h12', 'h24', 'd3', 'd7', 'd14', 'd30')
+
+# Window lengths in seconds.
+WINDOW_SECONDS = {
+    'm15': 15 * 60,
+    'm30': 30 * 60,
+    'h1': 3600,
+    'h3': 3 * 3600,
+    'h6': 6 * 3600,
+    'h12': 12 * 3600,
+    'h24': 24 * 3600,
+    'd3': 3 * 86400,
+    'd7': 7 * 86400,
+    'd14': 14 * 86400,
+    'd30': 30 * 86400,
+}
+
+def rain_values(report: Dict) -> Optional[List[float]]:
+    """
+    Returns the accumulation values of a report (or of its 'rain' mapping) in RAIN_WINDOWS order.
+
+    Args:
+        report: A rain intensity report, or just its 'rain' mapping.
+
+    Returns:
+        A list of floats, with missing or empty windows as 0.0, or None if the report has no rain data.
+    """
+    if not isinstance(report, dict):
+        return None
+    rain = report.get('rain', report)
+    if not isinstance(rain, dict) or not any(window in rain for window in RAIN_WINDOWS):
+        return None
+
+    values = []
+    for window in RAIN_WINDOWS:
+        value = rain.get(window)
+        try:
+            values.append(float(value) if value not in (None, '') else 0.0)
+        except (TypeError, ValueError):
+            values.append(0.0)
+    return values
@@ -0,0 +1,416 @@
+# rain_store.py
+'''
+Append-only columnar store for rain report history.
+
+Each site and accumulation window is a series stored as fixed-width (time, value) records
+in segment files under <root>/<site_key>/<window>/:
+
+    <root>/redrocks-co-us-3e128hg38th5620/h1/00000001.seg
+
+Appends go to the newest segment with one small write (O(1)). A new segment is started once
+the newest one holds segment_records records or spans segment_seconds, so a live series always
+has recent segments to expire. Readers map segments with numpy.memmap, so slicing a time range
+is a view into the page cache, not a parse. compact() merges closed segments and drops expired
+history.
+'''
+
+__all__ = ["RECORD_DTYPE", "RainStore"]
+
+import os
+from collections import OrderedDict
+from datetime import datetime, timezone
+from typing import Dict, Iterator, Optional
+
+import numpy as np
+
+from rain_report import RAIN_WINDOWS, rain_values
+
+# t: report time in epoch seconds (UTC), v: accumulation for the window.
+RECORD_DTYPE = np.dtype([('t', '<i8'), ('v', '<f4')])
+
+SEGMENT_SUFFIX = '.seg'
+
+def _epoch_seconds(value) -> int:
+    """Converts a datetime, ISO 8601 string or number to epoch seconds (naive times are UTC)."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return int(value)
+    if isinstance(value, str):
+        value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if isinstance(value, datetime):
+        if value.tzinfo is None:
+            value = value.replace(tzinfo=timezone.utc)
+        return int(value.timestamp())
+    raise ValueError(f"Unsupported timestamp: {value!r}")
+
+class RainStore:
+    """
+    Per-site, per-window time series of rain accumulations.
+
+    Attributes:
+        root (str): Directory holding one folder per site.
+        segment_records (int): Records per segment before a new segment is started.
+        segment_seconds (int): Time span of a segment before a new segment is started (0: no limit).
+        max_open_files (int): Append handles kept open (least recently used are closed).
+        max_open_maps (int): Closed segment maps kept for reuse (least recently used are dropped).
+    """
+    def __init__(self, root, segment_records=65536, segment_seconds=7 * 86400, max_open_files=256, max_open_maps=1024):
+        self.root = root
+        self.segment_records = segment_records
+        self.segment_seconds = segment_seconds
+        self.max_open_files = max_open_files
+        self.max_open_maps = max_open_maps
+        # (site_key, window) -> [file, segment_number, record_count, last_t, first_t]
+        self._writers = OrderedDict()
+        self._closed_maps = OrderedDict()   # path -> memmap of a closed (immutable) segment
+        os.makedirs(self.root, exist_ok=True)
+
+    # --- Layout ---
+
+    def _series_dir(self, site_key, window):
+        if window not in RAIN_WINDOWS:
+            raise ValueError(f"Unknown rain window: {window}")
+        if not site_key or os.sep in site_key or site_key.startswith('.'):
+            raise ValueError(f"Invalid site key: {site_key!r}")
+        return os.path.join(self.root, site_key, window)
+
+    def _segments(self, site_key, window):
+        """Returns the series' segment numbers, oldest first."""
+        directory = self._series_dir(site_key, window)
+        if not os.path.isdir(directory):
+            return []
+        return sorted(int(name[:-len(SEGMENT_SUFFIX)]) for name in os.listdir(directory)
+                      if name.endswith(SEGMENT_SUFFIX) and name[:-len(SEGMENT_SUFFIX)].isdigit())
+
+    def _segment_path(self, site_key, window, number):
+        return os.path.join(self._series_dir(site_key, window), f"{number:08d}{SEGMENT_SUFFIX}")
+
+    def sites(self):
+        """Returns the site keys with stored history."""
+        return sorted(name for name in os.listdir(self.root) if os.path.isdir(os.path.join(self.root, name)))
+
+    # --- Writing ---
+
+    def _writer(self, site_key, window):
+        key = (site_key, window)
+        writer = self._writers.get(key)
+        if writer is not None:
+            self._writers.move_to_end(key)
+            return writer
+
+        directory = self._series_dir(site_key, window)
+        os.makedirs(directory, exist_ok=True)
+        segments = self._segments(site_key, window)
+        number = segments[-1] if segments else 1
+        path = self._segment_path(site_key, window, number)
+
+        f = open(path, 'ab')
+        size = f.tell()
+        if size % RECORD_DTYPE.itemsize:
+            # A torn record from a crash mid-append; drop it.
+            size -= size % RECORD_DTYPE.itemsize
+            f.truncate(size)
+        count = size // RECORD_DTYPE.itemsize
+
+        last_t = first_t = None
+        if count:
+            records = self._map(path, count)
+            last_t, first_t = int(records['t'][-1]), int(records['t'][0])
+        elif len(segments) > 1:
+            previous = self._segment_path(site_key, window, segments[-2])
+            records = self._map(previous)
+            last_t = int(records['t'][-1]) if len(records) else None
+
+        writer = [f, number, count, last_t, first_t]
+        self._writers[key] = writer
+        while len(self._writers) > self.max_open_files:
+            _, (old_file, *_) = self._writers.popitem(last=False)
+            old_file.close()
+        return writer
+
+    def append(self, site_key, window, t, value):
+        """
+        Appends one (time, value) record to a series.
+
+        Times must not go backwards within a series; an older time raises ValueError and an
+        equal time is ignored, so replaying a report is harmless.
+        """
+        t = _epoch_seconds(t)
+        writer = self._writer(site_key, window)
+        f, number, count, last_t, first_t = writer
+        if last_t is not None and t <= last_t:
+            if t == last_t:
+                return
+            raise ValueError(f"Out-of-order append for {site_key}/{window}: {t} < {last_t}")
+
+        if count and (count >= self.segment_records
+                      or (self.segment_seconds and t - first_t >= self.segment_seconds)):
+            f.close()
+            self._closed_maps.pop(self._segment_path(site_key, window, number), None)
+            number += 1
+            f = open(self._segment_path(site_key, window, number), 'ab')
+            count = 0
+        if not count:
+            first_t = t
+
+        f.write(np.array([(t, value)], dtype=RECORD_DTYPE).tobytes())
+        writer[:] = [f, number, count + 1, t, first_t]
+
+    def append_report(self, report: Dict):
+        """
+        Appends every window of a rain intensity report (see common/objects/rain_intensity.json).
+
+        The report time is `created_at`, falling back to `received_time`.
+        """
+        site_key = report.get('site_key') or str(report.get('site_id', ''))
+        values = rain_values(report)
+        if values is None:
+            raise ValueError(f"Report for {site_key!r} has no rain data")
+        when = report.get('created_at') or report.get('received_time')
+        if not when:
+            raise ValueError(f"Report for {site_key!r} has no created_at or received_time")
+        t = _epoch_seconds(when)
+        for window, value in zip(RAIN_WINDOWS, values):
+            self.append(site_key, window, t, value)
+        self.flush()
+
+    def flush(self):
+        """Pushes buffered appends to the OS so readers (and other processes) see them."""
+        for f, *_ in self._writers.values():
+            f.flush()
+
+    def close(self):
+        for f, *_ in self._writers.values():
+            f.close()
+        self._writers.clear()
+        self._closed_maps.clear()
+
+    # --- Reading ---
+
+    def _map(self, path, count=None):
+        """Maps a segment read-only; an empty segment gives an empty array."""
+        if count is None:
+            count = os.path.getsize(path) // RECORD_DTYPE.itemsize
+        if count == 0:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        return np.memmap(path, dtype=RECORD_DTYPE, mode='r', shape=(count,))
+
+    def _segment_records(self, site_key, window, number, active):
+        path = self._segment_path(site_key, window, number)
+        if active:
+            # The active segment grows, so map its current length each time.
+            return self._map(path)
+        records = self._closed_maps.get(path)
+        if records is not None:
+            self._closed_maps.move_to_end(path)
+            return records
+        records = self._closed_maps[path] = self._map(path)
+        # Views handed out keep their own reference, so dropping a map here never invalidates them.
+        while len(self._closed_maps) > self.max_open_maps:
+            self._closed_maps.popitem(last=False)
+        return records
+
+    def iter_range(self, site_key, window, start=None, end=None) -> Iterator[np.ndarray]:
+        """
+        Yields zero-copy views of the records with start <= t < end, one per segment, oldest first.
+        """
+        self.flush()
+        start = None if start is None else _epoch_seconds(start)
+        end = None if end is None else _epoch_seconds(end)
+        segments = self._segments(site_key, window)
+        for i, number in enumerate(segments):
+            records = self._segment_records(site_key, window, number, active=(i == len(segments) - 1))
+            if not len(records):
+                continue
+            if start is not None and records['t'][-1] < start:
+                continue
+            if end is not None and records['t'][0] >= end:
+                break
+            lo = 0 if start is None else int(np.searchsorted(records['t'], start, side='left'))
+            hi = len(records) if end is None else int(np.searchsorted(records['t'], end, side='left'))
+            if hi > lo:
+                yield records[lo:hi]
+
+    def read(self, site_key, window, start=None, end=None) -> np.ndarray:
+        """
+        Returns the records with start <= t < end.
+
+        A range inside one segment is a zero-copy view; a range spanning segments is concatenated.
+        """
+        views = list(self.iter_range(site_key, window, start, end))
+        if not views:
+            return np.empty(0, dtype=RECORD_DTYPE)
+        if len(views) == 1:
+            return views[0]
+        return np.concatenate(views)
+
+    def latest(self, site_key) -> Optional[Dict]:
+        """
+        Returns the newest stored report for a site in the rain_intensity.json shape, or None.
+        """
+        rain = {}
+        newest = None
+        for window in RAIN_WINDOWS:
+            segments = self._segments(site_key, window)
+            records = None
+            for i in range(len(segments) - 1, -1, -1):
+                records = self._segment_records(site_key, window, segments[i], active=(i == len(segments) - 1))
+                if len(records):
+                    break
+            if records is None or not len(records):
+                continue
+            rain[window] = round(float(records['v'][-1]), 4)
+            newest = max(newest or 0, int(records['t'][-1]))
+        if newest is None:
+            return None
+        return {
+            'site_key': site_key,
+            'created_at': datetime.fromtimestamp(newest, timezone.utc).isoformat(),
+            'rain': rain,
+        }
+
+    # --- Maintenance ---
+
+    def compact(self, site_key, window, retain_after=None):
+        """
+        Merges the closed segments of a series into one, dropping records older than retain_after.
+
+        The active segment is left alone, so appends can continue, unless all of it is older than
+        retain_after (a site that stopped reporting); then it is emptied with the rest. The merged
+        segment is written to a temporary file and renamed into place; readers holding old maps
+        keep valid views.
+
+        Returns:
+            The number of records dropped.
+        """
+        self.flush()
+        segments = self._segments(site_key, window)
+        cutoff = None if retain_after is None else _epoch_seconds(retain_after)
+        closed = segments[:-1]
+        if cutoff is not None and segments:
+            active = self._segment_records(site_key, window, segments[-1], active=True)
+            if len(active) and active['t'][-1] < cutoff:
+                # Expired as a whole: reopen the writer afterwards, on the emptied segment.
+                writer = self._writers.pop((site_key, window), None)
+                if writer is not None:
+                    writer[0].close()
+                closed = segments
+        if not closed:
+            return 0
+
+        parts = []
+        total = 0
+        for number in closed:
+            records = self._segment_records(site_key, window, number, active=False)
+            total += len(records)
+            if cutoff is not None and len(records):
+                records = records[int(np.searchsorted(records['t'], cutoff, side='left')):]
+            if len(records):
+                parts.append(np.asarray(records))
+        merged = np.concatenate(parts) if parts else np.empty(0, dtype=RECORD_DTYPE)
+
+        target = self._segment_path(site_key, window, closed[0])
+        temporary = target + '.tmp'
+        with open(temporary, 'wb') as f:
+            f.write(merged.tobytes())
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, target)
+        for number in closed:
+            path = self._segment_path(site_key, window, number)
+            self._closed_maps.pop(path, None)
+            if number != closed[0]:
+                os.remove(path)
+        return total - len(merged)
+
+    def compact_all(self, retain_after=None):
+        """Compacts every series; returns the total number of records dropped."""
+        dropped = 0
+        for site_key in self.sites():
+            for window in RAIN_WINDOWS:
+                dropped += self.compact(site_key, window, retain_after)
+        return dropped
+
+def main():
+    """
+    Command-line access to the store:
+        python3 rain_store.py --root DIR ingest report.json reports.jsonl ...
+        python3 rain_store.py --root DIR ingest reports.jsonl --alerts inbox --levels levels.yaml --state inbox/.hysteresis.jsonl
+        python3 rain_store.py --root DIR compact --retain-days 400
+        python3 rain_store.py --root DIR show SITE_KEY [WINDOW]
+    """
+    import argparse
+    import json
+    import sys
+    from datetime import timedelta
+
+    parser = argparse.ArgumentParser(description="Append-only rain report history store.")
+    parser.add_argument("--root", required=True, help="Store directory")
+    commands = parser.add_subparsers(dest="command", required=True)
+    ingest = commands.add_parser("ingest", help="Append rain reports from JSON or JSON-lines files")
+    ingest.add_argument("files", nargs="+")
+    ingest.add_argument("--alerts", metavar="DIR",
+                        help="Feed the stored reports through alert_hysteresis.py and write the alerts it raises to this inbox")
+    ingest.add_argument("--levels", metavar="PATH", help="YAML file of alert levels for --alerts (default: the built-in example levels)")
+    ingest.add_argument("--state", metavar="PATH", help="Hysteresis state journal for --alerts, so levels survive restarts")
+    ingest.add_argument("--notify-clear", action="store_true", help="With --alerts, also raise an alert when a site returns to clear")
+    compact = commands.add_parser("compact", help="Merge closed segments and drop old history")
+    compact.add_argument("--retain-days", type=float, help="Drop records older than this many days")
+    show = commands.add_parser("show", help="Print the latest report, or one window's history")
+    show.add_argument("site_key")
+    show.add_argument("window", nargs="?")
+    args = parser.parse_args()
+
+    store = RainStore(args.root)
+    machine = writer = None
+    try:
+        if args.command == "ingest":
+            if args.alerts:
+                from alert_hysteresis import DEFAULT_LEVELS, SiteStateMachine, load_levels
+                from alert_writer import AlertWriter
+                machine = SiteStateMachine(load_levels(args.levels) if args.levels else DEFAULT_LEVELS,
+                                           state_path=args.state, notify_clear=args.notify_clear)
+                writer = AlertWriter(args.alerts, tag='hysteresis')
+            count = raised = 0
+            for path in args.files:
+                with open(path, "r") as f:
+                    text = f.read()
+                reports = [json.loads(line) for line in text.splitlines() if line.strip()] \
+                    if path.endswith(".jsonl") else [json.loads(text)]
+                alerts = []
+                for report in reports:
+                    try:
+                        store.append_report(report)
+                        count += 1
+                    except ValueError as e:
+                        print(f"Skipping report in {path}: {e}", file=sys.stderr)
+                        continue
+                    if machine is not None:
+                        site_key = report.get('site_key') or str(report.get('site_id', ''))
+                        t = _epoch_seconds(report.get('created_at') or report.get('received_time'))
+                        transition = machine.update(site_key, report.get('rain') or {}, t)
+                        if transition is not None and transition.notify:
+                            alerts.append(machine.alert_for(transition, report))
+                if alerts:
+                    writer.write_many(alerts)
+                    raised += len(alerts)
+            print(f"Ingested {count} reports." + (f" Raised {raised} alerts." if machine is not None else ""))
+        elif args.command == "compact":
+            retain_after = None
+            if args.retain_days is not None:
+                retain_after = datetime.now(timezone.utc) - timedelta(days=args.retain_days)
+            print(f"Dropped {store.compact_all(retain_after)} records.")
+        elif args.command == "show":
+            if args.window:
+                for t, v in store.read(args.site_key, args.window):
+                    print(f"{datetime.fromtimestamp(int(t), timezone.utc).isoformat()}\t{float(v):g}")
+            else:
+                print(json.dumps(store.latest(args.site_key), indent=2))
+    finally:
+        if writer is not None:
+            writer.close()
+        if machine is not None:
+            machine.close()
+        store.close()
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,145 @@
+# rate_limiter.py
+'''
+Adaptive pacing for requests to a PDS.
+
+A RateLimiter spaces requests of one kind (e.g. writes, or blob uploads) at its current rate,
+and adjusts the rate from each response. Rates are in budget points per second: a request
+can cost more than one point (a Bluesky PDS charges 3 points per created record).
+
+* ratelimit-remaining / ratelimit-reset headers: the rate becomes the remaining budget spread
+  over the time until the reset, times a safety factor. An exhausted budget blocks until the reset.
+* 429 (or 503) with Retry-After: requests are held until then, and the rate is cut.
+* No headers: AIMD. Each success adds `increase` requests/second, and each 429 multiplies the
+  rate by `decrease`, holding requests for an exponential backoff when there is no Retry-After.
+'''
+
+__all__ = ["RateLimiter", "RETRY_STATUSES"]
+
+import asyncio
+import time
+from email.utils import parsedate_to_datetime
+from typing import Mapping, Optional
+
+# Responses that mean "slow down and try again".
+RETRY_STATUSES = (429, 503)
+
+def _header(headers, name) -> Optional[str]:
+    if headers is None:
+        return None
+    value = headers.get(name)
+    if value is None:
+        # aiohttp's headers are case-insensitive already; plain dicts are not.
+        for key, candidate in headers.items():
+            if key.lower() == name:
+                return candidate
+    return value
+
+def _number(value) -> Optional[float]:
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return None
+
+def retry_after_seconds(value, now=None) -> Optional[float]:
+    """Parses a Retry-After header (seconds, or an HTTP date) into seconds from now."""
+    if value is None:
+        return None
+    seconds = _number(value)
+    if seconds is not None:
+        return max(0.0, seconds)
+    try:
+        when = parsedate_to_datetime(value).timestamp()
+    except (TypeError, ValueError):
+        return None
+    return max(0.0, when - (time.time() if now is None else now))
+
+class RateLimiter:
+    """
+    Paces one class of requests.
+
+    Attributes:
+        name (str): Shown in log lines.
+        rate (float): Current budget points per second.
+        min_rate, max_rate (float): Bounds for the rate.
+        increase (float): Points/second added per success when the server sends no budget headers.
+        decrease (float): Factor applied to the rate on a 429.
+        safety (float): Fraction of an advertised budget that is used.
+        max_backoff (float): Longest hold after a 429 without Retry-After, in seconds.
+    """
+    def __init__(self, name, rate=1.0, min_rate=0.05, max_rate=10.0, increase=0.1, decrease=0.5,
+                 safety=0.9, max_backoff=300.0):
+        self.name = name
+        self.rate = rate
+        self.min_rate = min_rate
+        self.max_rate = max_rate
+        self.increase = increase
+        self.decrease = decrease
+        self.safety = safety
+        self.max_backoff = max_backoff
+
+        self.remaining = None
+        self.reset_at = None
+        self._next_slot = 0.0
+        self._blocked_until = 0.0
+        self._backoff = 1.0
+
+    async def acquire(self, cost=1):
+        """Waits for the turn of a request that costs `cost` points."""
+        # No await between reading and reserving the slot, so concurrent tasks can't take the same one.
+        now = time.monotonic()
+        start = max(now, self._next_slot, self._blocked_until)
+        self._next_slot = start + cost / self.rate
+        if start > now:
+            await asyncio.sleep(start - now)
+
+    def update(self, status: int, headers: Optional[Mapping] = None):
+        """
+        Adjusts the pace from a response's status and headers.
+
+        Returns:
+            The seconds requests are held for, when the response was a 429/503 (else 0).
+        """
+        now_wall = time.time()
+        now = time.monotonic()
+
+        remaining = _number(_header(headers, 'ratelimit-remaining'))
+        reset = _number(_header(headers, 'ratelimit-reset'))
+        has_budget = remaining is not None and reset is not None
+        if has_budget:
+            self.remaining = remaining
+            self.reset_at = reset
+            window = max(reset - now_wall, 1.0)
+            if remaining <= 0:
+                self._blocked_until = max(self._blocked_until, now + window)
+            else:
+                self._set_rate(self.safety * remaining / window)
+
+        if status in RETRY_STATUSES:
+            hold = retry_after_seconds(_header(headers, 'retry-after'), now_wall)
+            if hold is None and has_budget and remaining <= 0:
+                hold = max(reset - now_wall, 0.0)
+            if hold is None:
+                hold = self._backoff
+                self._backoff = min(self._backoff * 2, self.max_backoff)
+            self._blocked_until = max(self._blocked_until, now + hold)
+            self._set_rate(self.rate * self.decrease)
+            return hold
+
+        if 200 <= status < 300:
+            self._backoff = 1.0
+            if not has_budget:
+                self._set_rate(self.rate + self.increase)
+        return 0.0
+
+    def _set_rate(self, rate):
+        self.rate = min(max(rate, self.min_rate), self.max_rate)
+
+    def describe(self):
+        """Returns the current pace as one line for the log."""
+        line = f"{self.name}: {self.rate:.2f}/s"
+        if self.remaining is not None and self.reset_at is not None:
+            line += f", {self.remaining:.0f} left until reset in {max(self.reset_at - time.time(), 0):.0f}s"
+        held = self._blocked_until - time.monotonic()
+        if held > 0:
+            line += f", held for {held:.0f}s"
+        return line
@@ -0,0 +1,100 @@
+# sent_cache.py
+'''
+A bounded, disk-backed cache of recently sent alert fingerprints.
+
+Lets the daemon skip an alert it has already posted (e.g. after a crash between the post and
+the file move) with a local lookup, instead of a network call or a duplicate post.
+'''
+
+__all__ = ["alert_fingerprint", "SentCache"]
+
+import hashlib
+import json
+import os
+import time
+from collections import OrderedDict
+
+def alert_fingerprint(alert_json) -> str:
+    """
+    Returns a stable SHA-256 hex digest of an alert's content (a dict, or the message text).
+    """
+    if isinstance(alert_json, dict):
+        content = json.dumps(alert_json, sort_keys=True, default=str, ensure_ascii=False)
+    else:
+        content = str(alert_json)
+    return hashlib.sha256(content.encode("UTF-8")).hexdigest()
+
+class SentCache:
+    """
+    Remembers the last `max_entries` fingerprints and the post URI each one produced.
+
+    Entries are appended to a JSON-lines file as they are added; the file is rewritten
+    (compacted) when it grows to twice the cache size.
+
+    Attributes:
+        path (str): The backing file.
+        max_entries (int): Number of fingerprints kept.
+    """
+    def __init__(self, path, max_entries=10000):
+        self.path = path
+        self.max_entries = max_entries
+        self._entries = OrderedDict()
+        self._lines = 0
+        self._load()
+        directory = os.path.dirname(os.path.abspath(path))
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, "a")
+
+    def _load(self):
+        if not os.path.exists(self.path):
+            return
+        with open(self.path, "r") as f:
+            for line in f:
+                self._lines += 1
+                try:
+                    entry = json.loads(line)
+                except ValueError:
+                    continue  # A torn last line from a crash.
+                self._entries[entry["fp"]] = entry.get("uri")
+                self._entries.move_to_end(entry["fp"])
+                if len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+
+    def __contains__(self, fingerprint):
+        return fingerprint in self._entries
+
+    def __len__(self):
+        return len(self._entries)
+
+    def get(self, fingerprint):
+        """Returns the post URI recorded for a fingerprint (None if unknown or not recorded)."""
+        return self._entries.get(fingerprint)
+
+    def add(self, fingerprint, uri=None):
+        """Records a sent fingerprint and flushes it to disk."""
+        self._entries[fingerprint] = uri
+        self._entries.move_to_end(fingerprint)
+        if len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+        self._file.write(json.dumps({"fp": fingerprint, "uri": uri, "at": int(time.time())}) + "\n")
+        self._file.flush()
+        self._lines += 1
+        if self._lines > 2 * self.max_entries:
+            self._compact()
+
+    def _compact(self):
+        """Rewrites the file with only the live entries (write to a temporary file, then rename)."""
+        self._file.close()
+        temporary = self.path + ".tmp"
+        with open(temporary, "w") as f:
+            for fingerprint, uri in self._entries.items():
+                f.write(json.dumps({"fp": fingerprint, "uri": uri}) + "\n")
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temporary, self.path)
+        self._lines = len(self._entries)
+        self._file = open(self.path, "a")
+
+    def close(self):
+        self._file.close()
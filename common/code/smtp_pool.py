@@ -0,0 +1,181 @@
+# smtp_pool.py
+'''
+A small pool of authenticated SMTP connections, and batched delivery of one message to many
+recipients over it.
+
+Connections are opened (TLS/STARTTLS and login included) on first use, reused for later
+messages, and closed after idle_seconds unused. A message is serialized once; its recipients
+are split into envelopes of at most max_recipients (one MAIL FROM, many RCPT TO, one DATA),
+and the envelopes go out in parallel, at most `size` at a time - one per pooled connection.
+
+Settings come from the environment (see common/config/example.env.local):
+
+    SMTP_HOST, SMTP_PORT          Server (port default 587).
+    SMTP_USERNAME, SMTP_PASSWORD  Login (optional).
+    SMTP_SECURITY                 'starttls' (default), 'tls' or 'none'.
+    SMTP_POOL_SIZE                Connections kept open (default 2).
+    SMTP_MAX_RECIPIENTS           Recipients per envelope (default 50).
+
+Needs the aiosmtplib package, which is imported when the first connection is opened.
+'''
+
+__all__ = ["SMTPPool", "smtp_settings_from_env"]
+
+import asyncio
+import os
+import sys
+import time
+from contextlib import asynccontextmanager
+from typing import Dict, List, Sequence
+
+def smtp_settings_from_env() -> Dict:
+    """Returns SMTPPool keywords from the SMTP_* variables."""
+    security = os.getenv("SMTP_SECURITY", "starttls").strip().lower()
+    if security not in ("starttls", "tls", "none"):
+        raise ValueError(f"SMTP_SECURITY must be starttls, tls or none, not '{security}'")
+    return {
+        'host': os.getenv("SMTP_HOST"),
+        'port': int(os.getenv("SMTP_PORT", "465" if security == "tls" else "587")),
+        'username': os.getenv("SMTP_USERNAME") or None,
+        'password': os.getenv("SMTP_PASSWORD") or None,
+        'security': security,
+        'size': int(os.getenv("SMTP_POOL_SIZE", "2")),
+        'max_recipients': int(os.getenv("SMTP_MAX_RECIPIENTS", "50")),
+    }
+
+class SMTPPool:
+    """
+    Keeps up to `size` SMTP connections open and delivers messages over them.
+
+    Attributes:
+        host, port: The server.
+        username, password: Login, or None for an unauthenticated relay.
+        security (str): 'starttls', 'tls' or 'none'.
+        size (int): Most connections open at once (and envelopes in flight).
+        max_recipients (int): Recipients per envelope.
+        idle_seconds (float): Connections unused this long are closed instead of reused.
+        timeout (float): Seconds allowed for each SMTP command.
+    """
+    def __init__(self, host, port=587, username=None, password=None, security='starttls', size=2,
+                 max_recipients=50, idle_seconds=60, timeout=30):
+        if not host:
+            raise ValueError("An SMTP host must be set (SMTP_HOST)")
+        self.host = host
+        self.port = port
+        self.username = username
+        self.password = password
+        self.security = security
+        self.size = size
+        self.max_recipients = max_recipients
+        self.idle_seconds = idle_seconds
+        self.timeout = timeout
+
+        self._idle = []         # (client, last_used) of open connections not in use
+        self._slots = None
+        self._loop = None
+        self.opened = 0         # Connections opened, for the log and tests.
+
+    def _bind_loop(self):
+        # A pool belongs to one event loop; a new loop (asyncio.run() per send) starts a new pool.
+        loop = asyncio.get_running_loop()
+        if self._loop is not loop:
+            self._loop = loop
+            self._slots = asyncio.Semaphore(self.size)
+            self._idle = []
+
+    async def _connect(self):
+        import aiosmtplib
+
+        client = aiosmtplib.SMTP(
+            hostname=self.host, port=self.port,
+            username=self.username, password=self.password,
+            use_tls=self.security == 'tls', start_tls=self.security == 'starttls',
+            timeout=self.timeout,
+        )
+        await client.connect()  # Also negotiates TLS and logs in.
+        self.opened += 1
+        return client
+
+    @asynccontextmanager
+    async def connection(self):
+        """Lends a connected client; it returns to the pool unless the block raised."""
+        self._bind_loop()
+        async with self._slots:
+            client = None
+            now = time.monotonic()
+            while self._idle:
+                candidate, last_used = self._idle.pop()
+                if candidate.is_connected and now - last_used < self.idle_seconds:
+                    client = candidate
+                    break
+                await self._discard(candidate)
+            if client is None:
+                client = await self._connect()
+            try:
+                yield client
+            except BaseException:
+                await self._discard(client)
+                raise
+            self._idle.append((client, time.monotonic()))
+
+    @staticmethod
+    async def _discard(client):
+        try:
+            if client.is_connected:
+                await client.quit()
+        except Exception:
+            client.close()
+
+    def envelopes(self, recipients: Sequence[str]) -> List[List[str]]:
+        """Splits recipients (duplicates dropped) into envelopes of at most max_recipients."""
+        unique = list(dict.fromkeys(recipient.strip() for recipient in recipients if recipient.strip()))
+        return [unique[i:i + self.max_recipients] for i in range(0, len(unique), self.max_recipients)]
+
+    async def send_envelope(self, sender, recipients: List[str], data: bytes) -> Dict[str, str]:
+        """
+        Delivers one envelope, retrying once on a fresh connection if the pooled one had gone stale.
+
+        Returns:
+            {recipient: server reply} for recipients the server refused (empty when all were accepted).
+        """
+        import aiosmtplib
+
+        for attempt in range(2):
+            try:
+                async with self.connection() as client:
+                    try:
+                        errors, _ = await client.sendmail(sender, recipients, data)
+                    except aiosmtplib.SMTPRecipientsRefused as e:
+                        # Every recipient refused; the connection itself is fine.
+                        return {refused.recipient: f"{refused.code} {refused.message}" for refused in e.recipients}
+                return {recipient: f"{reply.code} {reply.message}" for recipient, reply in errors.items()}
+            except (aiosmtplib.SMTPServerDisconnected, aiosmtplib.SMTPConnectError, ConnectionError) as e:
+                if attempt == 1:
+                    raise
+                print(f"SMTP connection lost ({e}); retrying on a new connection", file=sys.stderr)
+
+    async def deliver(self, sender, recipients: Sequence[str], data: bytes) -> Dict:
+        """
+        Delivers one serialized message to every recipient, envelopes in parallel.
+
+        Returns:
+            {"accepted": n, "refused": {recipient: reason}, "failed": {recipient: error}} -
+            refused by the server, or in an envelope that could not be sent at all.
+        """
+        envelopes = self.envelopes(recipients)
+        outcomes = await asyncio.gather(*[self.send_envelope(sender, envelope, data) for envelope in envelopes],
+                                        return_exceptions=True)
+        accepted, refused, failed = 0, {}, {}
+        for envelope, outcome in zip(envelopes, outcomes):
+            if isinstance(outcome, BaseException):
+                failed.update((recipient, f"{outcome}") for recipient in envelope)
+            else:
+                refused.update(outcome)
+                accepted += len(envelope) - len(outcome)
+        return {"accepted": accepted, "refused": refused, "failed": failed}
+
+    async def close(self):
+        """Closes the idle connections of the current loop."""
+        if self._loop is not None and self._loop is asyncio.get_running_loop():
+            idle, self._idle = self._idle, []
+            await asyncio.gather(*[self._discard(client) for client, _ in idle], return_exceptions=True)
@@ -1,5 +1,9 @@
 import time
 import os
+import argparse
+import stat
+import threading
+from collections import deque
 from datetime import datetime, timezone
 from pathlib import Path
 
@@ -10,8 +14,12 @@ from dotenv import load_dotenv
 
 import asyncio
 
-# Now you can import the BlueskyPoster class
-from bluesky_poster import BlueskyPoster
+from alert_model import AlertRecord, AlertValidationError, load_alert_yaml, validate_alert
+from alert_scheduler import AlertScheduler, alert_priority
+from alert_writer import AlertWriter
+from inbox_scanner import InboxScanner
+from notification import BlueskyNotification, EMailNotification, Notification, SMSNotification
+from sent_cache import SentCache
 
 # Get the directory of the current script
 script_dir = Path(__file__).parent 
@@ -19,43 +27,13 @@ script_dir = Path(__file__).parent
 env_path = script_dir / '.env.local'
 load_dotenv(dotenv_path=env_path)
 
-# Assume you have some configuration data
-class ClientConfig:
-    def __init__(self):
-        # Add your configuration parameters here
-        self.message = ''
-        self.host = ''
-        self.site_lat = 0.0
-        self.site_long = 0.0
-        self.target_channels = ''
-        self.alert_source = ''
-        self.tags = []
-        self.uuid = 0
-        self.host_site_id = 0
-        self.host_sensor_id = 0
-        self.created_by = ''
-        self.created_at = datetime(year=0, month=1, day=1, hour=0, minute=0, second=0)
-
 class Alert:
     """
     Base class for handling alerts. Subclasses will implement specific
     methods for checking and processing alerts from different sources.
-    """
 
-    def __init__(self):
-        self.message = ''
-        self.host = ''
-        self.site_lat = 0.0
-        self.site_long = 0.0
-        self.target_channels = ''
-        self.tags = []
-        self.uuid = 0
-        self.host_site_id = 0
-        self.host_sensor_id = 0
-        self.created_by = ''
-        self.trigger_type = ''
-        self.alert_source = ''
-        self.created_at = datetime(year=0, month=1, day=1, hour=0, minute=0, second=0)
+    The alerts themselves are AlertRecords (see alert_model.py).
+    """
 
     def check_for_alerts(self):
         raise NotImplementedError("Subclasses must implement check_for_alerts")
@@ -75,24 +53,119 @@ class Alert:
             print(f"An unexpected error occurred: {e}")
             return None
 class DatabaseAlert(Alert):
+    """
+    Handles alerts that are rows in the `message` table with status 'pending'.
 
-    DATABASE_HOST = os.getenv("DATABASE_HOST")
-    DATABASE_USER = os.getenv("DATABASE_USER")
-    DATABASE_PASSWORD = os.getenv("DATABASE_PASSWORD")
-    
-    def __init__(self, alert_source):
-        self.trigger_type = 'database'
+    Each check claims up to batch_size rows, sends them most urgent first, and records the
+    outcome with one bulk UPDATE for the sent rows and one for the failed rows. Rows another
+    consumer claimed more than claim_lease seconds ago and never marked are taken back first,
+    so several consumers can share the table. The pool and the event loop that owns it live as
+    long as the DatabaseAlert.
+    """
 
-        self.host = ''
-        self.alert_table = ''
+    # Optional DaemonProfiler, injected like the notification system.
+    profiler = None
 
-        pass
+    # Optional LatencyAudit; claim, validation and send times are recorded per row.
+    audit = None
 
-    def check_for_alerts(self):
-        print(f"Checking for new database alerts.")
+    def __init__(self, database=None, batch_size=50, tag_rules=None, claim_lease=600):
+        self.trigger_type = 'database'
+        self.alert_source = 'message'
+        self.batch_size = batch_size
+        self.tag_rules = tag_rules
+        self.claim_lease = claim_lease
+
+        if database is None:
+            from db_pool import AlertDatabase
+            database = AlertDatabase()
+        self.database = database
+        self.loop = asyncio.new_event_loop()
+        self.loop.run_until_complete(self.database.open())
 
-    def process_alert(self, filepath, message):
-        print(f"Processing new database alerts.")
+    def check_for_alerts(self):
+        self.loop.run_until_complete(self.check_for_alerts_async())
+
+    async def check_for_alerts_async(self):
+        """Takes back stale claims, then claims and sends pending rows until the table has none left."""
+        requeued = await self.database.requeue_stale(self.claim_lease)
+        if requeued:
+            print(f"Requeued {requeued} database alerts claimed more than {self.claim_lease:g}s ago.")
+        while True:
+            rows = await self.database.claim_pending(self.batch_size)
+            if not rows:
+                return
+            print(f"Claimed {len(rows)} database alerts.")
+            await self.process_alerts_async(rows)
+
+    @staticmethod
+    def row_to_alert(row):
+        """Returns a message row (without its id) as an AlertRecord; raises AlertValidationError."""
+        return validate_alert({key: value for key, value in row.items() if key != 'id' and value is not None})
+
+    async def process_alerts_async(self, rows):
+        """Sends claimed rows (batched when the notification system supports it) and marks them in bulk."""
+        claimed_at = time.time()
+        alerts = []
+        failed_ids = []
+        for row in rows:
+            try:
+                alerts.append((row['id'], self.row_to_alert(row)))
+            except AlertValidationError as e:
+                print(f"Invalid database alert {row['id']}: {e}")
+                failed_ids.append(row['id'])
+        alerts.sort(key=lambda item: alert_priority(item[1], self.tag_rules))
+        parsed_at = time.time()
+        messages = [(self.notification_system.build_message(alert), alert) for _, alert in alerts]
+
+        if not messages:
+            results = []
+        elif len(messages) > 1 and hasattr(self.notification_system, 'send_notifications_async'):
+            try:
+                results = await self.notification_system.send_notifications_async(messages)
+            except Exception as e:
+                print(f"Error sending batch of {len(messages)} notifications: {e}")
+                results = [{"ok": False, "error": f"{e}"}] * len(messages)
+        else:
+            send = getattr(self.notification_system, 'send_notification_async', None)
+            results = []
+            for message, alert_json in messages:
+                try:
+                    if send is not None:
+                        result = await send(message, alert_json)
+                    else:
+                        result = self.notification_system.send_notification(message, alert_json)
+                    uri = result.get("uri") if isinstance(result, dict) else None
+                    results.append({"ok": True, "uri": uri, "error": None})
+                except Exception as e:
+                    results.append({"ok": False, "error": f"{e}"})
+
+        sent_at = time.time()
+        sent_ids, post_uris = [], []
+        for (row_id, alert), result in zip(alerts, results):
+            if result["ok"]:
+                sent_ids.append(row_id)
+                post_uris.append(result.get("uri"))
+            else:
+                print(f"Error sending notification for message {row_id}: {result['error']}")
+                failed_ids.append(row_id)
+            if self.profiler is not None:
+                self.profiler.record_alert()
+            if self.audit is not None:
+                stamps = {'discovered_at': claimed_at, 'parsed_at': parsed_at, 'sent_at': sent_at}
+                self.audit.record(row_id, alert, stamps, result["ok"], result.get("uri"))
+        await self.database.mark(sent_ids, failed_ids, post_uris)
+
+    def process_alert(self, alert_json, row_id):
+        row = alert_json.to_dict() if isinstance(alert_json, AlertRecord) else dict(alert_json)
+        self.loop.run_until_complete(self.process_alerts_async([dict(row, id=row_id)]))
+
+    def close(self):
+        close_notifier = getattr(getattr(self, 'notification_system', None), 'close_async', None)
+        if close_notifier is not None:
+            self.loop.run_until_complete(close_notifier())
+        self.loop.run_until_complete(self.database.close())
+        self.loop.close()
 
 class FileAlert(Alert):
     """
@@ -105,14 +178,40 @@ class FileAlert(Alert):
     FAILED_FOLDER = os.path.join(ALERT_FOLDER, 'failed')
     SENT_FOLDER = os.path.join(ALERT_FOLDER, 'sent')
 
-    def __init__(self):
+    # Optional DaemonProfiler, injected like the notification system.
+    profiler = None
+
+    # Optional LatencyAudit for the single-loop path (the pipeline records its own).
+    audit = None
+
+    # Alerts per send when the notification system supports batches (send_notifications).
+    batch_size = 1
+
+    # Alerts sent per check_for_alerts() call; 0 drains the queue. A small value lets
+    # newly arrived urgent alerts overtake a long routine backlog sooner.
+    max_per_cycle = 0
+
+    # Tag -> severity rules for alerts without a `severity` attribute (None uses DEFAULT_TAG_RULES).
+    tag_rules = None
+
+    def __init__(self, aging_seconds=60):
 
         self.trigger_type = 'file'
         self.alert_source = self.ALERT_FOLDER
         self.created_at = datetime.now(timezone.utc)  # Set created_at to UTC now
 
+        # Queue times are file modification times, so aging counts from when the alert was written.
+        self.scheduler = AlertScheduler(aging_seconds=aging_seconds)
+        self._queued = set()
+        # Lifecycle times (UNIX seconds) of the queued alerts, for the latency audit.
+        self._stamps = {}
+        # AlertWriter for pushed alerts, opened on the first push.
+        self.writer = None
+        self._writer_lock = threading.Lock()
 
         self._ensure_folders_exist()
+        # Polls the inbox incrementally: one stat when nothing changed, new files oldest first otherwise.
+        self.scanner = InboxScanner(self.alert_source, prefix='alert_')
 
     def _ensure_folders_exist(self):
         if not os.path.exists(self.alert_source):
@@ -127,58 +226,191 @@ class FileAlert(Alert):
 
     def check_for_alerts(self):
         try:
-            
-            # How do we identify Alert files? 
-            # TODO: Should be configurable. 
-            # startswith(alert_)
-            # endswith(_alert)
-            # file extension = yaml
-            
-            alert_files = [f for f in os.listdir(self.alert_source) if f.startswith('alert_')]
-
-            for filename in alert_files:
+            # Queue every new file by priority; alerts still queued from the last cycle keep their place.
+            filenames = self.discover()
+            discovered_at = time.time()
+            for filename in filenames:
+                if filename in self._queued:
+                    continue
                 print(f"File alert detected in {self.alert_source})")
-                yaml_file_path = os.path.join(self.alert_source, filename)
                 try:
-                    with open(yaml_file_path, 'r') as yaml_file:
-                        yaml_data = yaml.safe_load(yaml_file)
-
-                        if yaml_data is not None:
-                            alert_json = yaml_data
-                            print(alert_json)
-
-                            self.process_alert(alert_json, filename)
-
+                    parsed = self.parse(filename)
                 except FileNotFoundError:
-                    print(f"Error: File not found at '{yaml_file_path}'.")
-                    return None
+                    print(f"Error: File not found at '{os.path.join(self.alert_source, filename)}'.")
+                    continue
                 except yaml.YAMLError as e:
-                    print(f"Error parsing YAML in '{yaml_file_path}': {e}")
-                    return None
+                    print(f"Error parsing YAML in '{os.path.join(self.alert_source, filename)}': {e}")
+                    self.mark_failed(filename)
+                    continue
+                except AlertValidationError as e:
+                    print(f"Invalid alert in '{os.path.join(self.alert_source, filename)}': {e}")
+                    self.mark_failed(filename)
+                    continue
+
+                if parsed is not None:
+                    alert_json, queued_at = parsed
+                    print(alert_json)
+                    self.scheduler.push((alert_json, filename), alert_priority(alert_json, self.tag_rules), now=queued_at)
+                    self._queued.add(filename)
+                    if self.audit is not None:
+                        self._stamps[filename] = {'discovered_at': discovered_at, 'parsed_at': time.time()}
+
+            self._send_queued()
         except Exception as e:
             print(f"An unexpected error occurred: {e}")
         return None
 
+    def discover(self):
+        """Returns the names of alert files that arrived in the inbox since the last call, oldest first, a page at a time."""
+        # How do we identify Alert files? 
+        # TODO: Should be configurable. 
+        # startswith(alert_)
+        # endswith(_alert)
+        # file extension = yaml
+        return self.scanner.scan()
+
+    def has_more(self):
+        """Whether discover() left files for its next call (the pipeline then calls it again at once)."""
+        return self.scanner.more
+
+    def parse(self, filename):
+        """
+        Loads an alert file.
+
+        Returns:
+            (alert, queued_at), where alert is an AlertRecord and queued_at is the file's
+            modification time, or None for an empty file. The modification time also stands in
+            for a placeholder created_at, so a file always gets the same time.
+
+        Raises:
+            FileNotFoundError: The file is gone.
+            yaml.YAMLError: The file is not valid YAML.
+            AlertValidationError: The alert is missing a message or has unreadable fields.
+        """
+        yaml_file_path = os.path.join(self.alert_source, filename)
+        with open(yaml_file_path, 'r') as yaml_file:
+            yaml_data = load_alert_yaml(yaml_file)
+        queued_at = os.path.getmtime(yaml_file_path)
+        if yaml_data is None:
+            self.scanner.forget(filename)
+            return None
+        return validate_alert(yaml_data, now=queued_at), queued_at
+
+    def enqueue(self, alerts):
+        """
+        Durably adds pushed alert mappings to the inbox, as alert files discovery picks up.
+
+        The files are published atomically, in group commits shared with concurrent pushes
+        (see alert_writer.py).
+
+        Returns:
+            The new file names.
+        """
+        with self._writer_lock:
+            if self.writer is None:
+                self.writer = AlertWriter(self.alert_source, tag='push')
+        return self.writer.write_many(alerts)
+
+    def close(self):
+        """Publishes any pushed alerts still queued and stops the writer."""
+        if self.writer is not None:
+            self.writer.close()
+
+    def build_message(self, alert_json):
+        """Builds the post text for an alert with the notification system."""
+        message = self.notification_system.build_message(alert_json)
+        # TODO: remove
+        return message + "\n\n (File-based triggers is working...)"
+
+    def _send_queued(self):
+        """Sends queued alerts, most urgent first, up to max_per_cycle (0 sends them all)."""
+        batching = self.batch_size > 1 and hasattr(self.notification_system, 'send_notifications')
+        budget = self.max_per_cycle or len(self.scheduler)
+        had_work = len(self.scheduler) > 0
+
+        while budget > 0 and len(self.scheduler):
+            count = min(self.batch_size if batching else 1, budget, len(self.scheduler))
+            batch = [self.scheduler.pop(now=time.time()) for _ in range(count)]
+            budget -= count
+            for _, filename in batch:
+                self._queued.discard(filename)
+
+            if batching:
+                self.process_alerts(batch)
+            else:
+                self.process_alert(*batch[0])
+
+        if had_work:
+            print(self.scheduler.format_stats())
+
     def process_alert(self, alert_json, filename):
         """Passes the alert message to the configured notification system."""
         
+        ok = False
         try:
-            message = self.notification_system.build_message(alert_json)
+            message = self.build_message(alert_json)
+            self._stamp(filename, 'rendered_at')
 
-            # TODO: remove
-            message = message + "\n\n (File-based triggers is working...)"
-            
             # TODO: uncomment
-            self.notification_system.send_notification(message)
+            self.notification_system.send_notification(message, alert_json)
+            self._stamp(filename, 'sent_at')
+            ok = True
 
-            # Construct the full source path
-            source_path = os.path.join(self.alert_source, filename)
-            destination_path = os.path.join(self.SENT_FOLDER, filename)
-            self._move_file(source_path, destination_path)
+            self.mark_sent(filename)
                             
         except Exception as e:
             print(f"Error sending notification for '{filename}': {e}")
-            self._move_file(filename, self.FAILED_FOLDER)
+            self.mark_failed(filename)
+        finally:
+            self._record_latency(filename, alert_json, ok)
+            if self.profiler is not None:
+                self.profiler.record_alert()
+
+    def process_alerts(self, batch):
+        """
+        Sends a batch of (alert_json, filename) in one request and marks each alert sent or failed individually.
+        """
+        messages = []
+        for alert_json, filename in batch:
+            messages.append((self.build_message(alert_json), alert_json))
+            self._stamp(filename, 'rendered_at')
+
+        try:
+            results = self.notification_system.send_notifications(messages)
+        except Exception as e:
+            print(f"Error sending batch of {len(batch)} notifications: {e}")
+            results = [{"ok": False, "error": f"{e}"}] * len(batch)
+
+        for (alert_json, filename), result in zip(batch, results):
+            if result["ok"]:
+                self.mark_sent(filename)
+            else:
+                print(f"Error sending notification for '{filename}': {result['error']}")
+                self.mark_failed(filename)
+            self._record_latency(filename, alert_json, result["ok"], result.get("uri"))
+            if self.profiler is not None:
+                self.profiler.record_alert()
+
+    def _stamp(self, filename, stage):
+        if self.audit is not None:
+            self._stamps.setdefault(filename, {})[stage] = time.time()
+
+    def _record_latency(self, filename, alert_json, ok, uri=None):
+        """Writes the alert's latency audit record; sent_at defaults to now."""
+        stamps = self._stamps.pop(filename, {})
+        if self.audit is None:
+            return
+        stamps.setdefault('sent_at', time.time())
+        try:
+            self.audit.record(filename, alert_json, stamps, ok, uri)
+        except OSError as e:
+            print(f"Error writing latency audit for '{filename}': {e}")
+
+    def mark_sent(self, filename):
+        self._move_file(os.path.join(self.alert_source, filename), os.path.join(self.SENT_FOLDER, filename))
+
+    def mark_failed(self, filename):
+        self._move_file(os.path.join(self.alert_source, filename), os.path.join(self.FAILED_FOLDER, filename))
 
     def _move_file(self, source, destination):
         """Moves a file from the source to the destination."""
@@ -188,142 +420,418 @@ class FileAlert(Alert):
         except Exception as e:
             print(f"Error moving '{os.path.basename(source)}' to '{os.path.basename(destination)}': {e}")
 
-class Notification:
-    """
-    Base class for sending notifications. Subclasses will implement specific
-    methods for sending notifications through different channels.
+class StreamAlert(FileAlert):
     """
-    def send_notification(self, message):
-        raise NotImplementedError("Subclasses must implement send_notification")
-    
-    def build_message(self):
-        raise NotImplementedError("Subclasses must implement build_message")
+    Handles alerts appended as JSON lines to a file, or written to a named pipe.
 
-class SMSNotification(Notification):
-    def send_notification(self, message):
-        pass
+    Each line is one alert mapping. Lines are read in batches of up to max_records as they
+    arrive, and flow through the same queueing, batching and pipeline paths as FileAlert, without
+    a file create, directory scan and rename per alert.
 
-class EMailNotification(Notification):
-    def send_notification(self, message):
-        pass
+    Progress is a byte offset in a checkpoint file (default: <stream>.offset), written atomically
+    once per poll. It only moves past a line once that line and every line before it are sent or
+    failed, so a restart re-reads at most the alerts that were in flight; their deterministic
+    record keys and the sent cache keep those from posting twice. Failed lines are appended to
+    failed/<stream name>.failed.jsonl.
 
-class BlueskyNotification(Notification):
-    """
-    Sends notifications via Bluesky using the BlueskyPoster.
+    A line without created_at gets the time it was first read. The checkpoint also keeps those
+    read times for the unfinished lines, so a line re-read after a restart gets the same time,
+    and with it the same fingerprint and record key.
+
+    A named pipe can't be re-read, so what arrives on it is first appended to a journal file in
+    the inbox, which is tailed like a regular stream and emptied once every line is done. A
+    regular stream that is truncated or replaced (a new inode) is read again from the start.
     """
-    # Load from .env file.
-    BLUESKY_HANDLE = os.getenv("BLUESKY_HANDLE")
-    BLUESKY_PASSWORD = os.getenv("BLUESKY_PASSWORD")
-    BLUESKY_PDS_URL = os.getenv("BLUESKY_PDS_URL")
 
-    def __init__(self, pds_url=BLUESKY_PDS_URL, handle=BLUESKY_HANDLE, password=BLUESKY_PASSWORD):
-        if not all([pds_url, handle, password]):
-            raise ValueError("Bluesky PDS URL, handle, and password must be set in the .env file.")
-        self.poster = BlueskyPoster(pds_url, handle, password)
+    def __init__(self, path, checkpoint_path=None, max_records=500, aging_seconds=60):
+        self.path = path
+        self.is_fifo = os.path.exists(path) and stat.S_ISFIFO(os.stat(path).st_mode)
+        name = os.path.basename(path)
+        self.stream_path = os.path.join(self.ALERT_FOLDER, f".{name}.journal") if self.is_fifo else path
+        self.checkpoint_path = checkpoint_path or self.stream_path + '.offset'
+        self.failed_path = os.path.join(self.FAILED_FOLDER, f"{name}.failed.jsonl")
+        self.max_records = max_records
+
+        super().__init__(aging_seconds=aging_seconds)
+        self.trigger_type = 'stream'
+        self.alert_source = path
+
+        # discover() and parse() run in worker threads under the pipeline, mark_*() on its loop.
+        self._lock = threading.Lock()
+        self._records = {}      # key -> (line, received_at) for lines read but not yet done
+        self._order = deque()   # (key, end offset) of unfinished lines, in stream order
+        self._done = set()
+        self._generation = 0    # Bumped when the stream restarts, so old and new keys never collide.
+        self._fifo_fd = None
+        self._fifo_partial = b''
+
+        # [start, end, read time] of the byte ranges read but not yet committed, saved with the checkpoint.
+        self.committed, self.inode, self._reads = self._load_checkpoint()
+        self.saved = self.committed
+        self.read_offset = self.committed
 
-    def build_message(self, alert_json):
-        """
-        Creates a Bluesky message string from the attributes in the JSON data.
-
-        Args:
-            json_data (dict): The dictionary representing the loaded JSON data.
+    def _ensure_folders_exist(self):
+        for folder in (self.ALERT_FOLDER, self.FAILED_FOLDER, self.SENT_FOLDER):
+            os.makedirs(folder, exist_ok=True)
 
-        Returns:
-            str: The formatted Bluesky message.
+    def _load_checkpoint(self):
+        try:
+            with open(self.checkpoint_path, 'r') as f:
+                checkpoint = json.load(f)
+            reads = [[int(start), int(end), float(when)] for start, end, when in checkpoint.get('reads', [])]
+            return int(checkpoint['offset']), checkpoint.get('inode'), reads
+        except FileNotFoundError:
+            return 0, None, []
+        except (ValueError, KeyError, TypeError) as e:
+            print(f"Ignoring unreadable checkpoint '{self.checkpoint_path}': {e}")
+            return 0, None, []
+
+    def _save_checkpoint(self, force=False):
+        """Writes the committed offset and read times atomically (temp file, fsync, rename), if they changed."""
+        if self.committed == self.saved and not force:
+            return
+        self._reads = [read for read in self._reads if read[1] > self.committed]
+        temp_path = self.checkpoint_path + '.tmp'
+        with open(temp_path, 'w') as f:
+            json.dump({'offset': self.committed, 'inode': self.inode, 'reads': self._reads}, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(temp_path, self.checkpoint_path)
+        self.saved = self.committed
+
+    def _drain_fifo(self):
+        """Appends whatever is waiting in the named pipe to the journal."""
+        if self._fifo_fd is None:
+            # Non-blocking, so an idle pipe (or one with no writer yet) doesn't stall discovery.
+            self._fifo_fd = os.open(self.path, os.O_RDONLY | os.O_NONBLOCK)
+        chunks = []
+        while True:
+            try:
+                chunk = os.read(self._fifo_fd, 65536)
+            except BlockingIOError:
+                break
+            if not chunk:
+                break
+            chunks.append(chunk)
+        # Only whole lines go to the journal, so pushed alerts (see enqueue) never land mid-line.
+        data = self._fifo_partial + b''.join(chunks)
+        cut = data.rfind(b'\n') + 1
+        self._fifo_partial = data[cut:]
+        if cut:
+            with open(self.stream_path, 'ab') as journal:
+                journal.write(data[:cut])
+                journal.flush()
+                os.fsync(journal.fileno())
+
+    def _restart(self, inode, reason):
+        print(f"Stream '{self.stream_path}' {reason}; reading it from the start.")
+        self._generation += 1
+        self._records.clear()
+        self._order.clear()
+        self._done.clear()
+        self._reads = []
+        self.committed = self.read_offset = 0
+        self.inode = inode
+        self.saved = None
+
+    def discover(self):
+        """Reads up to max_records new complete lines and returns their keys."""
+        with self._lock:
+            if self.is_fifo:
+                self._drain_fifo()
+            self._save_checkpoint()
+            try:
+                st = os.stat(self.stream_path)
+            except FileNotFoundError:
+                return []
+
+            if self.inode is None:
+                self.inode = st.st_ino
+            elif st.st_ino != self.inode:
+                self._restart(st.st_ino, "was replaced")
+            elif st.st_size < self.read_offset:
+                self._restart(st.st_ino, "was truncated")
+
+            if st.st_size <= self.read_offset:
+                if self.is_fifo and not self._order and st.st_size > 0:
+                    # Everything in the journal is done; empty it rather than let it grow.
+                    os.truncate(self.stream_path, 0)
+                    self.committed = self.read_offset = 0
+                    self._reads = []
+                    self.saved = None
+                    self._save_checkpoint()
+                return []
+
+            keys = []
+            now = time.time()
+            first = self.read_offset
+            with open(self.stream_path, 'rb') as f:
+                f.seek(self.read_offset)
+                while len(keys) < self.max_records:
+                    start = self.read_offset
+                    line = f.readline()
+                    if not line.endswith(b'\n'):
+                        break  # Not completely written yet.
+                    self.read_offset += len(line)
+                    key = f"{self._generation}:{start}"
+                    self._order.append((key, self.read_offset))
+                    if line.strip():
+                        self._records[key] = (line, self._read_time(start, now))
+                        keys.append(key)
+                    else:
+                        self._done.add(key)
+            read_end = max([first] + [end for _, end, _ in self._reads])
+            if self.read_offset > read_end:
+                # Saved before any of these lines can be sent, so a restart re-reads them with this time.
+                self._reads.append([read_end, self.read_offset, now])
+                self._advance()
+                self._save_checkpoint(force=True)
+            else:
+                self._advance()
+            return keys
+
+    def _read_time(self, offset, now):
+        """Returns when the line at offset was first read: a saved read time, else now."""
+        for start, end, when in self._reads:
+            if start <= offset < end:
+                return when
+        return now
+
+    def has_more(self):
+        return False
+
+    def parse(self, key):
         """
+        Returns (alert, received_at) for a line read by discover().
 
-        message = ''
-
-        # TODO: this code is a train wreck. 
-        # TODO: sort out timezones, and go with UTC. 
-        # Try to parse the created_at timestamp and format it
-
-        message_content = alert_json.get('message', 'No message content available.')
-        created_at = alert_json.get('created_at', 'Timestamp not available.')
-
-        if created_at == 'now' or created_at == 'YYYY-MM-DD HH:mm:ss' or created_at == '' or created_at == 0:
-            now_utc = datetime.now(timezone.utc)
-            created_at = now_utc.strftime('%Y-%m-%dT%H:%M:%S+00:00')
-
-        formatted_time = created_at
-
-        host = alert_json.get('host', 'Unknown host')
-        site_id = alert_json.get('host_site_id', 'N/A')
-        sensor_id = alert_json.get('host_sensor_id', 'N/A')
-        tags = alert_json.get('tags', [])
-        tags_string = ' '.join(['#' + tag for tag in tags]) if tags else ''
-
-        # Initial message with site and sensor IDs
-        message = (
-            f"{message_content}\n\n"
-            f"Generated by: {host} at {formatted_time} UTC\n"
-            f"(Site ID: {site_id}, Sensor ID: {sensor_id})\n"
-            f"{tags_string}"
-        ).strip()
-
-        if len(message) <= 300:
-            return message
-        else:
-            # Truncate by removing site and sensor IDs
-            truncated_message = (
-                f"{message_content}\n\n"
-                f"Generated by: {host} at {formatted_time}\n"
-                f"{tags_string}"
-            ).strip()
-
-        if len(truncated_message) <= 300:
-            return truncated_message
-        else:
-            # If still too long, further truncate the original message content
-            remaining_length = 300 - (len(f"\n\nGenerated by: {host} at {formatted_time}\n{tags_string}") + 3) # +3 for ellipsis
-            truncated_content = message_content[:max(0, remaining_length)] + "..."
-            final_truncated_message = (
-                f"{truncated_content}\n\n"
-                f"Generated by: {host} at {formatted_time}\n"
-                f"{tags_string}"
-            ).strip()
-            return final_truncated_message
-
-    def send_notification(self, message):
+        Raises:
+            FileNotFoundError: The key is unknown (the stream restarted since it was read).
+            AlertValidationError: The line is not a JSON object, or not a valid alert.
+        """
+        with self._lock:
+            entry = self._records.get(key)
+        if entry is None:
+            raise FileNotFoundError(key)
+        line, received_at = entry
         try:
+            alert_json = json.loads(line)
+        except ValueError as e:
+            raise AlertValidationError(f"Not a JSON line: {e}") from None
+        return validate_alert(alert_json, now=received_at), received_at
 
-            config = {}
-            config['handle'] = self.BLUESKY_HANDLE
-            config['password'] = self.BLUESKY_PASSWORD
-            config['pds_url'] = self.BLUESKY_PDS_URL
-            config['media_folder'] = ''
-        
-            if not (config['handle'] and config['password']):
-                print("both handle and password are required", file=sys.stderr)
-                sys.exit(-1)
+    def enqueue(self, alerts):
+        """
+        Durably appends pushed alert mappings to the stream (the journal, for a named pipe).
 
-            # Run the asynchronous create_post method using asyncio.run
-            asyncio.run(self.poster.create_post(config, message))
-            print(f"Bluesky notification sent: {message}")
-        except Exception as e:
-            raise Exception(f"Error sending Bluesky notification: {e}")
+        Returns:
+            None; the lines get their keys when discover() reads them.
+        """
+        data = ''.join(json.dumps(alert_json, default=str, ensure_ascii=False) + '\n' for alert_json in alerts)
+        with self._lock:
+            with open(self.stream_path, 'ab') as f:
+                f.write(data.encode('UTF-8'))
+                f.flush()
+                os.fsync(f.fileno())
+        return None
 
-def main_loop(alert_system, interval=1):
+    def mark_sent(self, key):
+        with self._lock:
+            self._finish(key)
+
+    def mark_failed(self, key):
+        with self._lock:
+            entry = self._records.get(key)
+            if entry is not None:
+                with open(self.failed_path, 'ab') as f:
+                    f.write(entry[0])
+            self._finish(key)
+
+    def _finish(self, key):
+        if self._records.pop(key, None) is not None:
+            self._done.add(key)
+            self._advance()
+
+    def _advance(self):
+        """Moves the committed offset past the leading run of finished lines."""
+        while self._order and self._order[0][0] in self._done:
+            key, end = self._order.popleft()
+            self._done.discard(key)
+            self.committed = end
+
+    def close(self):
+        """Writes the final checkpoint and closes the named pipe."""
+        with self._lock:
+            self._save_checkpoint()
+            if self._fifo_fd is not None:
+                os.close(self._fifo_fd)
+                self._fifo_fd = None
+        super().close()
+
+def main_loop(alert_system, interval=1, profiler=None):
     """Main loop to periodically check for and process alerts."""
     print("Alert monitoring started...")
     while True:
         alert_system.check_for_alerts()
+        if profiler is not None:
+            profiler.maybe_dump()
         print(f"Checked for alerts, sleeping for {interval} seconds.")
         time.sleep(interval)
 
+async def run_pipeline(pipeline, notifier, ingest=None):
+    """Runs the pipeline (and the push ingest server, if any), closing both and the notifier's connections at the end."""
+    try:
+        if ingest is not None:
+            await ingest.start()
+        await pipeline.run()
+    finally:
+        if ingest is not None:
+            await ingest.stop()
+        await notifier.close_async()
+
+def parse_args():
+    parser = argparse.ArgumentParser(description="Watch for alerts and post them to Bluesky (or email them).")
+    parser.add_argument("--notify", choices=("bluesky", "email"), default="bluesky",
+                        help="Notification channel: post to Bluesky (default) or email the SMTP_* subscribers")
+    parser.add_argument("--charts", action="store_true", help="Attach a rain accumulation chart to alerts with rain data")
+    parser.add_argument("--chart-workers", type=int, default=2, help="Number of chart render processes")
+    parser.add_argument("--rain-store", metavar="DIR", help="Rain history store used to chart alerts that only carry a site_key")
+    parser.add_argument("--sent-cache", metavar="PATH", default=os.path.join(FileAlert.ALERT_FOLDER, '.sent_fingerprints.jsonl'),
+                        help="File of recently sent alert fingerprints (default: inbox/.sent_fingerprints.jsonl)")
+    parser.add_argument("--no-sent-cache", action="store_true", help="Don't skip alerts found in the sent cache")
+    parser.add_argument("--accounts", metavar="PATH", help="Accounts file routing alerts to accounts by host or site_key")
+    parser.add_argument("--account-idle", type=float, default=900, help="Seconds before an idle account's connections are closed (default 900)")
+    parser.add_argument("--database", action="store_true", help="Take alerts from pending rows of the message table instead of the inbox")
+    parser.add_argument("--stream", metavar="PATH", help="Take alerts from JSON lines appended to PATH (a file or named pipe) instead of the inbox")
+    parser.add_argument("--stream-checkpoint", metavar="PATH", help="Offset checkpoint for --stream (default: <stream>.offset)")
+    parser.add_argument("--stream-batch", type=int, default=500, help="Most lines read from the stream per poll (default 500)")
+    parser.add_argument("--listen-socket", metavar="PATH", help="Accept pushed alerts on this Unix domain socket (pipeline only)")
+    parser.add_argument("--listen-port", type=int, help="Accept pushed alerts over HTTP on this loopback port (pipeline only)")
+    parser.add_argument("--listen-host", default="127.0.0.1", help="Loopback address for --listen-port (default 127.0.0.1)")
+    parser.add_argument("--latency-log", metavar="DIR", default=FileAlert.SENT_FOLDER,
+                        help="Folder for the daily latency audit files (default: inbox/sent)")
+    parser.add_argument("--no-latency-log", action="store_true", help="Don't record per-alert latency")
+    parser.add_argument("--db-batch-size", type=int, default=50, help="Rows claimed per database round trip (default 50)")
+    parser.add_argument("--claim-lease", type=float, default=600,
+                        help="Seconds before a claimed database row left in 'sending' is taken back (default 600)")
+    parser.add_argument("--no-pipeline", action="store_true", help="Check, send and move inbox alerts in one loop instead of the staged pipeline")
+    parser.add_argument("--parse-workers", type=int, default=4, help="Pipeline parse workers (default 4)")
+    parser.add_argument("--render-workers", type=int, default=2, help="Pipeline render workers (default 2)")
+    parser.add_argument("--send-workers", type=int, default=1, help="Pipeline send workers (default 1)")
+    parser.add_argument("--parse-queue", type=int, default=64, help="Pipeline parse queue limit (default 64)")
+    parser.add_argument("--render-queue", type=int, default=64, help="Pipeline render queue limit (default 64)")
+    parser.add_argument("--send-queue", type=int, default=64, help="Pipeline send queue limit (default 64)")
+    parser.add_argument("--stats-interval", type=float, default=10, help="Seconds between pipeline queue depth lines (0 disables)")
+    parser.add_argument("--batch-size", type=int, default=1, help="Post up to N alerts per applyWrites request (default 1)")
+    parser.add_argument("--aging-seconds", type=float, default=60, help="Wait that makes up for one severity level (default 60)")
+    parser.add_argument("--max-per-cycle", type=int, default=0, help="Alerts sent per inbox check; 0 drains the queue (default 0)")
+    parser.add_argument("--profile", metavar="DIR", help="Write profile, memory and task dumps to DIR")
+    parser.add_argument("--profile-every-alerts", type=int, default=100, help="Dump a profile every N alerts (0 disables)")
+    parser.add_argument("--profile-every-seconds", type=float, default=300, help="Dump a profile every N seconds (0 disables)")
+    parser.add_argument("--profile-task-interval", type=float, default=60, help="Seconds between async task dumps (0 disables)")
+    parser.add_argument("--profile-keep", type=int, default=20, help="Number of dump sets kept in the profile directory")
+    return parser.parse_args()
+
 if __name__ == "__main__":
+    args = parse_args()
+
     # Instantiate the specific alert and notification systems
+    chart_renderer = None
+    profiler = None
+    sent_cache = None
+    audit = None
+    alert_system = None
     try:
-        bluesky_notifier = BlueskyNotification()
-        file_alerter = FileAlert()
+        if args.charts:
+            from rain_chart import RainChartRenderer
+            chart_renderer = RainChartRenderer(max_workers=args.chart_workers)
+
+        router = None
+        if args.accounts:
+            from account_router import AccountRouter
+            router = AccountRouter.from_file(args.accounts, idle_seconds=args.account_idle)
+        if args.notify == 'email':
+            if args.charts or args.accounts or args.rain_store:
+                raise ValueError("--charts, --accounts and --rain-store only apply to --notify bluesky")
+            notifier = EMailNotification()
+        else:
+            notifier = BlueskyNotification(chart_renderer=chart_renderer, router=router)
+            if not args.no_sent_cache:
+                sent_cache = notifier.sent_cache = SentCache(args.sent_cache)
+            if args.rain_store:
+                from rain_store import RainStore
+                notifier.rain_store = RainStore(args.rain_store)
+        if args.database:
+            alert_system = DatabaseAlert(batch_size=args.db_batch_size, claim_lease=args.claim_lease)
+        else:
+            if args.stream:
+                alert_system = StreamAlert(args.stream, checkpoint_path=args.stream_checkpoint,
+                                           max_records=args.stream_batch, aging_seconds=args.aging_seconds)
+            else:
+                alert_system = FileAlert(aging_seconds=args.aging_seconds)
+            alert_system.batch_size = args.batch_size
+            alert_system.max_per_cycle = args.max_per_cycle
 
         # Inject the notification system into the alert system
-        file_alerter.notification_system = bluesky_notifier
-
-        # Start the main loop with the configured alert system
-        main_loop(file_alerter)
+        alert_system.notification_system = notifier
+
+        if not args.no_latency_log:
+            from latency_audit import LatencyAudit
+            audit = LatencyAudit(args.latency_log)
+            if args.database or args.no_pipeline:
+                alert_system.audit = audit
+
+        if args.profile:
+            from daemon_profiler import DaemonProfiler
+            profiler = DaemonProfiler(args.profile,
+                                      every_alerts=args.profile_every_alerts,
+                                      every_seconds=args.profile_every_seconds,
+                                      task_interval=args.profile_task_interval,
+                                      keep=args.profile_keep)
+            alert_system.profiler = profiler
+            notifier.profiler = profiler
+            profiler.start()
+
+        listening = args.listen_socket or args.listen_port is not None
+        if listening and (args.database or args.no_pipeline):
+            raise ValueError("--listen-socket and --listen-port need the pipeline (not --database or --no-pipeline)")
+
+        if args.database or args.no_pipeline:
+            # Start the main loop with the configured alert system
+            main_loop(alert_system, profiler=profiler)
+        else:
+            from alert_pipeline import AlertPipeline
+            pipeline = AlertPipeline(alert_system, notifier,
+                                     parse_workers=args.parse_workers,
+                                     render_workers=args.render_workers,
+                                     send_workers=args.send_workers,
+                                     parse_queue_size=args.parse_queue,
+                                     render_queue_size=args.render_queue,
+                                     send_queue_size=args.send_queue,
+                                     batch_size=args.batch_size,
+                                     aging_seconds=args.aging_seconds,
+                                     stats_interval=args.stats_interval,
+                                     profiler=profiler,
+                                     audit=audit)
+            ingest = None
+            if listening:
+                from push_ingest import PushIngest
+                ingest = PushIngest(alert_system, pipeline, socket_path=args.listen_socket,
+                                    host=args.listen_host, port=args.listen_port)
+            print("Alert monitoring started (pipeline)...")
+            asyncio.run(run_pipeline(pipeline, notifier, ingest))
 
     except ValueError as ve:
         print(f"Configuration Error: {ve}")
     except Exception as e:
-        print(f"An unexpected error occurred: {e}")
\ No newline at end of file
+        print(f"An unexpected error occurred: {e}")
+    finally:
+        if profiler is not None:
+            profiler.stop()
+        if chart_renderer is not None:
+            chart_renderer.close()
+        if sent_cache is not None:
+            sent_cache.close()
+        if audit is not None:
+            audit.close()
+        if isinstance(alert_system, (DatabaseAlert, FileAlert)):
+            alert_system.close()
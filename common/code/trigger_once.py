@@ -0,0 +1,158 @@
+# trigger_once.py
+'''
+One-shot trigger: posts the given alert file(s) and exits.
+
+Meant for cron jobs and base-station hooks that call us once per alert, where interpreter
+start-up and imports are most of the wall-clock time. Only what the chosen path needs is
+imported, and never the daemon module (trigger_notify.py) with its inbox machinery:
+
+* messages are built by bluesky_message, so a --dry-run never loads aiohttp, requests or dotenv;
+* posting uses notification.BlueskyNotification, and loads dotenv only if there is a
+  .env.local to read;
+* JSON alerts never load yaml, whether posted or not.
+
+scripts/bench_startup.py times both paths and fails when they load more.
+
+Run it as scripts/trigger_notify.py, or as the trigger-notify-once console script once the
+project is installed (pip install -e .).
+
+    python3 scripts/trigger_notify.py inbox/alert_20250530T041854Z.yaml
+    python3 scripts/trigger_notify.py --dry-run alert.json
+    cat alert.yaml | trigger-notify-once -
+'''
+
+__all__ = ["main"]
+
+import argparse
+import os
+import sys
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Post alert file(s) to Bluesky once and exit.")
+    parser.add_argument("files", nargs="+", help="Alert files (YAML or JSON); '-' reads one alert from stdin")
+    parser.add_argument("--dry-run", action="store_true", help="Print the message that would be posted, without posting")
+    parser.add_argument("--move", action="store_true", help="Move each file to a sibling sent/ or failed/ folder afterwards")
+    parser.add_argument("--charts", action="store_true", help="Attach a rain accumulation chart to alerts with rain data")
+    parser.add_argument("--sent-cache", metavar="PATH", help="Skip alerts recorded in this sent fingerprint file, and record new posts in it")
+    parser.add_argument("--accounts", metavar="PATH", help="Accounts file routing alerts to accounts by host or site_key")
+    return parser.parse_args(argv)
+
+def load_alert(path):
+    """Loads one alert; JSON is parsed with the json module so yaml is only imported for YAML files."""
+    if path == "-":
+        text = sys.stdin.read()
+    else:
+        with open(path, "r") as f:
+            text = f.read()
+
+    if path.endswith(".json") or text.lstrip().startswith("{"):
+        import json
+        return json.loads(text)
+
+    from alert_model import load_alert_yaml
+    return load_alert_yaml(text)
+
+def load_env():
+    """Loads the BLUESKY_* settings from .env.local next to this module, as the daemon does."""
+    env_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), ".env.local")
+    if os.path.exists(env_path):
+        from dotenv import load_dotenv
+        load_dotenv(dotenv_path=env_path)
+
+def move_file(path, ok):
+    """Moves a processed alert next to the inbox folders FileAlert uses."""
+    folder = os.path.join(os.path.dirname(os.path.abspath(path)), "sent" if ok else "failed")
+    os.makedirs(folder, exist_ok=True)
+    os.rename(path, os.path.join(folder, os.path.basename(path)))
+
+async def post_alerts(notifier, alerts):
+    """
+    Posts the (path, message, alert) tuples on one event loop, so the session is created once.
+
+    Several alerts go out as one applyWrites batch per account; each alert still gets its own result.
+    """
+    try:
+        return await _post_alerts(notifier, alerts)
+    finally:
+        await notifier.close_async()
+
+async def _post_alerts(notifier, alerts):
+    if len(alerts) > 1:
+        batch_results = await notifier.send_notifications_async([(message, alert_json) for _, message, alert_json in alerts])
+        results = []
+        for (path, _, _), result in zip(alerts, batch_results):
+            if result["ok"]:
+                print(f"Posted: {path}")
+            else:
+                print(f"Error posting '{path}': {result['error']}", file=sys.stderr)
+            results.append((path, result["ok"]))
+        return results
+
+    results = []
+    for path, message, alert_json in alerts:
+        try:
+            await notifier.send_notification_async(message, alert_json)
+            print(f"Posted: {path}")
+            results.append((path, True))
+        except Exception as e:
+            print(f"Error posting '{path}': {e}", file=sys.stderr)
+            results.append((path, False))
+    return results
+
+def main(argv=None):
+    args = parse_args(argv)
+
+    from alert_model import validate_alert
+    from bluesky_message import build_message
+
+    alerts = []
+    results = []
+    for path in args.files:
+        try:
+            alert_json = validate_alert(load_alert(path))
+            alerts.append((path, build_message(alert_json), alert_json))
+        except Exception as e:
+            print(f"Error reading '{path}': {e}", file=sys.stderr)
+            results.append((path, False))
+
+    if args.dry_run:
+        for path, message, _ in alerts:
+            print(f"--- {path}\n{message}")
+        return 0 if not results else 1
+
+    if alerts:
+        import asyncio
+
+        chart_renderer = None
+        sent_cache = None
+        load_env()
+        from notification import BlueskyNotification
+
+        if args.charts:
+            from rain_chart import RainChartRenderer
+            chart_renderer = RainChartRenderer(max_workers=1)
+        try:
+            router = None
+            if args.accounts:
+                from account_router import AccountRouter
+                router = AccountRouter.from_file(args.accounts)
+            notifier = BlueskyNotification(chart_renderer=chart_renderer, router=router)
+            if args.sent_cache:
+                from sent_cache import SentCache
+                sent_cache = notifier.sent_cache = SentCache(args.sent_cache)
+            results.extend(asyncio.run(post_alerts(notifier, alerts)))
+        except ValueError as ve:
+            print(f"Configuration Error: {ve}", file=sys.stderr)
+            return 2
+        finally:
+            if chart_renderer is not None:
+                chart_renderer.close()
+            if sent_cache is not None:
+                sent_cache.close()
+
+    if args.move:
+        for path, ok in results:
+            if path != "-" and os.path.exists(path):
+                move_file(path, ok)
+
+    return 0 if all(ok for _, ok in results) else 1
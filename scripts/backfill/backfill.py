@@ -0,0 +1,308 @@
+import os
+import csv
+import sys
+import json
+import zlib
+import argparse
+import logging
+import multiprocessing
+from collections import Counter
+from datetime import datetime, timezone
+from pathlib import Path
+
+import numpy as np
+import yaml
+
+script_dir = Path(__file__).parent
+sys.path.append(str(script_dir.parent.parent / 'common' / 'code'))
+from alert_hysteresis import AlertLevel, SiteStateMachine
+from rain_report import RAIN_WINDOWS
+
+# Logging setup
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+)
+
+WINDOW_INDEX = {window: i for i, window in enumerate(RAIN_WINDOWS)}
+
+# Chunks waiting per worker; with --chunk-rows this bounds the memory of the reader.
+QUEUE_CHUNKS = 2
+
+def to_epoch(value):
+    """Converts epoch seconds, an ISO 8601 string or a datetime (naive times are UTC) to epoch seconds."""
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value)
+        except ValueError:
+            value = datetime.fromisoformat(value.strip().replace('Z', '+00:00'))
+    if value.tzinfo is None:
+        value = value.replace(tzinfo=timezone.utc)
+    return value.timestamp()
+
+def _chunk(sites, times, rows):
+    return np.array(sites, dtype=str), np.array(times, dtype=np.float64), np.array(rows, dtype=np.float32).reshape(-1, len(RAIN_WINDOWS))
+
+def _row_values(rain):
+    values = []
+    for window in RAIN_WINDOWS:
+        try:
+            values.append(float(rain.get(window) or 0))
+        except (TypeError, ValueError):
+            values.append(0.0)
+    return values
+
+def read_store_chunks(root, chunk_rows):
+    """
+    Yields (site_keys, times, values) arrays of up to chunk_rows reports from a RainStore directory.
+
+    Sites are read one at a time, oldest first; a window without a record at a report time reads as 0.
+    """
+    from rain_store import RainStore
+
+    store = RainStore(root)
+    try:
+        for site in store.sites():
+            series = [store.read(site, window) for window in RAIN_WINDOWS]
+            times = np.unique(np.concatenate([records['t'] for records in series]))
+            values = np.zeros((len(times), len(RAIN_WINDOWS)), dtype=np.float32)
+            for index, records in enumerate(series):
+                values[np.searchsorted(times, records['t']), index] = records['v']
+            for start in range(0, len(times), chunk_rows):
+                chunk_times = times[start:start + chunk_rows].astype(np.float64)
+                yield np.full(len(chunk_times), site), chunk_times, values[start:start + chunk_rows]
+    finally:
+        store.close()
+
+def read_chunks(path, chunk_rows):
+    """
+    Yields (site_keys, times, values) arrays of up to chunk_rows reports from a history file.
+
+    CSV and Parquet have site_key, created_at (or time) and one column per rain window; JSONL
+    lines are reports in the rain_intensity.json shape. Parquet needs the pyarrow package.
+    A directory is read as a rain_store.py store.
+    """
+    if os.path.isdir(path):
+        yield from read_store_chunks(path, chunk_rows)
+        return
+
+    suffix = Path(path).suffix.lower()
+    sites, times, rows = [], [], []
+
+    if suffix == '.parquet':
+        import pyarrow.parquet as pq
+
+        parquet = pq.ParquetFile(path)
+        names = set(parquet.schema_arrow.names)
+        time_column = 'created_at' if 'created_at' in names else 'time'
+        windows = [window for window in RAIN_WINDOWS if window in names]
+        for batch in parquet.iter_batches(batch_size=chunk_rows, columns=['site_key', time_column] + windows):
+            data = batch.to_pydict()
+            values = np.zeros((batch.num_rows, len(RAIN_WINDOWS)), dtype=np.float32)
+            for window in windows:
+                column = batch.column(window).to_numpy(zero_copy_only=False)
+                values[:, WINDOW_INDEX[window]] = np.nan_to_num(column.astype(np.float32))
+            yield (np.array(data['site_key'], dtype=str),
+                   np.array([to_epoch(value) for value in data[time_column]], dtype=np.float64),
+                   values)
+        return
+
+    with open(path, 'r', newline='') as f:
+        if suffix == '.csv':
+            records = ((row, row) for row in csv.DictReader(f))
+        else:
+            records = ((report, report.get('rain', report)) for report in map(json.loads, filter(str.strip, f)))
+        for report, rain in records:
+            sites.append(report['site_key'])
+            times.append(to_epoch(report.get('created_at') or report.get('time')))
+            rows.append(_row_values(rain))
+            if len(sites) == chunk_rows:
+                yield _chunk(sites, times, rows)
+                sites, times, rows = [], [], []
+    if sites:
+        yield _chunk(sites, times, rows)
+
+def load_sets(path):
+    """Loads candidate sets: {"sets": {name: {"levels": [...], "notify_clear": bool}}}."""
+    with open(path, 'r') as f:
+        data = yaml.safe_load(f) or {}
+    sets = {}
+    for name, spec in (data.get('sets') or {}).items():
+        sets[name] = ([AlertLevel(**level) for level in spec['levels']], bool(spec.get('notify_clear')))
+    if not sets:
+        raise ValueError(f"No candidate sets in {path}")
+    return sets
+
+class _Row:
+    """A report row as the {window: value} mapping SiteStateMachine.update() reads."""
+    __slots__ = ('values',)
+
+    def __init__(self, values):
+        self.values = values
+
+    def get(self, window, default=None):
+        return float(self.values[WINDOW_INDEX[window]])
+
+class SetEvaluator:
+    """
+    Replays one candidate set over site histories.
+
+    Which reports can change a site's state is worked out with NumPy over the whole chunk: a
+    report below every level's exit threshold can't raise a level, so runs of such quiet reports
+    only matter for their first report (clears a pending level, or leaves a level whose hold has
+    passed) and for the report at which the current level's hold runs out. Only those reports and
+    the active ones go through the exact SiteStateMachine, so results match the live daemon.
+    """
+    def __init__(self, name, levels, notify_clear):
+        self.name = name
+        self.machine = SiteStateMachine(levels, notify_clear=notify_clear)
+        self.windows = np.array([WINDOW_INDEX[level.window] for level in levels])
+        self.exits = np.array([level.exit for level in levels], dtype=np.float32)
+        self.events = []
+        self.replayed = 0
+
+    def _feed(self, site, times, values, i):
+        self.replayed += 1
+        transition = self.machine.update(site, _Row(values[i]), float(times[i]))
+        if transition is not None and transition.notify:
+            self.events.append((self.name, site, transition.t,
+                                self.machine.level_name(transition.from_level),
+                                self.machine.level_name(transition.to_level), transition.value))
+
+    def _quiet_run(self, site, times, values, start, end):
+        if site not in self.machine.states:
+            return  # Clear with nothing pending: quiet reports change nothing.
+        self._feed(site, times, values, start)
+        state = self.machine.states.get(site)
+        if state is None or state.level == 0:
+            return
+        hold_end = state.since + self.machine.levels[state.level - 1].hold
+        i = start + 1 + int(np.searchsorted(times[start + 1:end], hold_end))
+        if i < end:
+            self._feed(site, times, values, i)
+
+    def evaluate(self, site, times, values):
+        """Replays one site's reports (in time order) from a chunk."""
+        active = np.flatnonzero((values[:, self.windows] >= self.exits).any(axis=1))
+        start = 0
+        for i in active.tolist() + [len(times)]:
+            if i > start:
+                self._quiet_run(site, times, values, start, i)
+            if i < len(times):
+                self._feed(site, times, values, i)
+            start = i + 1
+
+def worker(sets, inbox, outbox):
+    """Evaluates every candidate set over the sites routed to this process."""
+    evaluators = [SetEvaluator(name, levels, notify_clear) for name, (levels, notify_clear) in sets.items()]
+    last_time = {}
+    reports = stale = 0
+    while True:
+        item = inbox.get()
+        if item is None:
+            break
+        sites, times, values = item
+        order = np.lexsort((times, sites))
+        sites, times, values = sites[order], times[order], values[order]
+        bounds = np.flatnonzero(sites[1:] != sites[:-1]) + 1
+        for start, end in zip(np.r_[0, bounds], np.r_[bounds, len(sites)]):
+            site = str(sites[start])
+            site_times, site_values = times[start:end], values[start:end]
+            # Reports must arrive in time order per site; anything older than what was replayed is skipped.
+            fresh = site_times > last_time.get(site, -np.inf)
+            if not fresh.all():
+                stale += int((~fresh).sum())
+                site_times, site_values = site_times[fresh], site_values[fresh]
+            if not len(site_times):
+                continue
+            last_time[site] = site_times[-1]
+            reports += len(site_times)
+            for evaluator in evaluators:
+                evaluator.evaluate(site, site_times, site_values)
+    outbox.put({
+        'events': [event for evaluator in evaluators for event in evaluator.events],
+        'replayed': {evaluator.name: evaluator.replayed for evaluator in evaluators},
+        'reports': reports,
+        'stale': stale,
+        'sites': len(last_time),
+    })
+
+def run_backfill(paths, sets, workers=None, chunk_rows=200000):
+    """Streams the history files through a pool of worker processes; returns the merged results."""
+    workers = workers or os.cpu_count() or 1
+    inboxes = [multiprocessing.Queue(QUEUE_CHUNKS) for _ in range(workers)]
+    outbox = multiprocessing.Queue()
+    processes = [multiprocessing.Process(target=worker, args=(sets, inbox, outbox), daemon=True) for inbox in inboxes]
+    for process in processes:
+        process.start()
+
+    # Each site always goes to the same worker, which holds its state between chunks.
+    worker_of = {}
+    for path in paths:
+        for sites, times, values in read_chunks(path, chunk_rows):
+            unique, inverse = np.unique(sites, return_inverse=True)
+            targets = np.array([worker_of.setdefault(site, zlib.crc32(site.encode()) % workers) for site in unique.tolist()])
+            row_targets = targets[inverse]
+            for index, inbox in enumerate(inboxes):
+                mask = row_targets == index
+                if mask.any():
+                    inbox.put((sites[mask], times[mask], values[mask]))
+            logging.info(f"{path}: dispatched {len(sites)} reports")
+
+    for inbox in inboxes:
+        inbox.put(None)
+    results = [outbox.get() for _ in processes]
+    for process in processes:
+        process.join()
+
+    merged = {'events': [], 'replayed': Counter(), 'reports': 0, 'stale': 0, 'sites': 0}
+    for result in results:
+        merged['events'].extend(result['events'])
+        merged['replayed'].update(result['replayed'])
+        for key in ('reports', 'stale', 'sites'):
+            merged[key] += result[key]
+    merged['events'].sort(key=lambda event: (event[0], event[2], event[1]))
+    return merged
+
+def print_report(sets, merged, top_days=5):
+    print(f"{merged['reports']} reports from {merged['sites']} sites"
+          + (f" ({merged['stale']} out-of-order reports skipped)" if merged['stale'] else ""))
+    for name in sets:
+        events = [event for event in merged['events'] if event[0] == name]
+        by_level = Counter(event[4] for event in events)
+        by_day = Counter(datetime.fromtimestamp(event[2], timezone.utc).strftime('%Y-%m-%d') for event in events)
+        print(f"\n{name}: {len(events)} alerts at {len({event[1] for event in events})} sites"
+              f" ({merged['replayed'][name]} reports replayed exactly)")
+        for level, count in sorted(by_level.items(), key=lambda item: -item[1]):
+            print(f"  {level:<12}{count:>8}")
+        if events:
+            first, last = events[0][2], events[-1][2]
+            print(f"  first {datetime.fromtimestamp(first, timezone.utc):%Y-%m-%d %H:%M}, "
+                  f"last {datetime.fromtimestamp(last, timezone.utc):%Y-%m-%d %H:%M} UTC")
+            busiest = ", ".join(f"{day} ({count})" for day, count in by_day.most_common(top_days))
+            print(f"  busiest days: {busiest}")
+
+def write_events(path, events):
+    with open(path, 'w', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['set', 'site_key', 'time', 'from_level', 'to_level', 'value'])
+        for name, site, t, from_level, to_level, value in events:
+            writer.writerow([name, site, datetime.fromtimestamp(t, timezone.utc).isoformat(), from_level, to_level, f"{value:g}"])
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description="Replay rain history against candidate alert thresholds, without posting.")
+    parser.add_argument('history', nargs='+', help='History files (.csv, .jsonl or .parquet) or rain_store.py directories')
+    parser.add_argument('--sets', required=True, help='YAML file of candidate threshold sets')
+    parser.add_argument('--workers', type=int, help='Worker processes (default: one per CPU)')
+    parser.add_argument('--chunk-rows', type=int, default=200000, help='Reports read per chunk (default 200000)')
+    parser.add_argument('--events', metavar='CSV', help='Also write every alert that would have fired to this CSV file')
+    args = parser.parse_args()
+
+    candidate_sets = load_sets(args.sets)
+    results = run_backfill(args.history, candidate_sets, workers=args.workers, chunk_rows=args.chunk_rows)
+    print_report(candidate_sets, results)
+    if args.events:
+        write_events(args.events, results['events'])
+        logging.info(f"Wrote {len(results['events'])} alerts to {args.events}")
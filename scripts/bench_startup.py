@@ -0,0 +1,143 @@
+#!/usr/bin/env python3
+"""
+Start-up time benchmark for the one-shot trigger (scripts/trigger_notify.py).
+
+Runs the one-shot trigger several times in fresh interpreters, both as a --dry-run and as a
+post (to a PDS address nothing listens on, so the run stops at the login after every import
+the posting path needs). Fails (exit code 1) when either median wall-clock time is over its
+budget, or when a path imports modules it should not need:
+
+* a dry run: aiohttp, requests or dotenv;
+* a post: the daemon module (trigger_notify) or its inbox machinery (alert_writer, inbox_scanner);
+* either, for a JSON alert: yaml (checked with a JSON copy of the alert).
+
+Usage:
+    python3 scripts/bench_startup.py
+    python3 scripts/bench_startup.py --runs 20 --budget-ms 200 --alert inbox/example_alert.yaml
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+SCRIPTS_DIR = Path(__file__).resolve().parent
+ONE_SHOT = SCRIPTS_DIR / "trigger_notify.py"
+DEFAULT_ALERT = SCRIPTS_DIR / "create_message" / "new_message.yaml"
+
+# Heavy modules that only the posting path should load.
+FORBIDDEN_ON_DRY_RUN = ("aiohttp", "requests", "dotenv")
+# The daemon module and the inbox machinery it loads; posting one alert needs none of them.
+FORBIDDEN_ON_POST = ("trigger_notify", "alert_writer", "inbox_scanner")
+# A JSON alert is read with the json module, so yaml must not load either.
+FORBIDDEN_ON_JSON = ("yaml",)
+
+def unused_port():
+    with socket.socket() as probe:
+        probe.bind(("127.0.0.1", 0))
+        return probe.getsockname()[1]
+
+def command(alert, post, env):
+    """Returns the (argv, environment) of one run; a post goes to a PDS address nothing listens on."""
+    if not post:
+        return [str(ONE_SHOT), "--dry-run", str(alert)], env
+    env = dict(env, BLUESKY_PDS_URL=f"http://127.0.0.1:{unused_port()}",
+               BLUESKY_HANDLE="bench.invalid", BLUESKY_PASSWORD="bench")
+    return [str(ONE_SHOT), str(alert)], env
+
+def time_run(alert, post=False):
+    argv, env = command(alert, post, os.environ)
+    start = time.perf_counter()
+    # A post fails at the login by design, so only a dry run must succeed.
+    subprocess.run([sys.executable] + argv, check=not post, env=env,
+                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    return (time.perf_counter() - start) * 1000
+
+def import_times(alert, post=False):
+    """Returns {module: cumulative microseconds} from python -X importtime."""
+    argv, env = command(alert, post, os.environ)
+    proc = subprocess.run([sys.executable, "-X", "importtime"] + argv, check=not post, env=env,
+                          stdout=subprocess.DEVNULL, stderr=subprocess.PIPE, text=True)
+    times = {}
+    for line in proc.stderr.splitlines():
+        if not line.startswith("import time:"):
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        if not cumulative.strip().isdigit():
+            continue  # Header line.
+        # Nested imports are indented; top-level imports start right after the separator space.
+        times[name[1:].rstrip()] = int(cumulative)
+    return times
+
+def json_copy(alert, folder):
+    """Writes the alert as JSON into folder (as is if it already is JSON); returns the path."""
+    with open(alert, "r") as f:
+        text = f.read()
+    if alert.endswith(".json") or text.lstrip().startswith("{"):
+        return alert
+    sys.path.insert(0, str(SCRIPTS_DIR.parent / "common" / "code"))
+    from alert_model import load_alert_yaml
+
+    path = os.path.join(folder, "alert.json")
+    with open(path, "w") as f:
+        json.dump(load_alert_yaml(text), f, default=str)
+    return path
+
+def forbidden_imports(times, forbidden):
+    """Returns the forbidden top-level packages among the imported modules."""
+    loaded = {name.strip().split(".")[0] for name in times}
+    return [name for name in forbidden if name in loaded]
+
+def check_path(name, alert, post, runs, budget_ms, top):
+    """Times one path and checks its imports; returns True if it passed."""
+    time_run(alert, post)  # Warm the file system cache and .pyc files.
+    samples = [time_run(alert, post) for _ in range(runs)]
+    median = statistics.median(samples)
+    print(f"one-shot {name}: median {median:.1f} ms, min {min(samples):.1f} ms, max {max(samples):.1f} ms "
+          f"over {runs} runs (budget {budget_ms:.0f} ms)")
+
+    times = import_times(alert, post)
+    top_level = {module: us for module, us in times.items() if not module.startswith(" ")}
+    print("slowest top-level imports:")
+    for module, us in sorted(top_level.items(), key=lambda item: item[1], reverse=True)[:top]:
+        print(f"  {us / 1000:8.1f} ms  {module}")
+
+    passed = True
+    forbidden = FORBIDDEN_ON_POST if post else FORBIDDEN_ON_DRY_RUN
+    loaded = forbidden_imports(times, forbidden)
+    if loaded:
+        print(f"FAIL: {name} imported {', '.join(loaded)}")
+        passed = False
+    with tempfile.TemporaryDirectory() as folder:
+        loaded = forbidden_imports(import_times(json_copy(alert, folder), post), forbidden + FORBIDDEN_ON_JSON)
+    if loaded:
+        print(f"FAIL: {name} of a JSON alert imported {', '.join(loaded)}")
+        passed = False
+    if median > budget_ms:
+        print(f"FAIL: {name} median start-up {median:.1f} ms is over the {budget_ms:.0f} ms budget")
+        passed = False
+    return passed
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the one-shot trigger's start-up time.")
+    parser.add_argument("--runs", type=int, default=10, help="Number of timed runs of each path (default 10)")
+    parser.add_argument("--budget-ms", type=float, default=250, help="Median dry-run budget in milliseconds (default 250)")
+    parser.add_argument("--post-budget-ms", type=float, default=750,
+                        help="Median budget of a post, up to its failed login, in milliseconds (default 750)")
+    parser.add_argument("--alert", default=str(DEFAULT_ALERT), help="Alert file used for the runs")
+    parser.add_argument("--top", type=int, default=10, help="Number of slowest top-level imports to list")
+    args = parser.parse_args()
+
+    passed = check_path("--dry-run", args.alert, False, args.runs, args.budget_ms, args.top)
+    print()
+    passed = check_path("post", args.alert, True, args.runs, args.post_budget_ms, args.top) and passed
+    return 0 if passed else 1
+
+if __name__ == "__main__":
+    sys.exit(main())
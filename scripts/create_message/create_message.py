@@ -1,13 +1,17 @@
 import os
+import json
+import random
+import time
+import uuid
 import yaml
 import argparse
 from pathlib import Path
 from dotenv import load_dotenv
 from datetime import datetime, timezone
-import shutil
 import logging
 import hashlib
-import psycopg
+import sys
+import asyncio
 
 # Load environment variables
 script_dir = Path(__file__).parent
@@ -20,19 +24,19 @@ logging.basicConfig(
     format='%(asctime)s - %(levelname)s - %(message)s',
 )
 
-# Database connection configuration
-DB_CONFIG = {
-    'dbname': os.getenv("POSTGRES_DATABASE_NAME"),
-    'user': os.getenv("POSTGRES_DATABASE_USER"),
-    'password': os.getenv("POSTGRES_DATABASE_PASSWORD"),
-    'host': os.getenv("POSTGRES_DATABASE_HOST"),
-    'port': os.getenv("POSTGRES_DATABASE_PORT")
-}
+# Database access goes through the pool shared with trigger_notify's DatabaseAlert.
+# Connection and pool settings come from the POSTGRES_* variables (see db_pool.py).
+sys.path.append(str(script_dir.parent.parent / 'common' / 'code'))
+from db_pool import AlertDatabase
+from alert_archive import AlertArchive
+from alert_model import load_alert_yaml
+from alert_writer import AlertWriter
 
 # Folder paths
 OUTBOX_FOLDER = script_dir.parent.parent / 'inbox'  # configurable outbox
 ARCHIVE_FOLDER = script_dir / 'archive'      # now local to the script folder
 NEW_MESSAGE_FILE = script_dir / 'new_message.yaml'
+LOAD_LOG_FOLDER = script_dir / 'load_runs'   # send logs from the load generator
 
 def get_timestamp_slug():
     return datetime.now(timezone.utc).strftime('%Y%m%dT%H%M%SZ')
@@ -41,7 +45,7 @@ def load_new_message():
     if not NEW_MESSAGE_FILE.exists():
         raise FileNotFoundError(f"{NEW_MESSAGE_FILE} does not exist.")
     with open(NEW_MESSAGE_FILE, 'r') as f:
-        data = yaml.safe_load(f)
+        data = load_alert_yaml(f)
     return data
 
 # Implementing a way to prevent the same exact message being sent twice. Ignores cre
@@ -60,48 +64,167 @@ def is_duplicate_message(message_data):
     for file in ARCHIVE_FOLDER.glob('*.yaml'):
         try:
             with open(file, 'r') as f:
-                archived_data = yaml.safe_load(f)
+                archived_data = load_alert_yaml(f)
             if get_message_hash(archived_data) == current_hash:
                 logging.info(f"Duplicate message found in archive: {file.name}")
                 return True
         except Exception as e:
             logging.warning(f"Could not read {file.name}: {e}")
             continue
+
+    # Older archived messages may have been compacted into bundles (see alert_archive.py).
+    for record in AlertArchive(ARCHIVE_FOLDER / 'bundles').iter_records():
+        if isinstance(record['alert'], dict) and get_message_hash(record['alert']) == current_hash:
+            logging.info(f"Duplicate message found in archive bundle: {record['name']}")
+            return True
     return False
 
-def insert_message(conn, data):
-    with conn.cursor() as cur:
-        cur.execute("""
-            INSERT INTO message (
-                message, created_by, created_at, site_uuid, host,
-                host_site_id, host_sensor_id, trigger_type,
-                target_channels, site_lat, site_long, tags
-            ) VALUES (
-                %(message)s, %(created_by)s, %(created_at)s, %(site_uuid)s, %(host)s,
-                %(host_site_id)s, %(host_sensor_id)s, %(trigger_type)s,
-                %(target_channels)s, %(site_lat)s, %(site_long)s, %(tags)s
-            )
-        """, data)
-        conn.commit()
-
-def write_yaml_file(data, directory=OUTBOX_FOLDER, archive=True):
-    os.makedirs(directory, exist_ok=True)
-    # Local?
-    # timestamp = datetime.now().strftime('%Y%m%dT%H%M%S')
-    # UTC 
-    timestamp = datetime.now(timezone.utc).isoformat()
-    filename = f"alert_{get_timestamp_slug()}.yaml"
-    file_path = directory / filename
-
-    with open(file_path, 'w') as f:
-        yaml.dump(data, f, sort_keys=False)
+async def insert_message(database, data):
+    await database.insert_message(data)
+
+async def insert_one_message(data):
+    """Opens a small pool, inserts one message and closes the pool."""
+    database = AlertDatabase(min_size=1, max_size=1)
+    await database.open()
+    try:
+        await insert_message(database, data)
+    finally:
+        await database.close()
+
+def write_yaml_file(data, directory=OUTBOX_FOLDER, archive=True, writer=None):
+    """
+    Publishes the alert as a YAML file in the outbox, atomically, and hard-links it into the archive.
+
+    Without a writer, one is opened for this file and the call returns once the file is durable.
+    With one (e.g. the load generator's), the file is queued and published with the writer's next
+    group commit (see common/code/alert_writer.py).
+    """
+    if writer is None:
+        writer = AlertWriter(directory, archive_folder=ARCHIVE_FOLDER if archive else None)
+        try:
+            filename = writer.write(data)
+        finally:
+            writer.close()
+    else:
+        filename = writer.write(data, wait=False)
+    file_path = Path(writer.folder) / filename
     logging.info(f"YAML alert written to outbox: {file_path}")
+    if writer.archive_folder is not None:
+        logging.info(f"Archived link written to {Path(writer.archive_folder) / filename}")
+    return file_path
+
+# --- Load generator ---
+# Synthesizes alerts at a target rate to reproduce storm-day load.
+
+LOAD_HOSTS = ['Fictional.wx', 'local_flood_monitoring_district', 'Test']
+LOAD_TAG_POOL = ['COWx', 'Rain', 'RainData', 'FlashFlood', 'Hail', '30Day', 'MHFD', 'EarlyWarningSystems', 'Testing']
+LOAD_MESSAGES = [
+    'Red Rocks Park 30-day rain total: 0.71 inches',
+    'Heavy rain: 1.2 inches in the last hour at site {site_id}',
+    'Flash flood warning for the creek below gauge {site_id}. Move to higher ground.',
+    'Lluvia intensa en el cañón — 2.3 pulgadas en una hora ☔',
+    '大雨警報: 観測点 {site_id} で1時間に45ミリの降雨',
+    'Rain gauge {site_id} 🌧️🌧️ 0.5" in 15 minutes',
+]
+
+def make_load_sites(count, rng):
+    """Returns `count` synthetic sites with stable host, IDs and coordinates."""
+    sites = []
+    for i in range(count):
+        site_id = 2000 + i
+        sites.append({
+            'site_uuid': i + 1,
+            'host': rng.choice(LOAD_HOSTS),
+            'host_site_id': site_id,
+            'host_sensor_id': site_id + 50,
+            'site_lat': round(rng.uniform(39.0, 40.5), 5),
+            'site_long': round(rng.uniform(-105.5, -104.5), 5),
+        })
+    return sites
 
-    if archive:
-        os.makedirs(ARCHIVE_FOLDER, exist_ok=True)
-        archived_path = ARCHIVE_FOLDER / filename
-        shutil.copy2(file_path, archived_path)
-        logging.info(f"Archived copy written to {archived_path}")
+def synthesize_message(seq, run_id, sites, rng):
+    """Builds one synthetic alert; about one in ten is long enough to need truncation."""
+    site = rng.choice(sites)
+    text = rng.choice(LOAD_MESSAGES).format(site_id=site['host_site_id'])
+    if rng.random() < 0.1:
+        text = ' '.join([text] * rng.randint(6, 12))
+    message_data = {
+        'message': f"{text} [load {seq}]",
+        'created_by': f"create_message load generator {run_id}",
+        'created_at': datetime.now(timezone.utc),
+        'trigger_type': 'file',
+        'target_channels': 'bluesky',
+        'tags': rng.sample(LOAD_TAG_POOL, rng.randint(0, 4)),
+        'load_run': run_id,
+        'load_seq': seq,
+    }
+    message_data.update(site)
+    return message_data
+
+def run_load(rate, duration, write_file=True, write_db=False, site_count=50, seed=None):
+    """
+    Writes synthetic alerts at `rate` per second for `duration` seconds.
+
+    Every send is logged as a JSON line (run, seq, file, queued_at) under LOAD_LOG_FOLDER, so
+    downstream latency can be computed against the time each alert was handed over. Files are
+    queued on the writer and published with its next group commit; the run ends by waiting for
+    the last commit, and raises if any file was not published.
+    """
+    rng = random.Random(seed)
+    run_id = uuid.uuid4().hex[:8]
+    sites = make_load_sites(site_count, rng)
+    os.makedirs(LOAD_LOG_FOLDER, exist_ok=True)
+    log_path = LOAD_LOG_FOLDER / f"{get_timestamp_slug()}_{run_id}.jsonl"
+    logging.info(f"Load run {run_id}: {rate}/s for {duration}s, logging sends to {log_path}")
+
+    # One writer for the whole run: files are published in group commits instead of one fsync each.
+    writer = AlertWriter(OUTBOX_FOLDER, tag=run_id) if write_file else None
+    # One loop and pool for the whole run, so inserts reuse pooled connections.
+    loop = asyncio.new_event_loop() if write_db else None
+    database = AlertDatabase() if write_db else None
+    if write_db:
+        loop.run_until_complete(database.open())
+    sent = 0
+    start = time.perf_counter()
+    try:
+        with open(log_path, 'w') as log:
+            while True:
+                due = start + sent / rate
+                if due - start >= duration:
+                    break
+                delay = due - time.perf_counter()
+                if delay > 0:
+                    time.sleep(delay)
+
+                message_data = synthesize_message(sent, run_id, sites, rng)
+                filename = None
+                if write_db:
+                    loop.run_until_complete(insert_message(database, message_data))
+                if write_file:
+                    filename = write_yaml_file(message_data, writer=writer).name
+
+                log.write(json.dumps({
+                    'run': run_id,
+                    'seq': sent,
+                    'file': filename,
+                    'host': message_data['host'],
+                    'host_site_id': message_data['host_site_id'],
+                    'created_at': message_data['created_at'].isoformat(),
+                    'queued_at': datetime.now(timezone.utc).isoformat(),
+                    'lag': round(time.perf_counter() - due, 6),
+                }) + '\n')
+                sent += 1
+        if writer is not None:
+            writer.flush()
+    finally:
+        if writer is not None:
+            writer.close()
+        if write_db:
+            loop.run_until_complete(database.close())
+            loop.close()
+
+    elapsed = time.perf_counter() - start
+    logging.info(f"Load run {run_id} done: {sent} alerts in {elapsed:.1f}s ({sent / elapsed:.1f}/s)")
 
 def main(write_file=False, write_db=False):
     try:
@@ -113,9 +236,8 @@ def main(write_file=False, write_db=False):
             return
 
         if write_db:
-            with psycopg.connect(**DB_CONFIG) as conn:
-                insert_message(conn, message_data)
-                logging.info("Message written to database.")
+            asyncio.run(insert_one_message(message_data))
+            logging.info("Message written to database.")
 
         if write_file:
             write_yaml_file(message_data)
@@ -131,8 +253,18 @@ if __name__ == '__main__':
     parser = argparse.ArgumentParser(description="Create and dispatch an alert message.")
     parser.add_argument('-file', action='store_true', help='Write message to a YAML file in outbox')
     parser.add_argument('-db', action='store_true', help='Insert message into the database')
+    parser.add_argument('-load', type=float, metavar='RATE', help='Generate synthetic alerts at RATE per second')
+    parser.add_argument('-duration', type=float, default=60, help='Load generator run time in seconds (default 60)')
+    parser.add_argument('-sites', type=int, default=50, help='Number of synthetic sites for the load generator')
+    parser.add_argument('-seed', type=int, help='Random seed for a reproducible load run')
     args = parser.parse_args()
 
+    if args.load:
+        run_load(args.load, args.duration,
+                 write_file=args.file or not args.db, write_db=args.db,
+                 site_count=args.sites, seed=args.seed)
+        raise SystemExit(0)
+
     # If neither is specified, default to writing to file only
     if not args.file and not args.db:
         main(write_file=True, write_db=False)
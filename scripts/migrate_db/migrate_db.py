@@ -0,0 +1,162 @@
+import re
+import sys
+import argparse
+import logging
+from datetime import date
+from pathlib import Path
+from dotenv import load_dotenv
+import psycopg
+from psycopg import sql
+
+# Load environment variables: this folder's .env.local, then create_message's (same POSTGRES_* names).
+script_dir = Path(__file__).parent
+load_dotenv(dotenv_path=script_dir / '.env.local')
+load_dotenv(dotenv_path=script_dir.parent / 'create_message' / '.env.local')
+
+sys.path.append(str(script_dir.parent.parent / 'common' / 'code'))
+from db_pool import db_config_from_env
+
+# Logging setup
+logging.basicConfig(
+    level=logging.INFO,
+    format='%(asctime)s - %(levelname)s - %(message)s',
+)
+
+MIGRATIONS_FOLDER = script_dir / 'migrations'
+
+# Migration files are NNNN_name.sql and are applied in version order.
+MIGRATION_FILE = re.compile(r'^(\d{4})_(\w+)\.sql$')
+
+# Monthly partitions are named message_yYYYYmMM (see message_partition_name() in 0004).
+PARTITION_NAME = re.compile(r'^message_y(\d{4})m(\d{2})$')
+
+def load_migrations(folder=MIGRATIONS_FOLDER):
+    """Returns [(version, name, path)] sorted by version."""
+    migrations = []
+    for path in folder.iterdir():
+        match = MIGRATION_FILE.match(path.name)
+        if match:
+            migrations.append((match.group(1), match.group(2), path))
+    migrations.sort()
+    return migrations
+
+def ensure_migrations_table(conn):
+    conn.execute("""
+        CREATE TABLE IF NOT EXISTS schema_migrations (
+            version text PRIMARY KEY,
+            name text NOT NULL,
+            applied_at timestamptz NOT NULL DEFAULT now()
+        )
+    """)
+
+def applied_versions(conn):
+    return {row[0] for row in conn.execute("SELECT version FROM schema_migrations")}
+
+def migrate(conn, target=None, dry_run=False):
+    """Applies pending migrations (up to `target`, if given), each in its own transaction."""
+    ensure_migrations_table(conn)
+    applied = applied_versions(conn)
+    pending = [m for m in load_migrations() if m[0] not in applied and (target is None or m[0] <= target)]
+    if not pending:
+        logging.info("Schema is up to date.")
+        return
+
+    for version, name, path in pending:
+        if dry_run:
+            logging.info(f"Would apply {path.name}")
+            continue
+        logging.info(f"Applying {path.name}")
+        with conn.transaction():
+            conn.execute(path.read_text())
+            conn.execute("INSERT INTO schema_migrations (version, name) VALUES (%s, %s)", (version, name))
+
+def status(conn):
+    ensure_migrations_table(conn)
+    applied = {row[0]: row[1] for row in conn.execute("SELECT version, applied_at FROM schema_migrations")}
+    for version, name, _ in load_migrations():
+        state = f"applied {applied[version]:%Y-%m-%d %H:%M:%S}" if version in applied else "pending"
+        print(f"{version} {name}: {state}")
+
+def list_partitions(conn):
+    """Returns [(first day of month, partition name)] for the monthly partitions of message, oldest first."""
+    rows = conn.execute("""
+        SELECT c.relname
+        FROM pg_inherits i JOIN pg_class c ON c.oid = i.inhrelid
+        WHERE i.inhparent = 'message'::regclass
+    """).fetchall()
+    partitions = []
+    for (name,) in rows:
+        match = PARTITION_NAME.match(name)
+        if match:
+            partitions.append((date(int(match.group(1)), int(match.group(2)), 1), name))
+    partitions.sort()
+    return partitions
+
+def ensure_partitions(conn, months_ahead):
+    """Creates the partitions for this month and the next `months_ahead` months."""
+    with conn.transaction():
+        names = [row[0] for row in conn.execute("SELECT message_ensure_partitions(%s)", (months_ahead,))]
+    logging.info(f"Partitions present: {', '.join(names)}")
+
+def retention(conn, keep_months, drop=False, dry_run=False):
+    """
+    Detaches (and optionally drops) the monthly partitions older than `keep_months` months.
+
+    A partition that still holds unsent rows is kept, with a warning.
+    """
+    today = date.today()
+    month_index = today.year * 12 + today.month - 1 - keep_months
+    cutoff = date(month_index // 12, month_index % 12 + 1, 1)
+
+    for month, name in list_partitions(conn):
+        if month >= cutoff:
+            break
+        unsent = conn.execute(
+            sql.SQL("SELECT count(*) FROM {} WHERE status IN ('pending', 'sending')").format(sql.Identifier(name))
+        ).fetchone()[0]
+        if unsent:
+            logging.warning(f"Keeping {name}: {unsent} unsent rows.")
+            continue
+        if dry_run:
+            logging.info(f"Would {'drop' if drop else 'detach'} {name}")
+            continue
+        with conn.transaction():
+            conn.execute(sql.SQL("ALTER TABLE message DETACH PARTITION {}").format(sql.Identifier(name)))
+            if drop:
+                conn.execute(sql.SQL("DROP TABLE {}").format(sql.Identifier(name)))
+        logging.info(f"{'Dropped' if drop else 'Detached'} {name}")
+
+def main():
+    parser = argparse.ArgumentParser(description="Versioned migrations and partition maintenance for the message table.")
+    subparsers = parser.add_subparsers(dest='command', required=True)
+
+    migrate_parser = subparsers.add_parser('migrate', help='Apply pending migrations')
+    migrate_parser.add_argument('--target', help='Stop after this version (e.g. 0003)')
+    migrate_parser.add_argument('--dry-run', action='store_true', help='List the migrations that would be applied')
+
+    subparsers.add_parser('status', help='List migrations and whether they are applied')
+
+    partitions_parser = subparsers.add_parser('partitions', help='Create upcoming monthly partitions')
+    partitions_parser.add_argument('--months-ahead', type=int, default=3, help='Months past the current one (default 3)')
+
+    retention_parser = subparsers.add_parser('retention', help='Detach monthly partitions past the retention period')
+    retention_parser.add_argument('--keep-months', type=int, default=24, help='Months of history kept attached (default 24)')
+    retention_parser.add_argument('--drop', action='store_true', help='Drop the detached partitions instead of keeping them as tables')
+    retention_parser.add_argument('--dry-run', action='store_true', help='List the partitions that would be detached')
+
+    args = parser.parse_args()
+
+    # Autocommit, so each conn.transaction() block is a real transaction. Migrations run once,
+    # and prepared statements would only break transaction-mode poolers.
+    with psycopg.connect(**db_config_from_env(), autocommit=True, prepare_threshold=None) as conn:
+        if args.command == 'migrate':
+            migrate(conn, args.target, args.dry_run)
+        elif args.command == 'status':
+            status(conn)
+        elif args.command == 'partitions':
+            ensure_partitions(conn, args.months_ahead)
+        elif args.command == 'retention':
+            retention(conn, args.keep_months, args.drop, args.dry_run)
+
+if __name__ == '__main__':
+    main()
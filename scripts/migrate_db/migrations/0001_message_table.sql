@@ -0,0 +1,16 @@
+-- The original message table (see README.md). A no-op on databases that already have it.
+create table if not exists message (
+  id serial primary key,
+  message text not null,
+  created_by text not null,
+  created_at timestamp not null,
+  site_uuid integer,
+  host text,
+  host_site_id integer,
+  host_sensor_id integer,
+  trigger_type text,
+  target_channels text,
+  site_lat double precision,
+  site_long double precision,
+  tags text[]
+);
@@ -0,0 +1,10 @@
+-- Delivery state per message: pending -> sending -> sent | failed.
+alter table message
+  add column if not exists status text not null default 'pending',
+  add column if not exists attempts integer not null default 0,
+  add column if not exists sent_at timestamptz,
+  add column if not exists post_uri text;
+
+alter table message drop constraint if exists message_status_check;
+alter table message
+  add constraint message_status_check check (status in ('pending', 'sending', 'sent', 'failed'));
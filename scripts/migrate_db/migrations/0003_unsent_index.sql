@@ -0,0 +1,2 @@
+-- Only unsent rows are indexed, so finding them stays cheap however many sent rows pile up.
+create index if not exists message_unsent_idx on message (id) where status in ('pending', 'sending');
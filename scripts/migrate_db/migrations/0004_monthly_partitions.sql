@@ -0,0 +1,83 @@
+-- Rebuilds message as a table range-partitioned by month on created_at.
+--
+-- Existing rows are copied into monthly partitions. The old table is kept, renamed to
+-- message_unpartitioned, until you drop it. Rows whose month has no partition yet land in
+-- message_default; message_ensure_partition() moves them out when it creates their month.
+
+alter table message rename to message_unpartitioned;
+alter table message_unpartitioned rename constraint message_pkey to message_unpartitioned_pkey;
+alter table message_unpartitioned rename constraint message_status_check to message_unpartitioned_status_check;
+alter index message_unsent_idx rename to message_unpartitioned_unsent_idx;
+
+create table message (
+  id integer not null default nextval('message_id_seq'),
+  message text not null,
+  created_by text not null,
+  created_at timestamp not null,
+  site_uuid integer,
+  host text,
+  host_site_id integer,
+  host_sensor_id integer,
+  trigger_type text,
+  target_channels text,
+  site_lat double precision,
+  site_long double precision,
+  tags text[],
+  status text not null default 'pending',
+  attempts integer not null default 0,
+  sent_at timestamptz,
+  post_uri text,
+  constraint message_status_check check (status in ('pending', 'sending', 'sent', 'failed')),
+  -- A partitioned table's primary key must include the partition key.
+  primary key (id, created_at)
+) partition by range (created_at);
+
+alter sequence message_id_seq owned by message.id;
+create table message_default partition of message default;
+create index message_unsent_idx on message (id) where status in ('pending', 'sending');
+
+create or replace function message_partition_name(month date) returns text
+language sql immutable as $$
+  select 'message_y' || to_char(month, 'YYYY') || 'm' || to_char(month, 'MM')
+$$;
+
+-- Creates the partition for the month containing `month` (if missing) and returns its name.
+create or replace function message_ensure_partition(month date) returns text
+language plpgsql as $$
+declare
+  start_at timestamp := date_trunc('month', month);
+  end_at timestamp := date_trunc('month', month) + interval '1 month';
+  name text := message_partition_name(date_trunc('month', month)::date);
+begin
+  if to_regclass(name) is not null then
+    return name;
+  end if;
+  execute format('create table %I (like message including defaults including constraints)', name);
+  -- Attaching fails while the default partition holds rows of this month, so move them first.
+  execute format(
+    'with moved as (delete from message_default where created_at >= %L and created_at < %L returning *) '
+    'insert into %I select * from moved', start_at, end_at, name);
+  execute format('alter table message attach partition %I for values from (%L) to (%L)', name, start_at, end_at);
+  return name;
+end
+$$;
+
+-- Creates partitions from the current month through `months_ahead` months ahead.
+create or replace function message_ensure_partitions(months_ahead integer) returns setof text
+language sql as $$
+  select message_ensure_partition((date_trunc('month', now()) + make_interval(months => n))::date)
+  from generate_series(0, months_ahead) as n
+$$;
+
+select message_ensure_partition(month)
+from (select distinct date_trunc('month', created_at)::date as month from message_unpartitioned) as months;
+select message_ensure_partitions(3);
+
+insert into message (
+  id, message, created_by, created_at, site_uuid, host, host_site_id, host_sensor_id,
+  trigger_type, target_channels, site_lat, site_long, tags, status, attempts, sent_at, post_uri
+)
+select
+  id, message, created_by, created_at, site_uuid, host, host_site_id, host_sensor_id,
+  trigger_type, target_channels, site_lat, site_long, tags, status, attempts, sent_at, post_uri
+from message_unpartitioned;
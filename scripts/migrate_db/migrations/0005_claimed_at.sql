@@ -0,0 +1,3 @@
+-- Records when a row was claimed, so only claims older than a lease are handed back to 'pending'.
+-- Rows already in 'sending' have no claim time and count as stale.
+alter table message add column if not exists claimed_at timestamptz;
@@ -0,0 +1,20 @@
+#!/usr/bin/env python3
+"""
+One-shot trigger: posts the given alert file(s) and exits (see common/code/trigger_once.py).
+
+Usage:
+    python3 scripts/trigger_notify.py inbox/alert_20250530T041854Z.yaml
+    python3 scripts/trigger_notify.py --dry-run alert.json
+    cat alert.yaml | python3 scripts/trigger_notify.py -
+"""
+
+import sys
+from pathlib import Path
+
+# The common/code modules are imported by name, like the other scripts do.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / "common" / "code"))
+
+from trigger_once import main
+
+if __name__ == "__main__":
+    sys.exit(main())
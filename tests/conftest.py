@@ -0,0 +1,5 @@
+import sys
+from pathlib import Path
+
+# The modules under common/code import each other by plain name, as the daemon runs them.
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent / 'common' / 'code'))
@@ -0,0 +1,26 @@
+import asyncio
+
+import pytest
+
+pytest.importorskip("aiohttp")
+pytest.importorskip("yaml")
+
+from account_router import AccountRouter
+
+def test_evict_idle_closes_connections_but_keeps_the_rate_limiter():
+    router = AccountRouter({'north': {'handle': 'north.example.com', 'password': 'secret', 'pds_url': 'http://127.0.0.1:1'}},
+                           default='north', idle_seconds=60)
+
+    async def run():
+        poster = router.poster_for({'host': 'north-1'})
+        poster.http_session()
+        poster.write_limiter.update(429, {'retry-after': '120'})
+        evicted = await router.evict_idle(now=poster.last_used + 61)
+        again = await router.evict_idle(now=poster.last_used + 122)
+        return poster, evicted, again
+
+    poster, evicted, again = asyncio.run(run())
+    assert evicted == ['north'] and again == []
+    assert poster.http is None
+    assert router.poster_for({'host': 'north-1'}) is poster
+    assert poster.write_limiter._blocked_until > poster.last_used + 100
@@ -0,0 +1,16 @@
+import pytest
+
+pytest.importorskip("yaml")
+
+from alert_model import AlertValidationError, load_alert_yaml, parse_coordinate, validate_alert
+
+def test_unquoted_sexagesimal_yaml_is_read_as_degrees_minutes_seconds():
+    alert = load_alert_yaml("message: Heavy rain\nsite_lat: 39:39:55\nsite_long: -105:12:18\nhost_site_id: 12\n")
+    assert alert['site_lat'] == '39:39:55' and alert['host_site_id'] == 12
+    record = validate_alert(alert)
+    assert (record.site_lat, record.site_long) == (39.665278, -105.205)
+
+@pytest.mark.parametrize('value, limit', [(142795, 90), (91, 90), (-181, 180), (648000, 180)])
+def test_out_of_range_integers_are_rejected(value, limit):
+    with pytest.raises(AlertValidationError):
+        parse_coordinate(value, limit)
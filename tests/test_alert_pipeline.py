@@ -0,0 +1,106 @@
+import asyncio
+
+from alert_pipeline import AlertPipeline
+
+class MemorySource:
+    """An in-memory source: key -> (alert mapping, queued_at), handed out by the first discover()."""
+    def __init__(self, alerts):
+        self.alerts = alerts
+        self.pending = list(alerts)
+        self.sent, self.failed = [], []
+        self.pipeline = None
+
+    def discover(self):
+        keys, self.pending = self.pending, []
+        return keys
+
+    def parse(self, key):
+        return self.alerts[key]
+
+    def build_message(self, alert_json):
+        return alert_json['message']
+
+    def mark_sent(self, key):
+        self.sent.append(key)
+        self._maybe_stop()
+
+    def mark_failed(self, key):
+        self.failed.append(key)
+        self._maybe_stop()
+
+    def _maybe_stop(self):
+        if len(self.sent) + len(self.failed) == len(self.alerts):
+            self.pipeline.stop()
+
+class GatedNotifier:
+    """Sends once the gate is open, recording the order of the messages."""
+    def __init__(self):
+        self.gate = asyncio.Event()
+        self.started = asyncio.Event()
+        self.sent = []
+
+    async def send_notification_async(self, message, alert_json=None, embed=None, render=True):
+        self.started.set()
+        await self.gate.wait()
+        if message == 'broken':
+            raise RuntimeError("PDS said no")
+        self.sent.append(message)
+        return {'uri': f"at://{message}"}
+
+def pipeline_for(source, notifier, **kwargs):
+    options = dict(parse_workers=1, render_workers=1, send_workers=1, poll_interval=0.01, stats_interval=0)
+    options.update(kwargs)
+    pipeline = AlertPipeline(source, notifier, **options)
+    source.pipeline = pipeline
+    return pipeline
+
+def test_send_queue_puts_urgent_alerts_first():
+    source = MemorySource({
+        'first': ({'message': 'first', 'severity': 'routine'}, 0),
+        'routine': ({'message': 'routine', 'severity': 'routine'}, 1),
+        'advisory': ({'message': 'advisory', 'severity': 'advisory'}, 2),
+        'broken': ({'message': 'broken', 'severity': 'warning'}, 3),
+        'emergency': ({'message': 'emergency', 'severity': 'emergency'}, 4),
+        # Waited long enough that its routine severity no longer puts it last.
+        'aged': ({'message': 'aged', 'severity': 'routine'}, -240),
+    })
+
+    async def run():
+        notifier = GatedNotifier()
+        pipeline = pipeline_for(source, notifier, aging_seconds=60)
+        task = asyncio.create_task(pipeline.run())
+        # 'first' holds the only send worker until everything else waits in the send queue.
+        await notifier.started.wait()
+        while pipeline.send_queue.qsize() < len(source.alerts) - 1:
+            await asyncio.sleep(0.01)
+        notifier.gate.set()
+        await asyncio.wait_for(task, 5)
+        return notifier, pipeline
+
+    notifier, pipeline = asyncio.run(run())
+    assert notifier.sent == ['first', 'aged', 'emergency', 'advisory', 'routine']
+    assert source.failed == ['broken']
+    assert pipeline.counts == {'discovered': 6, 'parsed': 6, 'sent': 5, 'failed': 1}
+    assert not pipeline.in_flight
+
+def test_full_queues_hold_back_discovery():
+    source = MemorySource({f"alert-{i:02d}": ({'message': f"alert {i}"}, i) for i in range(40)})
+
+    async def run():
+        notifier = GatedNotifier()
+        pipeline = pipeline_for(source, notifier, parse_queue_size=2, render_queue_size=2, send_queue_size=2)
+        task = asyncio.create_task(pipeline.run())
+        await notifier.started.wait()
+        await asyncio.sleep(0.2)
+        held = dict(pipeline.counts), pipeline.depths()
+        notifier.gate.set()
+        await asyncio.wait_for(task, 5)
+        return notifier, held
+
+    notifier, (counts, depths) = asyncio.run(run())
+    # Three full queues, one alert in each worker, and the one discovery is waiting to queue.
+    assert counts['discovered'] <= 2 + 2 + 2 + 3 + 1
+    assert counts['sent'] == 0
+    assert depths['parse'] == (2, 2) and depths['render'] == (2, 2) and depths['send'] == (2, 2)
+    assert len(notifier.sent) == 40
+    assert sorted(notifier.sent) == sorted(f"alert {i}" for i in range(40))
@@ -0,0 +1,44 @@
+import pytest
+
+from alert_model import validate_alert
+from alert_scheduler import SEVERITY_LEVELS, AlertScheduler, alert_priority
+
+def test_priority_from_severity_then_tags():
+    assert alert_priority({'severity': 'Emergency', 'tags': ['raindata']}) == SEVERITY_LEVELS['emergency']
+    assert alert_priority({'severity': 9}) == SEVERITY_LEVELS['routine']
+    assert alert_priority({'tags': ['raindata', '#FlashFlood']}) == SEVERITY_LEVELS['warning']
+    assert alert_priority({'tags': 'hail, raindata'}) == SEVERITY_LEVELS['watch']
+    assert alert_priority({'tags': ['hail']}, tag_rules={'hail': 'emergency'}) == SEVERITY_LEVELS['emergency']
+    assert alert_priority({'message': 'no hints'}) == SEVERITY_LEVELS['advisory']
+    assert alert_priority(validate_alert({'message': 'record', 'severity': 'warning'})) == SEVERITY_LEVELS['warning']
+    assert alert_priority(None) == SEVERITY_LEVELS['advisory']
+
+def test_urgent_alerts_overtake_until_aging_catches_up():
+    scheduler = AlertScheduler(aging_seconds=60)
+    scheduler.push('routine, long queued', SEVERITY_LEVELS['routine'], now=0)
+    scheduler.push('routine', SEVERITY_LEVELS['routine'], now=200)
+    scheduler.push('emergency', SEVERITY_LEVELS['emergency'], now=230)
+    scheduler.push('advisory', SEVERITY_LEVELS['advisory'], now=100)
+    # Deadlines: 240, 440, 230, 280.
+    assert [scheduler.pop(now=300) for _ in range(4)] == ['emergency', 'routine, long queued', 'advisory', 'routine']
+    with pytest.raises(IndexError):
+        scheduler.pop()
+
+def test_equal_deadlines_keep_arrival_order():
+    scheduler = AlertScheduler(aging_seconds=0)
+    for name in 'abc':
+        scheduler.push(name, SEVERITY_LEVELS['watch'], now=0)
+    assert [scheduler.pop(now=0) for _ in range(3)] == ['a', 'b', 'c']
+
+def test_stats_track_depth_and_wait():
+    scheduler = AlertScheduler(aging_seconds=60)
+    scheduler.push('a', SEVERITY_LEVELS['warning'], now=0)
+    scheduler.push('b', SEVERITY_LEVELS['warning'], now=10)
+    scheduler.push('c', SEVERITY_LEVELS['routine'], now=10)
+    scheduler.pop(now=30)
+    scheduler.pop(now=40)
+    stats = scheduler.stats()
+    assert stats['warning'] == {'depth': 0, 'popped': 2, 'mean_wait': 30.0, 'max_wait': 30.0}
+    assert stats['routine']['depth'] == 1
+    assert scheduler.depths()['routine'] == 1
+    assert len(scheduler) == 1
@@ -0,0 +1,79 @@
+import os
+import threading
+
+import pytest
+
+yaml = pytest.importorskip("yaml")
+
+import alert_writer
+from alert_writer import AlertWriter, AlertWriteError
+
+def alert(i):
+    return {'message': f"Heavy rain {i}", 'site_key': 'gross-dam'}
+
+def published(folder):
+    return sorted(name for name in os.listdir(folder) if name.startswith('alert_'))
+
+def test_write_many_publishes_in_order(tmp_path):
+    writer = AlertWriter(tmp_path, tag='test')
+    names = writer.write_many([alert(i) for i in range(5)])
+    writer.close()
+    assert published(tmp_path) == names == sorted(names)
+    assert all('_test_' in name for name in names)
+    assert [yaml.safe_load((tmp_path / name).read_text())['message'] for name in names] == [f"Heavy rain {i}" for i in range(5)]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
+
+def test_writes_queued_during_a_commit_share_the_next_one(tmp_path, monkeypatch):
+    writer = AlertWriter(tmp_path)
+    commit = writer._commit
+    started, release = threading.Event(), threading.Event()
+
+    def slow_commit(batch):
+        started.set()
+        release.wait(5)
+        return commit(batch)
+
+    monkeypatch.setattr(writer, '_commit', slow_commit)
+    writer.write(alert(0), wait=False)
+    assert started.wait(5)
+    for i in range(1, 51):
+        writer.write(alert(i), wait=False)
+    release.set()
+    writer.flush()
+    writer.close()
+    assert len(published(tmp_path)) == 51
+    assert writer.commits == 2
+
+def test_groups_are_split_at_max_batch(tmp_path):
+    writer = AlertWriter(tmp_path, max_batch=10)
+    writer.write_many([alert(i) for i in range(50)])
+    writer.close()
+    assert len(published(tmp_path)) == 50
+    assert writer.commits >= 5
+
+def test_archive_is_a_hard_link(tmp_path):
+    archive = tmp_path / 'archive'
+    writer = AlertWriter(tmp_path / 'inbox', archive_folder=archive)
+    name = writer.write(alert(0))
+    writer.close()
+    inbox_stat, archive_stat = os.stat(tmp_path / 'inbox' / name), os.stat(archive / name)
+    assert inbox_stat.st_ino == archive_stat.st_ino
+    assert inbox_stat.st_nlink == 2
+
+def test_unpublished_file_is_reported(tmp_path, monkeypatch):
+    writer = AlertWriter(tmp_path)
+    rename = os.rename
+
+    def failing_rename(source, destination):
+        if destination.endswith('-000002.yaml'):
+            raise PermissionError(13, 'Permission denied')
+        return rename(source, destination)
+
+    monkeypatch.setattr(alert_writer.os, 'rename', failing_rename)
+    with pytest.raises(AlertWriteError) as error:
+        writer.write_many([alert(i) for i in range(3)])
+    writer.close()
+    names = error.value.names
+    assert list(error.value.failed) == [names[1]]
+    assert published(tmp_path) == [names[0], names[2]]
+    assert not [name for name in os.listdir(tmp_path) if name.endswith('.tmp')]
@@ -0,0 +1,73 @@
+import pytest
+
+from bluesky_facets import FacetedText, parse_mentions, parse_tags, parse_urls
+
+ALERT = {
+    'message': 'Heavy rain at Boulder Creek, see https://example.com/rain (cc @alice.bsky.social)',
+    'created_at': '2025-05-30T04:18:54Z',
+    'host': 'Test',
+    'host_site_id': 100,
+    'host_sensor_id': 100,
+    'tags': ['raindata', 'boulder', 'rain-data'],
+}
+
+def parsed(text):
+    return (parse_mentions(text), parse_urls(text), parse_tags(text))
+
+def test_build_message_spans_match_parse():
+    from notification import BlueskyNotification
+
+    message = BlueskyNotification.build_message(ALERT)
+    assert isinstance(message, FacetedText)
+    assert message.spans == parsed(str(message))
+
+def test_file_alert_message_keeps_spans(tmp_path):
+    pytest.importorskip("yaml")
+    pytest.importorskip("dotenv")
+    from trigger_notify import BlueskyNotification, FileAlert
+
+    class TempFileAlert(FileAlert):
+        ALERT_FOLDER = str(tmp_path / 'inbox')
+        FAILED_FOLDER = str(tmp_path / 'inbox' / 'failed')
+        SENT_FOLDER = str(tmp_path / 'inbox' / 'sent')
+
+    source = TempFileAlert()
+    source.notification_system = BlueskyNotification
+    message = source.build_message(ALERT)
+    assert message.spans is not None
+    assert message.spans == parsed(str(message))
+
+def test_append_without_leading_space_drops_spans():
+    text = FacetedText('see #rain')
+    text.spans = parsed(str(text))
+    assert (text + ' and #more').spans == parsed('see #rain and #more')
+    assert getattr(text + 'fall', 'spans', None) is None
+
+def baseline_text(alert):
+    """The post text as build_message wrote it before it emitted spans."""
+    from alert_model import validate_alert
+
+    record = validate_alert(alert)
+    formatted_time = record.created_at.strftime('%Y-%m-%d %H:%M:%S')
+    tags_string = ' '.join(['#' + tag for tag in record.tags])
+    message = (f"{record.message}\n\nGenerated by: {record.host} at {formatted_time} UTC\n"
+               f"(Site ID: {record.host_site_id}, Sensor ID: {record.host_sensor_id})\n{tags_string}").strip()
+    if len(message) <= 300:
+        return message
+    message = f"{record.message}\n\nGenerated by: {record.host} at {formatted_time}\n{tags_string}".strip()
+    if len(message) <= 300:
+        return message
+    remaining_length = 300 - (len(f"\n\nGenerated by: {record.host} at {formatted_time}\n{tags_string}") + 3)
+    content = record.message[:max(0, remaining_length)] + "..."
+    return f"{content}\n\nGenerated by: {record.host} at {formatted_time}\n{tags_string}".strip()
+
+@pytest.mark.parametrize('words', [0, 24, 60])
+def test_build_message_matches_baseline_text_and_facets(words):
+    from bluesky_message import build_message
+
+    # 0 words: the full variant; 24: without the IDs; 60: the message cut with "...".
+    alert = dict(ALERT, message=ALERT['message'] + ' rain' * words + ' @bob.example.com #late')
+    expected = baseline_text(alert)
+    message = build_message(alert)
+    assert str(message) == expected
+    assert message.spans == parsed(expected)
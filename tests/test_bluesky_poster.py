@@ -0,0 +1,89 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("aiohttp")
+from aiohttp import web
+
+from bluesky_poster import BlueskyPoster
+
+MESSAGES = [("Heavy rain at Gross Dam", None, "3lbcaaaaaaaa2"), ("Creek rising", None, "3lbcaaaaaaaa3"), "No record key"]
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+def logged_in_poster(pds_url):
+    poster = BlueskyPoster(pds_url, 'alerts.example.com', 'secret')
+    poster.session, poster.access_jwt, poster.did = {}, 'token', 'did:plc:alerts'
+    poster.max_retries = 0
+    # Unpaced, so the test doesn't wait out the write budget.
+    poster.write_limiter.rate = poster.write_limiter.max_rate
+    return poster
+
+def post_batch(apply_status, apply_body):
+    """Posts MESSAGES against a fake PDS whose applyWrites answers as given; returns (results, calls, poster)."""
+    calls = []
+
+    async def apply_writes(request):
+        calls.append('applyWrites')
+        return web.json_response(apply_body, status=apply_status)
+
+    async def write_record(request):
+        body = await request.json()
+        calls.append(request.path.rsplit('.', 1)[-1])
+        return web.json_response({'uri': f"at://did:plc:alerts/app.bsky.feed.post/{body.get('rkey', 'new')}", 'cid': 'cid'})
+
+    async def run():
+        app = web.Application()
+        app.router.add_post('/xrpc/com.atproto.repo.applyWrites', apply_writes)
+        app.router.add_post('/xrpc/com.atproto.repo.putRecord', write_record)
+        app.router.add_post('/xrpc/com.atproto.repo.createRecord', write_record)
+        runner = web.AppRunner(app)
+        await runner.setup()
+        port = free_port()
+        await web.TCPSite(runner, '127.0.0.1', port).start()
+        poster = logged_in_poster(f"http://127.0.0.1:{port}")
+        try:
+            return await poster.create_posts({'pds_url': poster.pds_url}, MESSAGES), poster
+        finally:
+            await poster.close()
+            await runner.cleanup()
+
+    results, poster = asyncio.run(run())
+    return results, calls, poster
+
+def test_rejected_batch_is_posted_one_by_one():
+    results, calls, _ = post_batch(400, {'error': 'InvalidRequest', 'message': 'Record already exists'})
+    assert calls == ['applyWrites', 'putRecord', 'putRecord', 'createRecord']
+    assert [result['ok'] for result in results] == [True, True, True]
+    assert results[0]['uri'].endswith('/3lbcaaaaaaaa2')
+
+@pytest.mark.parametrize('status, body', [
+    (503, {'error': 'ServiceUnavailable'}),
+    (429, {'error': 'RateLimitExceeded'}),
+    (400, {'error': 'ExpiredToken', 'message': 'Token has expired'}),
+])
+def test_throttled_or_session_errors_fail_the_batch(status, body):
+    results, calls, poster = post_batch(status, body)
+    assert calls == ['applyWrites']
+    assert [result['ok'] for result in results] == [False, False, False]
+    assert all(f"returned {status}" in result['error'] for result in results)
+    if status != 400:
+        assert poster.write_limiter.rate < poster.write_limiter.max_rate
+
+def test_unreachable_pds_fails_the_batch_and_backs_off():
+    poster = logged_in_poster(f"http://127.0.0.1:{free_port()}")
+    rate = poster.write_limiter.rate
+
+    async def run():
+        try:
+            return await poster.create_posts({'pds_url': poster.pds_url}, MESSAGES)
+        finally:
+            await poster.close()
+
+    results = asyncio.run(run())
+    assert [result['ok'] for result in results] == [False, False, False]
+    assert poster.write_limiter.rate < rate
@@ -0,0 +1,22 @@
+from pathlib import Path
+
+import pytest
+
+pytest.importorskip("yaml")
+
+from alert_model import AlertValidationError, load_alert_yaml
+from db_pool import MESSAGE_COLUMNS, message_row
+
+NEW_MESSAGE = Path(__file__).resolve().parent.parent / 'scripts' / 'create_message' / 'new_message.yaml'
+
+def test_new_message_row_has_decimal_coordinates():
+    with open(NEW_MESSAGE) as f:
+        row = message_row(load_alert_yaml(f))
+    assert tuple(row) == MESSAGE_COLUMNS
+    assert (row['site_lat'], row['site_long']) == (39.665278, -105.205)
+    assert row['message'] == 'Test message' and row['host_site_id'] == 1000
+    assert row['tags'] == ['tag1', 'tag2', 'tag3', 'tag4']
+
+def test_unreadable_coordinates_are_not_inserted():
+    with pytest.raises(AlertValidationError):
+        message_row({'message': 'x', 'site_lat': 142795})
@@ -0,0 +1,61 @@
+import asyncio
+import socket
+
+import pytest
+
+pytest.importorskip("aiosmtplib")
+controller_module = pytest.importorskip("aiosmtpd.controller")
+
+from smtp_pool import SMTPPool
+
+ALERT = {
+    'message': 'Heavy rain at Gross Dam: 1.2 inches in the last hour.',
+    'created_at': '2025-05-30T04:18:54Z',
+    'host': 'north-1',
+    'severity': 'warning',
+    'tags': ['raindata'],
+}
+
+class Recorder:
+    """aiosmtpd handler that keeps every envelope it is handed."""
+    def __init__(self):
+        self.envelopes = []
+
+    async def handle_DATA(self, server, session, envelope):
+        self.envelopes.append((envelope.mail_from, list(envelope.rcpt_tos), envelope.content))
+        return '250 OK'
+
+@pytest.fixture
+def smtp_server():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        port = probe.getsockname()[1]
+    recorder = Recorder()
+    controller = controller_module.Controller(recorder, hostname='127.0.0.1', port=port)
+    controller.start()
+    try:
+        yield '127.0.0.1', port, recorder
+    finally:
+        controller.stop()
+
+def test_pipeline_send_reaches_every_subscriber(smtp_server):
+    from trigger_notify import EMailNotification
+
+    host, port, recorder = smtp_server
+    subscribers = [f"user{i}@example.com" for i in range(120)]
+    pool = SMTPPool(host, port, security='none', size=3, max_recipients=50)
+    notifier = EMailNotification(subscribers=subscribers, sender='alerts@example.com', pool=pool)
+
+    async def send():
+        try:
+            # The pipeline's call shape: embed and render are passed and ignored.
+            return await notifier.send_notification_async(notifier.build_message(ALERT), ALERT, embed=None, render=False)
+        finally:
+            await notifier.close_async()
+
+    result = asyncio.run(send())
+    assert result['accepted'] == 120 and not result['refused'] and not result['failed']
+    assert sorted(len(rcpts) for _, rcpts, _ in recorder.envelopes) == [20, 50, 50]
+    assert {rcpt for _, rcpts, _ in recorder.envelopes for rcpt in rcpts} == set(subscribers)
+    assert b'Subject: [WARNING] Heavy rain at Gross Dam' in recorder.envelopes[0][2]
+    assert pool.opened <= 3
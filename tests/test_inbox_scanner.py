@@ -0,0 +1,75 @@
+import os
+
+import pytest
+
+import inbox_scanner
+from inbox_scanner import InboxScanner
+
+EMPTY = 'alert_20250101T000000Z_a.yaml'
+LATER = 'alert_20250101T000001Z_b.yaml'
+
+def write(folder, name, text=''):
+    with open(folder / name, 'w') as f:
+        f.write(text)
+
+def test_forgotten_empty_file_is_handed_out_once_written(tmp_path):
+    write(tmp_path, EMPTY)
+    scanner = InboxScanner(str(tmp_path), settle=0)
+    assert scanner.scan() == [EMPTY]
+    assert scanner.scan() == []
+    scanner.forget(EMPTY)
+    write(tmp_path, EMPTY, 'message: Heavy rain\n')
+    assert scanner.scan() == [EMPTY]
+
+def test_forget_during_scan_is_not_lost(tmp_path, monkeypatch):
+    write(tmp_path, EMPTY)
+    scanner = InboxScanner(str(tmp_path), settle=0)
+    assert scanner.scan() == [EMPTY]
+    write(tmp_path, LATER)
+
+    # Walk EMPTY before LATER, and forget EMPTY (as a parse worker would) while the walk is on LATER.
+    scandir = os.scandir
+
+    class Ordered:
+        def __init__(self, path):
+            self.entries = sorted(scandir(path), key=lambda entry: entry.name)
+        def __enter__(self):
+            return iter(self.entries)
+        def __exit__(self, *exc):
+            return False
+
+    order_key = InboxScanner._order_key
+
+    def forgetting_order_key(entry):
+        if entry.name == LATER:
+            scanner.forget(EMPTY)
+        return order_key(entry)
+
+    monkeypatch.setattr(inbox_scanner.os, 'scandir', Ordered)
+    monkeypatch.setattr(scanner, '_order_key', forgetting_order_key)
+    assert scanner.scan() == [LATER]
+    monkeypatch.undo()
+
+    write(tmp_path, EMPTY, 'message: Heavy rain\n')
+    assert scanner.scan() == [EMPTY]
+
+def test_file_alert_rereads_an_empty_file_once_written(tmp_path):
+    pytest.importorskip("yaml")
+    pytest.importorskip("dotenv")
+    from trigger_notify import FileAlert
+
+    class TempFileAlert(FileAlert):
+        ALERT_FOLDER = str(tmp_path / 'inbox')
+        FAILED_FOLDER = str(tmp_path / 'inbox' / 'failed')
+        SENT_FOLDER = str(tmp_path / 'inbox' / 'sent')
+
+    source = TempFileAlert()
+    source.scanner.settle = 0
+    inbox = tmp_path / 'inbox'
+    write(inbox, EMPTY)
+    assert source.discover() == [EMPTY]
+    assert source.parse(EMPTY) is None
+    write(inbox, EMPTY, 'message: Heavy rain at Gross Dam\n')
+    assert source.discover() == [EMPTY]
+    alert, _ = source.parse(EMPTY)
+    assert alert.message == 'Heavy rain at Gross Dam'
@@ -0,0 +1,40 @@
+import pytest
+
+pytest.importorskip("yaml")
+pytest.importorskip("dotenv")
+
+from latency_audit import LatencyAudit, load_records, STAGES
+
+class RecordingNotification:
+    def __init__(self):
+        self.sent = []
+
+    def build_message(self, alert_json):
+        return alert_json.message
+
+    def send_notification(self, message, alert_json=None):
+        self.sent.append(message)
+
+def test_single_loop_records_latency(tmp_path):
+    from trigger_notify import FileAlert
+
+    class TempFileAlert(FileAlert):
+        ALERT_FOLDER = str(tmp_path / 'inbox')
+        FAILED_FOLDER = str(tmp_path / 'inbox' / 'failed')
+        SENT_FOLDER = str(tmp_path / 'inbox' / 'sent')
+
+    source = TempFileAlert()
+    source.notification_system = RecordingNotification()
+    source.audit = LatencyAudit(str(tmp_path / 'audit'))
+    (tmp_path / 'inbox' / 'alert_20250101T000000Z_a.yaml').write_text(
+        'message: Heavy rain at Gross Dam\nsite_key: gross-dam\n')
+    source.check_for_alerts()
+    source.audit.close()
+
+    assert source.notification_system.sent
+    [record] = load_records([str(tmp_path / 'audit')])
+    assert record['key'] == 'alert_20250101T000000Z_a.yaml'
+    assert record['site'] == 'gross-dam'
+    assert record['ok'] is True
+    assert all(record[stage] is not None for stage in STAGES)
+    assert [record[stage] for stage in STAGES] == sorted(record[stage] for stage in STAGES)
@@ -0,0 +1,109 @@
+import asyncio
+import socket
+
+import pytest
+
+aiohttp = pytest.importorskip("aiohttp")
+pytest.importorskip("yaml")
+
+from alert_writer import AlertWriteError
+from push_ingest import PushIngest
+
+def free_port():
+    with socket.socket() as probe:
+        probe.bind(('127.0.0.1', 0))
+        return probe.getsockname()[1]
+
+class ListSource:
+    def __init__(self, fail_names=()):
+        self.enqueued = []
+        self.fail_names = fail_names
+
+    def enqueue(self, alerts):
+        names = [alert['message'] for alert in alerts]
+        failed = {name: OSError("disk full") for name in names if name in self.fail_names}
+        self.enqueued.extend(alert for alert in alerts if alert['message'] not in failed)
+        if failed:
+            raise AlertWriteError(names, failed)
+
+class WakeCounter:
+    """Stands in for the pipeline: counts wake() calls and reports fixed depths."""
+    def __init__(self):
+        self.wakes = 0
+        self.counts = {'sent': 0}
+
+    def wake(self):
+        self.wakes += 1
+
+    def depths(self):
+        return {'parse': (0, 64), 'in_flight': 0}
+
+def push(ingest, requests, unix=False):
+    """Starts the ingest, sends (content_type, body) requests, and returns [(status, json)]."""
+    async def run():
+        await ingest.start()
+        connector = aiohttp.UnixConnector(path=ingest.socket_path) if unix else None
+        base = 'http://localhost' if unix else f"http://{ingest.host}:{ingest.port}"
+        answers = []
+        try:
+            async with aiohttp.ClientSession(connector=connector) as session:
+                for content_type, body in requests:
+                    if content_type is None:
+                        async with session.get(f"{base}/health") as response:
+                            answers.append((response.status, await response.json()))
+                        continue
+                    async with session.post(f"{base}/alerts", data=body, headers={'Content-Type': content_type}) as response:
+                        answers.append((response.status, await response.json()))
+        finally:
+            await ingest.stop()
+        return answers
+
+    return asyncio.run(run())
+
+def test_valid_alerts_are_enqueued_and_invalid_ones_reported():
+    source, pipeline = ListSource(), WakeCounter()
+    ingest = PushIngest(source, pipeline, port=free_port())
+    [(status, body), (health_status, health)] = push(ingest, [
+        ('application/json', '[{"message": "Heavy rain"}, {"host": "no message"}, {"alerts": []}]'),
+        (None, None),
+    ])
+    assert status == 202
+    assert body['accepted'] == 1
+    assert [result['ok'] for result in body['results']] == [True, False, False]
+    assert [alert['message'] for alert in source.enqueued] == ['Heavy rain']
+    assert pipeline.wakes == 1
+    assert health_status == 200
+    assert health['ingest'] == {'accepted': 1, 'rejected': 2}
+    assert health['pipeline']['parse'] == [0, 64]
+
+def test_unix_socket_accepts_yaml(tmp_path):
+    source = ListSource()
+    ingest = PushIngest(source, socket_path=str(tmp_path / 'alerts.sock'))
+    [(status, body)] = push(ingest, [('application/yaml', 'message: Creek rising\nsite_lat: 39.5\n')], unix=True)
+    assert status == 202
+    assert source.enqueued == [{'message': 'Creek rising', 'site_lat': 39.5}]
+    assert not (tmp_path / 'alerts.sock').exists()
+
+def test_bad_bodies_are_refused():
+    ingest = PushIngest(ListSource(), port=free_port(), max_batch=2)
+    answers = push(ingest, [
+        ('application/json', '{"message": '),
+        ('application/json', '[]'),
+        ('application/json', '[{"message": "a"}, {"message": "b"}, {"message": "c"}]'),
+        ('application/json', '[{"host": "no message"}]'),
+    ])
+    assert [status for status, _ in answers] == [400, 400, 413, 422]
+
+def test_partly_written_batch_reports_the_unwritten_alerts():
+    source = ListSource(fail_names=('b',))
+    ingest = PushIngest(source, port=free_port())
+    [(status, body)] = push(ingest, [('application/json', '{"alerts": [{"message": "a"}, {"message": "b"}]}')])
+    assert status == 202
+    assert body['accepted'] == 1
+    assert [result['ok'] for result in body['results']] == [True, False]
+
+def test_only_loopback_addresses():
+    with pytest.raises(ValueError):
+        PushIngest(ListSource(), host='0.0.0.0', port=8080)
+    with pytest.raises(ValueError):
+        PushIngest(ListSource())
@@ -0,0 +1,58 @@
+import random
+
+import pytest
+
+from rain_accumulator import AMOUNT_SCALE, RainAccumulator, SiteAccumulator
+from rain_report import RAIN_WINDOWS, WINDOW_SECONDS
+
+START = 1_700_000_000
+RESOLUTION = 300
+
+def brute_force_sums(samples, head):
+    """Window sums in integer units, re-summed from every counted sample."""
+    sums = []
+    for window in RAIN_WINDOWS:
+        count = WINDOW_SECONDS[window] // RESOLUTION
+        sums.append(sum(units for bucket, units in samples if head - count < bucket <= head))
+    return sums
+
+def test_window_sums_match_a_full_resum():
+    rng = random.Random(7)
+    site = SiteAccumulator(RESOLUTION)
+    counted = []
+    t = START
+    for i in range(3000):
+        # Mostly forward in time, with some late samples and long dry gaps.
+        t += rng.choice([60, 300, 900, 3600, 6 * 3600])
+        when = t - rng.choice([0, 0, 0, 600, 86400])
+        amount = rng.choice([0.01, 0.02, 0.05])
+        if site.add(when, amount, sample_id=i):
+            counted.append((int(when // RESOLUTION), int(round(amount * AMOUNT_SCALE))))
+        if i % 250 == 0:
+            assert site.sums == brute_force_sums(counted, site.head)
+    assert site.sums == brute_force_sums(counted, site.head)
+
+def test_repeated_samples_are_counted_once():
+    accumulator = RainAccumulator(RESOLUTION)
+    assert accumulator.add_sample('gross-dam', START, 0.01, sample_id='a')
+    assert not accumulator.add_sample('gross-dam', START + 5, 0.01, sample_id='a')
+    assert accumulator.add_sample('gross-dam', START + 5, 0.01)
+    assert not accumulator.add_sample('gross-dam', START + 5, 0.01)
+    # Same time, different amount: a different sample.
+    assert accumulator.add_sample('gross-dam', START + 5, 0.02)
+    assert accumulator.report('gross-dam')['rain']['m15'] == pytest.approx(0.04)
+
+def test_samples_older_than_the_longest_window_are_dropped():
+    accumulator = RainAccumulator(RESOLUTION)
+    accumulator.add_sample('gross-dam', START + 31 * 86400, 0.01)
+    assert not accumulator.add_sample('gross-dam', START, 0.5)
+    assert accumulator.report('gross-dam')['rain']['d30'] == pytest.approx(0.01)
+
+def test_report_decays_a_silent_site():
+    accumulator = RainAccumulator(RESOLUTION)
+    accumulator.add_sample('gross-dam', START, 0.25)
+    rain = accumulator.report('gross-dam', now=START + 2 * 3600)['rain']
+    assert rain['h1'] == 0
+    assert rain['h3'] == pytest.approx(0.25)
+    assert accumulator.report('gross-dam', now=START + 31 * 86400)['rain']['d30'] == 0
+    assert accumulator.report('unknown') is None
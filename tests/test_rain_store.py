@@ -0,0 +1,89 @@
+import json
+import os
+from pathlib import Path
+
+import pytest
+
+np = pytest.importorskip("numpy")
+
+from rain_store import RainStore
+
+DAY = 86400
+START = 1_700_000_000
+
+def segment_files(root, site='gross-dam', window='h1'):
+    return sorted(os.listdir(os.path.join(root, site, window)))
+
+def test_active_segment_rolls_over_by_time(tmp_path):
+    store = RainStore(str(tmp_path), segment_seconds=DAY)
+    for hour in range(0, 72, 6):
+        store.append('gross-dam', 'h1', START + hour * 3600, hour)
+    assert segment_files(tmp_path) == ['00000001.seg', '00000002.seg', '00000003.seg']
+    assert len(store.read('gross-dam', 'h1')) == 12
+    store.close()
+
+def test_retention_drops_rolled_over_history(tmp_path):
+    store = RainStore(str(tmp_path), segment_seconds=DAY)
+    for hour in range(0, 24 * 10, 6):
+        store.append('gross-dam', 'h1', START + hour * 3600, 1.0)
+    dropped = store.compact('gross-dam', 'h1', retain_after=START + 8 * DAY)
+    assert dropped == 32
+    assert store.read('gross-dam', 'h1')['t'][0] == START + 8 * DAY
+    store.append('gross-dam', 'h1', START + 10 * DAY, 2.0)
+    assert store.read('gross-dam', 'h1')['t'][-1] == START + 10 * DAY
+    store.close()
+
+def test_retention_empties_a_silent_site(tmp_path):
+    store = RainStore(str(tmp_path))
+    for hour in range(3):
+        store.append('gross-dam', 'h1', START + hour * 3600, 1.0)
+    assert store.compact('gross-dam', 'h1', retain_after=START + DAY) == 3
+    assert len(store.read('gross-dam', 'h1')) == 0
+    store.append('gross-dam', 'h1', START + 2 * DAY, 2.0)
+    assert store.read('gross-dam', 'h1')['v'].tolist() == [2.0]
+    store.close()
+
+def test_closed_segment_maps_are_bounded(tmp_path):
+    store = RainStore(str(tmp_path), segment_records=2, max_open_maps=3)
+    for i in range(20):
+        store.append('gross-dam', 'h1', START + i, i)
+    assert store.read('gross-dam', 'h1')['v'].tolist() == list(range(20))
+    assert len(store._closed_maps) == 3
+    store.close()
+
+def test_backfill_reads_a_store(tmp_path, monkeypatch):
+    monkeypatch.syspath_prepend(str(Path(__file__).parent.parent / 'scripts' / 'backfill'))
+    pytest.importorskip("yaml")
+    from backfill import read_chunks
+
+    store = RainStore(str(tmp_path))
+    for site in ('gross-dam', 'red-rocks'):
+        for i in range(5):
+            store.append_report({'site_key': site, 'created_at': START + i * 300, 'rain': {'h1': i / 10}})
+    store.close()
+
+    chunks = list(read_chunks(str(tmp_path), chunk_rows=3))
+    assert [len(sites) for sites, _, _ in chunks] == [3, 2, 3, 2]
+    sites, times, values = chunks[0]
+    assert sites.tolist() == ['gross-dam'] * 3
+    assert times.tolist() == [START, START + 300, START + 600]
+    assert values[:, 2].tolist() == pytest.approx([0.0, 0.1, 0.2])
+
+def test_ingest_raises_hysteresis_alerts(tmp_path, monkeypatch, capsys):
+    yaml = pytest.importorskip("yaml")
+    import rain_store
+
+    reports = tmp_path / 'reports.jsonl'
+    reports.write_text(''.join(json.dumps({'site_key': 'gross-dam', 'created_at': START + i * 300, 'rain': {'h1': h1}}) + '\n'
+                               for i, h1 in enumerate([0.1, 0.6, 0.4, 0.6, 0.2])))
+    inbox = tmp_path / 'inbox'
+    monkeypatch.setattr('sys.argv', ['rain_store.py', '--root', str(tmp_path / 'store'), 'ingest', str(reports),
+                                     '--alerts', str(inbox), '--state', str(tmp_path / 'state.jsonl')])
+    rain_store.main()
+
+    assert 'Ingested 5 reports. Raised 1 alerts.' in capsys.readouterr().out
+    [name] = [name for name in os.listdir(inbox) if name.startswith('alert_')]
+    alert = yaml.safe_load((inbox / name).read_text())
+    assert alert['site_key'] == 'gross-dam'
+    assert alert['severity'] == 'advisory'
+    assert len(RainStore(str(tmp_path / 'store')).read('gross-dam', 'h1')) == 5
@@ -0,0 +1,69 @@
+import time
+from email.utils import formatdate
+
+import pytest
+
+import rate_limiter
+from rate_limiter import RateLimiter, retry_after_seconds
+
+@pytest.fixture
+def sleeps(monkeypatch):
+    """Records the waits acquire() asks for instead of sleeping."""
+    waits = []
+
+    async def sleep(seconds):
+        waits.append(seconds)
+
+    monkeypatch.setattr(rate_limiter.asyncio, 'sleep', sleep)
+    return waits
+
+def acquire(limiter, cost=1):
+    # The fake sleep never suspends, so the coroutine finishes on its first step.
+    with pytest.raises(StopIteration):
+        limiter.acquire(cost).send(None)
+
+def test_requests_are_spaced_by_cost(sleeps):
+    limiter = RateLimiter('writes', rate=2.0)
+    for cost in (1, 1, 3, 1):
+        acquire(limiter, cost)
+    assert sleeps == pytest.approx([0.5, 1.0, 2.5], abs=0.05)
+
+def test_budget_headers_set_the_rate():
+    limiter = RateLimiter('writes', rate=5.0, safety=0.9)
+    held = limiter.update(200, {'RateLimit-Remaining': '90', 'RateLimit-Reset': str(time.time() + 100)})
+    assert held == 0
+    assert limiter.rate == pytest.approx(0.81, rel=0.02)
+
+def test_exhausted_budget_blocks_until_the_reset(sleeps):
+    limiter = RateLimiter('writes', rate=5.0)
+    limiter.update(200, {'ratelimit-remaining': '0', 'ratelimit-reset': str(time.time() + 30)})
+    acquire(limiter)
+    assert sleeps == pytest.approx([30], abs=0.5)
+
+def test_retry_after_holds_requests_and_cuts_the_rate(sleeps):
+    limiter = RateLimiter('writes', rate=4.0)
+    assert limiter.update(429, {'Retry-After': '12'}) == 12
+    assert limiter.rate == 2.0
+    acquire(limiter)
+    assert sleeps == pytest.approx([12], abs=0.1)
+
+def test_backoff_doubles_without_retry_after_and_resets_on_success():
+    limiter = RateLimiter('writes', rate=1.0, min_rate=0.2, max_backoff=5)
+    assert [limiter.update(503) for _ in range(5)] == [1, 2, 4, 5, 5]
+    assert limiter.rate == 0.2
+    limiter.update(200)
+    assert limiter.update(429) == 1
+
+def test_successes_without_headers_raise_the_rate_up_to_the_cap():
+    limiter = RateLimiter('writes', rate=1.0, max_rate=1.25, increase=0.1)
+    limiter.update(200)
+    assert limiter.rate == pytest.approx(1.1)
+    for _ in range(5):
+        limiter.update(201)
+    assert limiter.rate == 1.25
+
+def test_retry_after_http_date():
+    now = time.time()
+    assert retry_after_seconds(formatdate(now + 60, usegmt=True), now) == pytest.approx(60, abs=1)
+    assert retry_after_seconds(formatdate(now - 60, usegmt=True), now) == 0
+    assert retry_after_seconds('soon') is None
@@ -0,0 +1,76 @@
+import json
+
+import pytest
+
+pytest.importorskip("yaml")
+pytest.importorskip("dotenv")
+
+from trigger_notify import StreamAlert
+
+def stream_alert_class(tmp_path):
+    class TempStreamAlert(StreamAlert):
+        ALERT_FOLDER = str(tmp_path / 'inbox')
+        FAILED_FOLDER = str(tmp_path / 'inbox' / 'failed')
+        SENT_FOLDER = str(tmp_path / 'inbox' / 'sent')
+    return TempStreamAlert
+
+def append(path, *messages):
+    with open(path, 'a') as f:
+        for message in messages:
+            f.write(json.dumps({'message': message}) + '\n')
+
+def test_checkpoint_only_passes_finished_lines(tmp_path):
+    cls = stream_alert_class(tmp_path)
+    path = tmp_path / 'alerts.jsonl'
+    append(path, 'first', 'second', 'third')
+
+    source = cls(str(path))
+    keys = source.discover()
+    assert len(keys) == 3
+    created = {key: source.parse(key)[0].created_at for key in keys}
+    # The second line is done, but the first isn't, so the checkpoint can't move yet.
+    source.mark_sent(keys[1])
+    source.close()
+    assert json.loads((tmp_path / 'alerts.jsonl.offset').read_text())['offset'] == 0
+
+    resumed = cls(str(path))
+    again = resumed.discover()
+    assert len(again) == 3
+    # A re-read line gets the time it was first read, so its fingerprint doesn't change.
+    assert [resumed.parse(key)[0].created_at for key in again] == list(created.values())
+    resumed.mark_failed(again[0])
+    resumed.mark_sent(again[1])
+    resumed.close()
+
+    offset = json.loads((tmp_path / 'alerts.jsonl.offset').read_text())['offset']
+    lines = path.read_bytes().splitlines(keepends=True)
+    assert offset == len(lines[0]) + len(lines[1])
+    assert json.loads((tmp_path / 'inbox' / 'failed' / 'alerts.jsonl.failed.jsonl').read_text())['message'] == 'first'
+
+    last = cls(str(path))
+    [key] = last.discover()
+    assert last.parse(key)[0].message == 'third'
+    last.close()
+
+def test_partial_line_waits_until_complete(tmp_path):
+    path = tmp_path / 'alerts.jsonl'
+    path.write_text('{"message": "half')
+    source = stream_alert_class(tmp_path)(str(path))
+    assert source.discover() == []
+    with open(path, 'a') as f:
+        f.write(' written"}\n')
+    [key] = source.discover()
+    assert source.parse(key)[0].message == 'half written'
+    source.close()
+
+def test_truncated_stream_is_read_from_the_start(tmp_path):
+    path = tmp_path / 'alerts.jsonl'
+    append(path, 'old one', 'old two')
+    source = stream_alert_class(tmp_path)(str(path))
+    for key in source.discover():
+        source.mark_sent(key)
+    path.write_text('')
+    append(path, 'new')
+    [key] = source.discover()
+    assert source.parse(key)[0].message == 'new'
+    source.close()